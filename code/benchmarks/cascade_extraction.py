@@ -0,0 +1,74 @@
+# Benchmark comparing the single-pass `FrameExtractor._extract_faces_cascade` with the previous two-pass
+# implementation (scan the whole video, then seek back to every frame with a face).
+#
+# Usage, from the `code` directory:
+#   python3 -m benchmarks.cascade_extraction --video /path/to/clip.mp4
+
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+from utils.frame_extractor import FrameExtractor
+
+FACE_DETECTION_MODEL_FILEPATH = "/home/pi/models-cache/face-cascade/haarcascade_frontalface_default.xml"
+
+
+def extract_faces_two_pass(to: Path, src: Path, model_path: str, scale: float, frame_step: int):
+    """Function reproducing the two-pass extraction: `find_frames_with_faces`, then one seek per frame with a face"""
+    cap = FrameExtractor.get_video(fp=src)
+    frame_with_face_idx = FrameExtractor.find_frames_with_faces(cap=cap, model_path=model_path, frame_step=frame_step)
+
+    cap = FrameExtractor.get_video(fp=src)
+    for i, frame_info in enumerate(frame_with_face_idx):
+        (x, y, w, h) = frame_info.get("face")
+
+        im = FrameExtractor.get_one_frame(cap=cap, frame_no=frame_info.get("idx"))
+        im = FrameExtractor._crop_face(im=im, x=x, y=y, w=w, h=h, scale=scale)
+        im.save(to.joinpath(f"{src.stem}_{i}.png"))
+
+    FrameExtractor._close_video(cap=cap)
+
+
+def extract_faces_one_pass(to: Path, src: Path, model_path: str, scale: float, frame_step: int):
+    FrameExtractor._extract_faces_cascade(to=to, src=src, model_path=model_path, scale=scale, frame_step=frame_step)
+
+
+def benchmark(fn, n_frames: int, repeat: int, **kwargs) -> dict:
+    timings = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as to:
+            start = time.perf_counter()
+            fn(to=Path(to), **kwargs)
+            timings.append(time.perf_counter() - start)
+
+            n_faces = len(list(Path(to).glob("*.png")))
+
+    best = min(timings)
+
+    return dict(seconds=round(best, 3), frames_per_second=round(n_frames / best, 2), n_faces=n_faces)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", type=str, required=True, help="Filepath to the sample video")
+    parser.add_argument(
+        "--model-path", type=str, default=FACE_DETECTION_MODEL_FILEPATH, help="Filepath to the haar cascade `.xml`"
+    )
+    parser.add_argument("--frame-step", type=int, default=5, help="Look for faces in one frame out of `frame-step`")
+    parser.add_argument("--scale", type=float, default=1.2, help="Scaling factor of the crop around each face")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each implementation, the best is kept")
+
+    args = parser.parse_args()
+
+    src = Path(args.video)
+    cap = FrameExtractor.get_video(fp=src)
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    FrameExtractor._close_video(cap=cap)
+
+    kwargs = dict(src=src, model_path=args.model_path, scale=args.scale, frame_step=args.frame_step)
+
+    for name, fn in [("two-pass", extract_faces_two_pass), ("one-pass", extract_faces_one_pass)]:
+        print(f"{name}: {benchmark(fn, n_frames=n_frames, repeat=args.repeat, **kwargs)}")
@@ -0,0 +1,108 @@
+# Verification of a CPU inference configuration of the ResNet (see `ModelRegistry.configure_cpu_inference`) against
+# the float32 model, on a held-out set of faces organized like the training set: one directory per person.
+#
+# Reports the cosine similarity between the float32 and the optimized embeddings of each face, the agreement of the
+# face recognition model's predictions on both, and the latency of both.
+#
+# Usage, from the `code` directory:
+#   python3 -m benchmarks.cpu_inference --input-path ../data/test --model-filepath ../models/model.v1.pklz \
+#       --quantization static --calibration-path ../data/train --channels-last --n-threads 4
+#
+# Static quantization requires torch >= 1.13: with the torch 1.6 wheel of the Raspberry Pi, use
+# `--quantization dynamic`.
+
+import json
+import time
+
+import numpy as np
+from utils import inference
+from utils.feature_extractor import FeatureExtractor
+from utils.model import load_model
+from utils.model_registry import ModelRegistry
+
+
+def measure_latency(X: np.array, batch_size: int, repeat: int) -> float:
+    """Function returning the median latency, in milliseconds, of `get_embeddings` on a batch of `batch_size` faces"""
+    batch = X[:batch_size]
+    FeatureExtractor.get_embeddings(arr=batch, pre_process=True, batch_size=batch_size, verbose=False)  # Warm up
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        FeatureExtractor.get_embeddings(arr=batch, pre_process=True, batch_size=batch_size, verbose=False)
+        timings.append(time.perf_counter() - start)
+
+    return float(np.median(timings) * 1000)
+
+
+def evaluate(X: np.array, batch_sizes: list, repeat: int) -> dict:
+    embeddings = FeatureExtractor.get_embeddings(arr=X, pre_process=True, batch_size=16, verbose=False)
+    latency_ms = {batch_size: measure_latency(X, batch_size=batch_size, repeat=repeat) for batch_size in batch_sizes}
+
+    return dict(embeddings=embeddings, latency_ms=latency_ms)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-path", type=str, required=True, help="Held-out faces, classified by person")
+    parser.add_argument("--model-filepath", type=str, default=None, help="Face recognition model to check agreement")
+    parser.add_argument("--quantization", type=str, default=None, choices=["dynamic", "static"], help="int8 mode")
+    parser.add_argument("--calibration-path", type=str, default=None, help="[static] Faces, classified by person")
+    parser.add_argument("--n-calibration", type=int, default=64, help="[static] Number of calibration faces")
+    parser.add_argument("--channels-last", action="store_true", help="Use the channels-last memory format")
+    parser.add_argument("--n-threads", type=int, default=None, help="Number of intra-op threads, for both models")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16], help="Batch sizes of the latency")
+    parser.add_argument("--repeat", type=int, default=20, help="Number of runs of each latency measure")
+    parser.add_argument("--output", type=str, default=None, help="Filepath where to save the results as JSON")
+
+    args = parser.parse_args()
+
+    if (args.quantization == "static") and not inference.supports_static_quantization():
+        parser.error("--quantization static requires torch >= 1.13, use --quantization dynamic instead")
+
+    inference.set_n_threads(n_threads=args.n_threads)
+    X, y = FeatureExtractor.load_faces(args.input_path)
+
+    reference = evaluate(X, batch_sizes=args.batch_sizes, repeat=args.repeat)
+
+    calibration = None
+    if args.quantization == "static":
+        assert args.calibration_path is not None, "Static quantization requires `--calibration-path`."
+        X_calibration, _ = FeatureExtractor.load_faces(args.calibration_path, n_images=args.n_calibration)
+        calibration = FeatureExtractor.to_tensor(X_calibration, pre_process=True)
+
+    ModelRegistry.configure_cpu_inference(
+        quantization=args.quantization,
+        channels_last=args.channels_last,
+        n_threads=args.n_threads,
+        calibration=calibration,
+    )
+    optimized = evaluate(X, batch_sizes=args.batch_sizes, repeat=args.repeat)
+
+    a, b = reference["embeddings"], optimized["embeddings"]
+    cosine = np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+    results = dict(
+        n_images=len(y),
+        configuration=dict(ModelRegistry.cpu_inference(), n_threads=args.n_threads),
+        cosine=dict(mean=float(cosine.mean()), min=float(cosine.min()), p01=float(np.percentile(cosine, 1))),
+        latency_ms=dict(float32=reference["latency_ms"], optimized=optimized["latency_ms"]),
+    )
+
+    if args.model_filepath is not None:
+        classifier = load_model(args.model_filepath)
+        y_reference, y_optimized = classifier.predict(a), classifier.predict(b)
+
+        results["classifier"] = dict(
+            agreement=float(np.mean(y_reference == y_optimized)),
+            accuracy_float32=float(np.mean(y_reference == np.array(y))),
+            accuracy_optimized=float(np.mean(y_optimized == np.array(y))),
+        )
+
+    print(json.dumps(results, indent=2))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
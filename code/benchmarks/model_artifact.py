@@ -0,0 +1,120 @@
+# Benchmark comparing the cold-start of a face recognition model saved in the previous format (gzip-compressed joblib,
+# fully decompressed on load) and in the current one (uncompressed joblib with a metadata header, memory-mapped on
+# load for an `EmbeddingGallery`, read for the `NuSVC` pipeline whose libsvm arrays must be writable).
+#
+# Each load runs in a fresh interpreter, which reports its load time and its resident memory (RSS) after loading the
+# model and predicting one embedding. Files may still be in the page cache from the previous run: drop it between runs
+# (`sync && echo 3 | sudo tee /proc/sys/vm/drop_caches`) to measure a cold disk.
+#
+# Usage, from the `code` directory:
+#   python3 -m benchmarks.model_artifact --model-filepath ../models/model.v1.pklz
+#   python3 -m benchmarks.model_artifact --n-samples 20000  # Synthetic `NuSVC` and gallery instead
+
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn import svm
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import Normalizer
+from utils.gallery import EmbeddingGallery
+from utils.model import load_model, serialize_model
+
+_EMBEDDING_SIZE = 512
+
+# Run in a fresh interpreter: `sys.argv[1]` is the model filepath, `sys.argv[2]` is "old" or "new"
+_LOAD_SCRIPT = """
+import json, sys, time
+
+import joblib
+import numpy as np
+from utils.model import load_model
+
+# Both formats pay the same imports: only the deserialization is timed
+start = time.perf_counter()
+if sys.argv[2] == "old":
+    model = joblib.load(sys.argv[1]).get("model")
+else:
+    model = load_model(sys.argv[1])
+load_seconds = time.perf_counter() - start
+
+model.predict(np.zeros((1, 512), dtype=np.float32))
+
+with open("/proc/self/status") as f:
+    rss_kb = int(next(line for line in f if line.startswith("VmRSS")).split()[1])
+
+print(json.dumps(dict(load_seconds=load_seconds, rss_mb=rss_kb / 1024)))
+"""
+
+
+def make_models(n_samples: int, n_classes: int = 5, seed: int = 0) -> dict:
+    """Function returning a `NuSVC` pipeline and an `EmbeddingGallery` fitted on random embeddings"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_samples, _EMBEDDING_SIZE)).astype(np.float32)
+    y = rng.integers(0, n_classes, size=n_samples).astype(str)
+
+    pipe = make_pipeline(Normalizer(norm="l2"), svm.NuSVC(nu=0.3, kernel="linear"))
+
+    return dict(svm=pipe.fit(X, y), gallery=EmbeddingGallery().fit(X, y))
+
+
+def measure(path: Path, fmt: str, repeat: int) -> dict:
+    """Function returning the best load time and RSS of `repeat` fresh interpreters loading the model at `path`"""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _LOAD_SCRIPT, str(path), fmt],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parents[1],
+        )
+        runs.append(json.loads(out.stdout))
+
+    return dict(
+        size_mb=round(path.stat().st_size / 1024 ** 2, 3),
+        load_seconds=round(min(r["load_seconds"] for r in runs), 4),
+        rss_mb=round(min(r["rss_mb"] for r in runs), 1),
+    )
+
+
+def benchmark(model, to: Path, repeat: int) -> dict:
+    old_path = to.joinpath("model.old.pklz")
+    joblib.dump(dict(model=model, metadata=dict()), str(old_path), compress=("gzip", 3))
+
+    new_path = serialize_model(
+        model=model, parameters=dict(), performance=dict(), dataset_path="", output_path=to.joinpath("model.new.pklz")
+    )
+
+    return dict(old=measure(old_path, fmt="old", repeat=repeat), new=measure(new_path, fmt="new", repeat=repeat))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-filepath", type=str, default=None, help="Model to benchmark, by default synthetic")
+    parser.add_argument("--n-samples", type=int, default=5000, help="Number of embeddings of the synthetic models")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of loads of each format, the best is kept")
+    parser.add_argument("--output", type=str, default=None, help="Filepath where to save the results as JSON")
+
+    args = parser.parse_args()
+
+    if args.model_filepath is not None:
+        models = dict(model=load_model(args.model_filepath, mmap=False))
+    else:
+        models = make_models(n_samples=args.n_samples)
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as to:
+        for name, model in models.items():
+            results[name] = benchmark(model, to=Path(to), repeat=args.repeat)
+            print(f"{name}: {results[name]}")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
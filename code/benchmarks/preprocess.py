@@ -0,0 +1,131 @@
+# Microbenchmark of the per-frame preprocessing of the live loop: PIL round trips (`FrameExtractor.preprocess_im`)
+# against the array-native `FrameExtractor.preprocess_arr`, on synthetic frames.
+#
+# For each resolution, times:
+#   - cascade_input: the grayscale frame seen by the haar cascade, for every frame read from the camera
+#   - mtcnn_input: the brightened RGB frame seen by MTCNN, once faces were detected
+# and checks that both paths return the same pixels. The brightness lookup table is also checked against
+# `ImageEnhance.Brightness` for every pixel value, over a range of brightness factors.
+#
+# Usage, from the `code` directory:
+#   python3 -m benchmarks.preprocess --resolutions 640x480 1280x720 --repeat 200
+
+import json
+
+import cv2
+import numpy as np
+from benchmarks.stages import synthetic_frame, time_it
+from PIL import Image, ImageEnhance
+from utils.frame_extractor import FrameExtractor
+
+
+def cascade_input_pil(frame: np.array) -> np.array:
+    im = FrameExtractor.preprocess_im(im=Image.fromarray(frame), rotation=180, height_offset=0, brightness_factor=None)
+
+    return cv2.cvtColor(np.array(im), cv2.COLOR_BGR2GRAY)
+
+
+def cascade_input_arr(frame: np.array) -> np.array:
+    return FrameExtractor.preprocess_arr(
+        arr=frame, rotation=180, height_offset=0, brightness_factor=None, conversion=cv2.COLOR_BGR2GRAY
+    )
+
+
+def mtcnn_input_pil(frame: np.array, brightness_factor: float) -> Image.Image:
+    im = FrameExtractor.preprocess_im(im=Image.fromarray(frame), rotation=180, height_offset=0, brightness_factor=None)
+    im = Image.fromarray(cv2.cvtColor(np.array(im), cv2.COLOR_BGR2RGB))
+
+    return FrameExtractor.preprocess_im(im=im, height_offset=0, rotation=0, brightness_factor=brightness_factor)
+
+
+def mtcnn_input_arr(frame: np.array, brightness_factor: float) -> Image.Image:
+    im = FrameExtractor.preprocess_arr(arr=frame, rotation=180, height_offset=0, brightness_factor=None)
+
+    return FrameExtractor._mtcnn_input(im=im, brightness_factor=brightness_factor)
+
+
+def check_brightness_lut(brightness_factors: list) -> list:
+    gradient = Image.fromarray(np.arange(256, dtype=np.uint8).reshape(16, 16))
+    results = []
+
+    for brightness_factor in brightness_factors:
+        pil = np.asarray(ImageEnhance.Brightness(gradient).enhance(brightness_factor), dtype=int).ravel()
+        arr = FrameExtractor.brightness_lut(brightness_factor).astype(int)
+        max_abs_diff = int(np.abs(pil - arr).max())
+
+        results.append(dict(stage="brightness_lut", brightness_factor=brightness_factor, max_abs_diff=max_abs_diff))
+
+    worst = max(results, key=lambda r: r["max_abs_diff"])
+    print(
+        f"{'brightness_lut':<15} {len(brightness_factors)} factors in [{min(brightness_factors)}, "
+        f"{max(brightness_factors)}]   max diff {worst['max_abs_diff']} (factor {worst['brightness_factor']})"
+    )
+
+    return results
+
+
+def run(resolutions: list, repeat: int, brightness_factor: float = 2.5, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for width, height in resolutions:
+        frame = synthetic_frame(width, height, rng)
+
+        for name, pil, arr in [
+            ("cascade_input", cascade_input_pil, cascade_input_arr),
+            (
+                "mtcnn_input",
+                lambda f: mtcnn_input_pil(f, brightness_factor=brightness_factor),
+                lambda f: mtcnn_input_arr(f, brightness_factor=brightness_factor),
+            ),
+        ]:
+            max_abs_diff = int(np.abs(np.asarray(pil(frame), dtype=int) - np.asarray(arr(frame), dtype=int)).max())
+            timing_pil = time_it(lambda: pil(frame), repeat=repeat)
+            timing_arr = time_it(lambda: arr(frame), repeat=repeat)
+
+            results.append(
+                dict(
+                    stage=name,
+                    width=width,
+                    height=height,
+                    pil_ms=timing_pil["median_ms"],
+                    arr_ms=timing_arr["median_ms"],
+                    speedup=round(timing_pil["median_ms"] / timing_arr["median_ms"], 2),
+                    max_abs_diff=max_abs_diff,
+                )
+            )
+            print(
+                f"{name:<15} {width}x{height:<6} PIL {timing_pil['median_ms']:8.3f} ms   "
+                f"array {timing_arr['median_ms']:8.3f} ms   x{results[-1]['speedup']:<6} max diff {max_abs_diff}"
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--resolutions", type=str, nargs="+", default=["320x240", "640x480", "1280x720"], help="Frame sizes, WxH"
+    )
+    parser.add_argument("--repeat", type=int, default=100, help="Number of runs of each measure")
+    parser.add_argument("--brightness-factor", type=float, default=2.5, help="Brightness factor of the MTCNN input")
+    parser.add_argument(
+        "--brightness-factors",
+        type=float,
+        nargs="+",
+        default=[round(0.1 * i, 1) for i in range(1, 31)],
+        help="Brightness factors for which to check the lookup table against PIL",
+    )
+    parser.add_argument("--output", type=str, default=None, help="Filepath where to save the results as JSON")
+
+    args = parser.parse_args()
+
+    resolutions = [tuple(int(v) for v in r.lower().split("x")) for r in args.resolutions]
+    results = run(resolutions=resolutions, repeat=args.repeat, brightness_factor=args.brightness_factor)
+    results += check_brightness_lut(brightness_factors=args.brightness_factors)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,332 @@
+# Benchmark of every stage of the face extraction and face recognition pipelines, without a camera, a Spotify account
+# or a downloaded VGGFace2 checkpoint.
+#
+# Frames, videos and datasets of faces are synthetic. If the pretrained InceptionResnetV1 cannot be loaded, a randomly
+# initialized one is used: timings are the same, only the embeddings are meaningless. MTCNN's weights are shipped with
+# `facenet_pytorch` and are always available.
+#
+# Results are written as JSON; pass the JSON of a previous run to `--compare` to print the ratio of each timing.
+#
+# Usage, from the `code` directory:
+#   python3 -m benchmarks.stages --output bench.json
+#   python3 -m benchmarks.stages --stages get_embeddings predict --batch-sizes 1 8 --compare bench.json
+
+import json
+import logging
+import platform
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+import torch
+from benchmarks.model_artifact import make_models
+from PIL import Image
+from utils.feature_extractor import FeatureExtractor
+from utils.frame_extractor import FrameExtractor
+from utils.model import compute_distance
+from utils.model_registry import ModelRegistry
+from utils.motion import MotionGate
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+STAGES = [
+    "preprocess_im",
+    "motion_gate",
+    "detect_multi_scale",
+    "get_face_mtcnn",
+    "get_embeddings",
+    "predict",
+    "prepare_data",
+    "compute_distance",
+    "extract_faces",
+]
+
+_FACE_SIZE = 160
+_EMBEDDING_SIZE = 512
+
+
+def synthetic_frame(width: int, height: int, rng: np.random.Generator) -> np.array:
+    """Function returning a BGR frame of noise with a bright, roughly face-shaped ellipse with two eyes and a mouth"""
+    frame = rng.integers(0, 80, size=(height, width, 3), dtype=np.uint8)
+
+    cx, cy = int(rng.integers(width // 4, 3 * width // 4)), int(rng.integers(height // 4, 3 * height // 4))
+    r = max(8, min(width, height) // 8)
+
+    cv2.ellipse(frame, (cx, cy), (r, int(r * 1.3)), 0, 0, 360, (150, 180, 220), -1)
+    for dx in [-r // 3, r // 3]:
+        cv2.circle(frame, (cx + dx, cy - r // 4), max(2, r // 8), (40, 40, 40), -1)
+    cv2.ellipse(frame, (cx, cy + r // 2), (r // 3, max(2, r // 10)), 0, 0, 360, (60, 60, 140), -1)
+
+    return frame
+
+
+def synthetic_video(path: Path, width: int, height: int, n_frames: int, fps: float = 25.0, seed: int = 0) -> Path:
+    """Function writing a video of `n_frames` synthetic frames at `path`"""
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+
+    for _ in range(n_frames):
+        writer.write(synthetic_frame(width, height, rng))
+
+    writer.release()
+
+    return path
+
+
+def synthetic_dataset(path: Path, n_classes: int, n_images: int, seed: int = 0) -> Path:
+    """Function writing `n_images` synthetic faces per class, organized like the training set: a directory per class"""
+    rng = np.random.default_rng(seed)
+
+    for i in range(n_classes):
+        class_path = path.joinpath(f"person-{i}")
+        class_path.mkdir(parents=True, exist_ok=True)
+
+        for j in range(n_images):
+            im = Image.fromarray(synthetic_frame(_FACE_SIZE, _FACE_SIZE, rng)[:, :, ::-1])
+            im.save(class_path.joinpath(f"{j}.png"))
+
+    return path
+
+
+def time_it(fn: Callable[[], object], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Function returning the median, min and max duration of `fn`, in milliseconds, over `repeat` runs"""
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return dict(
+        median_ms=round(float(np.median(timings)), 4),
+        min_ms=round(float(np.min(timings)), 4),
+        max_ms=round(float(np.max(timings)), 4),
+    )
+
+
+def load_resnet(pretrained: bool) -> Tuple[torch.nn.Module, bool]:
+    """Function returning the InceptionResnetV1, randomly initialized if the pretrained one cannot be loaded"""
+    if pretrained:
+        try:
+            return ModelRegistry.get_resnet(), True
+        except Exception as e:
+            logger.warning(f"Using a randomly initialized InceptionResnetV1: could not load the pretrained one ({e}).")
+
+    return ModelRegistry.get_resnet(pretrained=None), False
+
+
+class StageBenchmark:
+    def __init__(
+        self,
+        resolutions: List[Tuple[int, int]],
+        batch_sizes: List[int],
+        repeat: int,
+        cascade_path: str,
+        pretrained: bool = True,
+        seed: int = 0,
+    ):
+        """
+        Timings of each stage of the pipelines, on synthetic data
+
+        Parameters
+        ----------
+        resolutions : List[Tuple[int, int]]
+            (width, height) of the frames of the frame-level stages
+        batch_sizes : List[int]
+            Batch sizes of the stages working on batches of faces or embeddings
+        repeat : int
+            Number of timed runs of each measure, after one warm-up run
+        cascade_path : str
+            Filepath to the haar cascade `.xml`
+        pretrained : bool, optional
+            Whether to try loading the pretrained InceptionResnetV1, by default True
+        seed : int, optional
+            Seed of the synthetic data, by default 0
+        """
+        self.resolutions = resolutions
+        self.batch_sizes = batch_sizes
+        self.repeat = repeat
+        self.cascade_path = cascade_path
+        self.rng = np.random.default_rng(seed)
+
+        self.resnet, self.pretrained = load_resnet(pretrained=pretrained)
+        self.results = []
+
+    def _record(self, stage: str, params: dict, timing: Dict[str, float]):
+        self.results.append(dict(stage=stage, params=params, **timing))
+        print(f"{stage:<20} {json.dumps(params):<45} {timing['median_ms']:10.3f} ms")
+
+    def preprocess_im(self):
+        for width, height in self.resolutions:
+            im = Image.fromarray(synthetic_frame(width, height, self.rng))
+
+            timing = time_it(
+                lambda: FrameExtractor.preprocess_im(im=im, height_offset=0, rotation=180, brightness_factor=2.5),
+                repeat=self.repeat,
+            )
+            self._record("preprocess_im", dict(width=width, height=height), timing)
+
+    def motion_gate(self):
+        for width, height in self.resolutions:
+            frame = synthetic_frame(width, height, self.rng)
+            gate = MotionGate()
+
+            timing = time_it(lambda: gate.check(frame=frame), self.repeat)
+            self._record("motion_gate", dict(width=width, height=height), timing)
+
+    def detect_multi_scale(self):
+        face_cascade = ModelRegistry.get_face_cascade(model_path=self.cascade_path)
+
+        for width, height in self.resolutions:
+            gray = cv2.cvtColor(synthetic_frame(width, height, self.rng), cv2.COLOR_BGR2GRAY)
+
+            timing = time_it(lambda: face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4), self.repeat)
+            self._record("detect_multi_scale", dict(width=width, height=height), timing)
+
+    def get_face_mtcnn(self):
+        for width, height in self.resolutions:
+            im = Image.fromarray(synthetic_frame(width, height, self.rng))
+
+            timing = time_it(lambda: FrameExtractor.get_face_mtcnn(im=im, brightness_factor=2.5), self.repeat)
+            self._record("get_face_mtcnn", dict(width=width, height=height), timing)
+
+    def get_embeddings(self):
+        for batch_size in self.batch_sizes:
+            faces = self.rng.integers(0, 255, size=(batch_size, _FACE_SIZE, _FACE_SIZE, 3)).astype(np.float32)
+
+            timing = time_it(
+                lambda: FeatureExtractor.get_embeddings(
+                    arr=faces, batch_size=batch_size, pre_process=True, model=self.resnet, verbose=False
+                ),
+                repeat=self.repeat,
+            )
+            self._record("get_embeddings", dict(batch_size=batch_size), timing)
+
+    def predict(self):
+        for name, model in make_models(n_samples=1000).items():
+            for batch_size in self.batch_sizes:
+                X = self.rng.normal(size=(batch_size, _EMBEDDING_SIZE)).astype(np.float32)
+
+                timing = time_it(lambda: model.predict(X), repeat=self.repeat)
+                self._record("predict", dict(model=name, batch_size=batch_size), timing)
+
+    def prepare_data(self, n_classes: int = 4, n_images: int = 16):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = synthetic_dataset(Path(tmp).joinpath("data"), n_classes=n_classes, n_images=n_images)
+            cache_path = Path(tmp).joinpath("cache")
+
+            for cache in [False, True]:
+                kwargs = dict(pre_process=True, batch_size=32, model=self.resnet)
+                if cache:
+                    kwargs["cache_path"] = cache_path
+
+                # The warm-up run fills the cache: the timed runs measure a warm cache
+                timing = time_it(lambda: FeatureExtractor.prepare_data(path, **kwargs), repeat=self.repeat)
+                self._record("prepare_data", dict(n_images=n_classes * n_images, cache=cache), timing)
+
+    def compute_distance(self):
+        for n in [1000, 5000]:
+            X = self.rng.normal(size=(n, _EMBEDDING_SIZE)).astype(np.float32)
+            y = self.rng.integers(0, 5, size=n).astype(str)
+
+            timing = time_it(lambda: compute_distance(X, y, verbose=False), repeat=max(1, self.repeat // 5))
+            self._record("compute_distance", dict(n_embeddings=n), timing)
+
+    def extract_faces(self, n_frames: int = 50):
+        width, height = self.resolutions[0]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            src = synthetic_video(Path(tmp).joinpath("video.mp4"), width=width, height=height, n_frames=n_frames)
+
+            for detector, kwargs in [("cascade", dict(model_path=self.cascade_path, scale=1.2)), ("mtcnn", dict())]:
+                to = Path(tmp).joinpath(detector)
+                to.mkdir()
+
+                timing = time_it(
+                    lambda: FrameExtractor.extract_faces(to=to, src=src, detector=detector, frame_step=5, **kwargs),
+                    repeat=max(1, self.repeat // 5),
+                )
+                self._record(
+                    "extract_faces", dict(detector=detector, width=width, height=height, n_frames=n_frames), timing
+                )
+
+    def run(self, stages: List[str]) -> dict:
+        for stage in stages:
+            getattr(self, stage)()
+
+        meta = dict(
+            timestamp=datetime.now().isoformat(timespec="seconds"),
+            platform=platform.platform(),
+            machine=platform.machine(),
+            python=platform.python_version(),
+            torch=torch.__version__,
+            opencv=cv2.__version__,
+            n_threads=torch.get_num_threads(),
+            pretrained_resnet=self.pretrained,
+            repeat=self.repeat,
+        )
+
+        return dict(meta=meta, results=self.results)
+
+
+def compare(results: dict, previous: dict):
+    """Function printing, for each measure of `results` also in `previous`, the ratio of their median durations"""
+    previous = {(r["stage"], json.dumps(r["params"], sort_keys=True)): r["median_ms"] for r in previous["results"]}
+
+    for r in results["results"]:
+        key = (r["stage"], json.dumps(r["params"], sort_keys=True))
+        if key in previous:
+            ratio = r["median_ms"] / previous[key]
+            print(f"{r['stage']:<20} {key[1]:<45} {previous[key]:10.3f} -> {r['median_ms']:10.3f} ms  (x{ratio:.2f})")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", type=str, nargs="+", default=STAGES, choices=STAGES, help="Stages to time")
+    parser.add_argument(
+        "--resolutions",
+        type=str,
+        nargs="+",
+        default=["320x240", "640x480", "1280x720"],
+        help="Resolutions of the frames, as `<width>x<height>`",
+    )
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16], help="Batch sizes of faces")
+    parser.add_argument("--repeat", type=int, default=10, help="Number of timed runs of each measure")
+    parser.add_argument(
+        "--cascade-path",
+        type=str,
+        default=str(Path(cv2.data.haarcascades).joinpath("haarcascade_frontalface_default.xml")),
+        help="Filepath to the haar cascade `.xml`, by default the one shipped with OpenCV",
+    )
+    parser.add_argument("--random-init", action="store_true", help="Do not try to load the pretrained ResNet")
+    parser.add_argument("--output", type=str, default=None, help="Filepath where to save the results as JSON")
+    parser.add_argument("--compare", type=str, default=None, help="JSON of a previous run to compare against")
+
+    args = parser.parse_args()
+
+    resolutions = [tuple(int(x) for x in r.lower().split("x")) for r in args.resolutions]
+    benchmark = StageBenchmark(
+        resolutions=resolutions,
+        batch_sizes=args.batch_sizes,
+        repeat=args.repeat,
+        cascade_path=args.cascade_path,
+        pretrained=not args.random_init,
+    )
+    results = benchmark.run(stages=args.stages)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, previous=json.load(f))
@@ -4,7 +4,8 @@
 # After collected enough images, follow the instructions in the `README.md` on how to
 # prepare the dataset for training.
 
-from peoples_anthem import PeoplesAnthem
+from utils.metrics import add_metrics_arguments, setup_metrics
+from utils.startup import profiler
 
 if __name__ == "__main__":
     import argparse
@@ -19,11 +20,33 @@ if __name__ == "__main__":
     parser.add_argument(
         "--model-filepath",
         type=str,
-        required=True,
-        help="Filepath to the model to use for face recognition",
+        default=None,
+        help="Unused: building a dataset does not need a face recognition model. Kept for backward compatibility",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print how long each import and initialization step took before watching the camera",
     )
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
 
-    peoples_anthem = PeoplesAnthem(model_path=args.model_filepath)
+    if args.profile_startup:
+        profiler.enable()
+
+    setup_metrics(args)
+
+    # Imported after parsing the arguments, so that `--help` and `--profile-startup` do not wait for torch and OpenCV
+    with profiler.measure_imports():
+        from peoples_anthem import PeoplesAnthem
+
+    peoples_anthem = PeoplesAnthem()
+
+    with profiler.measure("warmup"):
+        peoples_anthem.warmup(recognition=False)
+
+    if args.profile_startup:
+        print(profiler.report())
+
     peoples_anthem.detect_and_save_image(path=args.path)
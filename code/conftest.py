@@ -0,0 +1,2 @@
+# Lets pytest import the modules of the `code` directory (`utils`, ...) as the scripts do, when run from the repository
+# root (`pytest code/tests`) or from the `code` directory (`pytest tests`).
@@ -0,0 +1,84 @@
+# Script used for adding or removing identities of a face recognition model trained with `--recognizer gallery`,
+# without retraining it.
+#
+# The images to add are organized like the training set: one directory per person.
+
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from utils.feature_extractor import FeatureExtractor
+from utils.gallery import EmbeddingGallery
+from utils.model import load_model, read_metadata, serialize_model
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model-filepath",
+        type=str,
+        required=True,
+        help="Filepath to the gallery model to update, it is overwritten",
+    )
+
+    parser.add_argument(
+        "--add-path",
+        type=str,
+        default=None,
+        help="Directory where images to enroll, classified by person, are stored",
+    )
+
+    parser.add_argument(
+        "--remove",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Identities to remove from the gallery",
+    )
+
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        default=None,
+        help="Directory where face embeddings are cached between runs. By default, `<add-path>/.embedding-cache`",
+    )
+
+    args = parser.parse_args()
+
+    gallery, metadata = load_model(args.model_filepath, mmap=False), read_metadata(args.model_filepath)
+
+    assert isinstance(
+        gallery, EmbeddingGallery
+    ), f"Only models trained with `--recognizer gallery` can be updated but got `{type(gallery).__name__}`."
+
+    enrollment = dict(enrolled_at=datetime.now().isoformat(timespec="seconds"), added=[], removed=[])
+
+    if args.remove:
+        gallery.remove(labels=args.remove)
+        enrollment["removed"] = sorted(args.remove)
+        logger.info(f"Removed: {args.remove}.")
+
+    if args.add_path is not None:
+        add_path = Path(args.add_path)
+        cache_path = Path(args.cache_path or add_path.joinpath(".embedding-cache"))
+
+        X, y = FeatureExtractor.prepare_data(add_path, cache_path=cache_path, pre_process=True, batch_size=32)
+        gallery.add(X=X, y=y)
+        enrollment["added"] = sorted(set(y))
+        logger.info(f"Enrolled {len(y)} images of: {sorted(set(y))}.")
+
+    # The performance measured at training describes identities that changed: it is dropped rather than kept stale
+    output_path = serialize_model(
+        model=gallery,
+        parameters=metadata.get("parameters"),
+        performance=None,
+        dataset_path=metadata.get("dataset_path"),
+        output_path=args.model_filepath,
+        extra_metadata=enrollment,
+    )
+
+    logger.info(f"Saved gallery of {len(gallery)} images of {gallery.identities()} at {output_path}...")
@@ -0,0 +1,373 @@
+# Script used for building a dataset of faces from a directory of videos, for example the ones recorded by pikrellcam.
+# Videos are processed in parallel, by a pool of processes that each own their face detector.
+#
+# After extracting the faces, follow the instructions in the `README.md` on how to prepare the dataset for training.
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List
+
+from utils.frame_extractor import FrameExtractor
+from utils.ledger import VideoLedger
+from utils.model_registry import ModelRegistry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Note: this path is hardcoded in the Dockerfile
+FACE_DETECTION_MODEL_FILEPATH = "/home/pi/models-cache/face-cascade/haarcascade_frontalface_default.xml"
+
+
+def _init_worker(detector: str, model_path: str, n_threads: int):
+    """Function run once in each worker process: loads the detector that the process will use for all its videos"""
+    if detector == "mtcnn":
+        import torch
+
+        torch.set_num_threads(n_threads)
+        ModelRegistry.get_mtcnn()
+    else:
+        ModelRegistry.get_face_cascade(model_path=model_path or FACE_DETECTION_MODEL_FILEPATH)
+
+
+def _extract_faces(src: Path, **kwargs) -> Dict[str, int]:
+    start = time.perf_counter()
+    stats = FrameExtractor.extract_faces(src=src, **kwargs)
+    stats["seconds"] = time.perf_counter() - start
+
+    return stats
+
+
+def _make_executor(detector: str, n_workers: int, model_path: str) -> ProcessPoolExecutor:
+    """Function returning a pool of `n_workers` processes, each loading its own `detector` once"""
+    # Torch uses every core by default: split them between the processes instead of oversubscribing the CPU
+    n_threads = max(1, os.cpu_count() // n_workers)
+
+    return ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(detector, model_path, n_threads),
+    )
+
+
+def _process_videos(
+    executor: ProcessPoolExecutor,
+    videos: List[Path],
+    to: str,
+    detector: str,
+    ledger: VideoLedger = None,
+    delete_processed: bool = False,
+    **kwargs,
+) -> Dict[str, int]:
+    """
+    Function that extracts the faces of `videos` with `executor`, records them in `ledger` and returns the totals
+
+    Raises
+    ------
+    BrokenProcessPool
+        If a worker process died, for example killed for lack of memory. The videos it was processing, and the ones
+        queued behind them, are recorded as failed: `executor` cannot be used anymore and must be recreated
+    """
+    totals = dict(n_videos=0, n_frames=0, n_sampled=0, n_faces=0)
+    futures = dict()
+    broken = None
+
+    for src in videos:
+        if ledger is not None:
+            ledger.mark_processing(path=src)
+
+        try:
+            futures[executor.submit(_extract_faces, src=src, to=to, detector=detector, **kwargs)] = src
+        except BrokenProcessPool as e:
+            # The videos not submitted yet are left out of the ledger, and found again by the next scan
+            if ledger is not None:
+                ledger.mark_failed(path=src, error=repr(e))
+            broken = e
+            break
+
+    for future in as_completed(futures):
+        src = futures[future]
+
+        try:
+            stats = future.result()
+        except Exception as e:
+            logger.exception(f"Could not extract faces from {src}.")
+            broken = e if isinstance(e, BrokenProcessPool) else broken
+
+            if ledger is not None:
+                ledger.mark_failed(path=src, error=repr(e))
+            continue
+
+        totals["n_videos"] += 1
+        for k in ["n_frames", "n_sampled", "n_faces"]:
+            totals[k] += stats[k]
+
+        logger.info(f"{src.name}: {stats['n_faces']} faces in {stats['n_frames']} frames ({stats['seconds']:.1f}s).")
+
+        if ledger is not None:
+            ledger.mark_processed(path=src, stats=stats)
+
+        if delete_processed and src.exists():
+            src.unlink()
+
+        # Faceless videos may also have been deleted by the worker, with `rm_faceless`
+        if ledger is not None and not src.exists():
+            ledger.mark_deleted(path=src)
+
+    if broken is not None:
+        raise broken
+
+    return totals
+
+
+def _settled_videos(videos_path: str, pattern: str, min_age: float) -> List[Path]:
+    """Function returning the videos of `videos_path` that were not modified for `min_age` seconds, sorted by name"""
+    now = time.time()
+    videos = []
+
+    for path in sorted(Path(videos_path).glob(pattern)):
+        try:
+            if now - path.stat().st_mtime >= min_age:
+                videos.append(path)
+        except FileNotFoundError:
+            # Renamed or deleted since the directory was listed, for example by pikrellcam or by `rm_faceless`
+            continue
+
+    return videos
+
+
+def _throughput(totals: Dict[str, int], seconds: float) -> Dict[str, float]:
+    totals = dict(totals)
+    totals["seconds"] = round(seconds, 2)
+    totals["frames_per_second"] = round(totals["n_frames"] / seconds, 2)
+    totals["faces_per_second"] = round(totals["n_faces"] / seconds, 2)
+
+    return totals
+
+
+def extract_faces_from_videos(
+    videos_path: str,
+    to: str,
+    detector: str,
+    n_workers: int = None,
+    pattern: str = "*.mp4",
+    ledger_path: str = None,
+    max_retries: int = 0,
+    delete_processed: bool = False,
+    **kwargs,
+) -> Dict[str, float]:
+    """
+    Function that extracts the faces of every video of a directory, in parallel
+
+    Parameters
+    ----------
+    videos_path : str
+        Directory with the videos
+    to : str
+        Directory where to save the images of the faces
+    detector : str
+        Either "cascade" or "mtcnn"
+    n_workers : int, optional
+        Number of processes. If None, use one per CPU core, by default None
+    pattern : str, optional
+        Glob pattern of the videos in `videos_path`, by default "*.mp4"
+    ledger_path : str, optional
+        Filepath to the `VideoLedger` in which each video is recorded. Videos already in it are skipped. If None, every
+        video is processed and nothing is recorded, by default None
+    max_retries : int, optional
+        Number of times a video whose extraction failed is retried, over successive runs, by default 0
+    delete_processed : bool, optional
+        Whether to delete each video once its faces are extracted, by default False
+
+    Returns
+    -------
+    Dict[str, float]
+        Aggregated statistics: number of videos, frames and faces, and throughput in frames/sec and faces/sec
+    """
+    videos = sorted(Path(videos_path).glob(pattern))
+    n_workers = n_workers or os.cpu_count()
+    ledger = VideoLedger(path=ledger_path) if ledger_path is not None else None
+
+    if ledger is not None:
+        videos = ledger.new_videos(paths=videos, max_retries=max_retries)
+
+    logger.info(f"Extracting faces from {len(videos)} videos with {n_workers} processes...")
+    start = time.perf_counter()
+
+    with _make_executor(detector=detector, n_workers=n_workers, model_path=kwargs.get("model_path")) as executor:
+        totals = _process_videos(
+            executor=executor,
+            videos=videos,
+            to=to,
+            detector=detector,
+            ledger=ledger,
+            delete_processed=delete_processed,
+            **kwargs,
+        )
+
+    if ledger is not None:
+        ledger.close()
+
+    return _throughput(totals=totals, seconds=time.perf_counter() - start)
+
+
+def watch(
+    videos_path: str,
+    to: str,
+    detector: str,
+    ledger_path: str,
+    poll_interval: float = 30.0,
+    min_age: float = 10.0,
+    n_workers: int = None,
+    pattern: str = "*.mp4",
+    max_retries: int = 0,
+    delete_processed: bool = False,
+    **kwargs,
+):
+    """
+    Function that polls a directory and extracts the faces of each new video, until interrupted
+
+    Parameters
+    ----------
+    videos_path : str
+        Directory with the videos, for example `~/pikrellcam/media/videos`
+    to : str
+        Directory where to save the images of the faces
+    detector : str
+        Either "cascade" or "mtcnn"
+    ledger_path : str
+        Filepath to the `VideoLedger` in which each video is recorded, and which tells the new videos apart
+    poll_interval : float, optional
+        Number of seconds between two scans of `videos_path`, by default 30.0
+    min_age : float, optional
+        Videos modified less than `min_age` seconds ago may still be being recorded and are left for the next scan, by
+        default 10.0
+    n_workers : int, optional
+        Number of processes. If None, use one per CPU core, by default None
+    pattern : str, optional
+        Glob pattern of the videos in `videos_path`, by default "*.mp4"
+    max_retries : int, optional
+        Number of times a video whose extraction failed is retried, over successive scans, by default 0
+    delete_processed : bool, optional
+        Whether to delete each video once its faces are extracted, by default False
+    """
+    n_workers = n_workers or os.cpu_count()
+
+    def make_executor() -> ProcessPoolExecutor:
+        return _make_executor(detector=detector, n_workers=n_workers, model_path=kwargs.get("model_path"))
+
+    with VideoLedger(path=ledger_path) as ledger:
+        executor = make_executor()
+        logger.info(f"Watching {videos_path} for new videos...")
+
+        try:
+            while True:
+                videos = _settled_videos(videos_path=videos_path, pattern=pattern, min_age=min_age)
+                videos = ledger.new_videos(paths=videos, max_retries=max_retries)
+
+                if videos:
+                    start = time.perf_counter()
+                    try:
+                        totals = _process_videos(
+                            executor=executor,
+                            videos=videos,
+                            to=to,
+                            detector=detector,
+                            ledger=ledger,
+                            delete_processed=delete_processed,
+                            **kwargs,
+                        )
+                        logger.info(f"Ingested: {_throughput(totals=totals, seconds=time.perf_counter() - start)}")
+                    except BrokenProcessPool:
+                        logger.error("A worker process died, for example killed for lack of memory: restarting them.")
+                        executor.shutdown(wait=False)
+                        executor = make_executor()
+
+                time.sleep(poll_interval)
+        finally:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--videos-path", type=str, required=True, help="Directory with the videos to extract faces from"
+    )
+    parser.add_argument(
+        "--output-path", type=str, required=True, help="Directory where to save the images of detected faces"
+    )
+    parser.add_argument("--detector", type=str, default="mtcnn", choices=["mtcnn", "cascade"], help="Face detector")
+    parser.add_argument("--frame-step", type=int, default=5, help="Look for faces in one frame out of `frame-step`")
+    parser.add_argument(
+        "--fps", type=float, default=None, help="Look for faces in `fps` frames per second of video instead"
+    )
+    parser.add_argument("--n-workers", type=int, default=None, help="Number of processes, by default one per CPU core")
+    parser.add_argument("--pattern", type=str, default="*.mp4", help="Glob pattern of the videos")
+    parser.add_argument("--rm-faceless", action="store_true", help="Delete the videos in which no face was found")
+    parser.add_argument(
+        "--batch-size", type=str, default="1", help="[mtcnn] Number of frames per MTCNN batch, or `auto`"
+    )
+    parser.add_argument(
+        "--model-path",
+        type=str,
+        default=FACE_DETECTION_MODEL_FILEPATH,
+        help="[cascade] Filepath to the haar cascade `.xml`",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.2, help="[cascade] Scaling factor of the crop around each face"
+    )
+    parser.add_argument(
+        "--ledger-path",
+        type=str,
+        default=None,
+        help="SQLite ledger of the processed videos, which are skipped. By default, `<output-path>/.ledger.sqlite`",
+    )
+    parser.add_argument("--no-ledger", action="store_true", help="Process every video and do not record them")
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=0,
+        help="Number of retries of the videos recorded as failed in the ledger, which are skipped by default",
+    )
+    parser.add_argument("--delete-processed", action="store_true", help="Delete each video once processed")
+    parser.add_argument("--watch", action="store_true", help="Keep polling `videos-path` and process new videos")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="[watch] Seconds between two scans")
+
+    args = parser.parse_args()
+
+    if args.detector == "mtcnn":
+        detector_kwargs = dict(batch_size=args.batch_size if args.batch_size == "auto" else int(args.batch_size))
+    else:
+        detector_kwargs = dict(model_path=args.model_path, scale=args.scale)
+
+    ledger_path = args.ledger_path or Path(args.output_path).joinpath(".ledger.sqlite")
+    ledger_path = None if args.no_ledger else ledger_path
+
+    kwargs = dict(
+        videos_path=args.videos_path,
+        to=args.output_path,
+        detector=args.detector,
+        n_workers=args.n_workers,
+        pattern=args.pattern,
+        ledger_path=ledger_path,
+        max_retries=args.max_retries,
+        delete_processed=args.delete_processed,
+        frame_step=args.frame_step,
+        fps=args.fps,
+        rm_faceless=args.rm_faceless,
+        **detector_kwargs,
+    )
+
+    if args.watch:
+        assert ledger_path is not None, "`--watch` requires a ledger to tell new videos apart."
+        watch(poll_interval=args.poll_interval, **kwargs)
+    else:
+        totals = extract_faces_from_videos(**kwargs)
+        logger.info(f"Done: {totals}")
@@ -3,39 +3,69 @@ import logging
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Tuple
+from typing import Any, List, Optional, Tuple
 
 import cv2
-import joblib
 import numpy as np
 import torch
-import yaml
 from PIL import Image
+from utils.camera import CameraSession
 from utils.feature_extractor import FeatureExtractor
 from utils.frame_extractor import FrameExtractor
-from utils.players import SpotifyPlayer
+from utils.metrics import metrics
+from utils.model_registry import ModelRegistry
+from utils.motion import MotionGate
+from utils.pipeline import RecognitionPipeline
+from utils.tracker import FaceTracker, IdentityCooldown, Track, match_boxes
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 N_TRACKS = 2  # Play `N_TRACKS` from your playlist
-N_CONSECUTIVE_DETECTION = 3  # Number of face to detect before identifying
+N_CONSECUTIVE_DETECTION = 3  # Number of consecutive frames in which a face is detected before identifying it
+PLAYBACK_POLICY = "preempt"  # When someone else is recognized while an anthem plays: "preempt" it or "queue" after it
 BRIGHTNESS_FACTOR = 2.5  # Increase the brightness of each picture before sending it to `FrameExtractor.get_face_mtcnn`
+# MTCNN only looks around the largest face found by the haar cascade, enlarged by this fraction of its size on each
+# side. If None, MTCNN looks at the whole frame.
+MTCNN_ROI_MARGIN = 0.5
+# Faces are tracked across frames, so that each person is only recognized once per arrival. A box is matched to a track
+# if they overlap by at least `TRACK_IOU_THRESHOLD`, and a track is dropped after `TRACK_MAX_MISSED` frames without face
+TRACK_IOU_THRESHOLD = 0.3
+TRACK_MAX_MISSED = 10
+MAX_RECOGNITION_ATTEMPTS = 3  # Number of recognitions of a track classified as `misc` before giving up on it
+# Minimum number of seconds between two anthems of the same person. Set per person in the `COOLDOWN` of the config
+COOLDOWN_SECONDS = 10 * 60
+# When several people arrive together, all their faces are recognized in a single batch if `MULTI_FACE`, and the anthem
+# played is the one of: the "largest" face (closest to the camera), the "earliest" arrival, or the person whose anthem
+# played the "least_recent"ly
+MULTI_FACE = True
+WINNER_POLICY = "largest"
+MTCNN_MIN_PROBABILITY = 0.95  # Minimum probability of a face extracted by MTCNN, when `MULTI_FACE`
+# Skip face detection while the scene is static, waiting longer and longer between frames, up to `MOTION_MAX_INTERVAL`
+# seconds. Motion is a change of more than `MOTION_MIN_CHANGED_FRACTION` of the pixels of a downscaled frame.
+MOTION_GATE = True
+MOTION_MAX_INTERVAL = 1.0
+MOTION_MIN_CHANGED_FRACTION = 0.01
 
 # SETUP FACE DETECTION
 # Note: this path is hardcoded in the Dockerfile
 FACE_DETECTION_MODEL_FILEPATH = "/home/pi/models-cache/face-cascade/haarcascade_frontalface_default.xml"
-face_cascade = cv2.CascadeClassifier(FACE_DETECTION_MODEL_FILEPATH)
 
-# Loading pointer to Spotify playlists
+# Pointer to Spotify playlists
 root_path = Path(__file__).parents[1]
 config_path = root_path.joinpath("conf/config.yml")
-with open(config_path) as f:
-    conf = yaml.safe_load(f)
+
+
+def load_config() -> dict:
+    """Function returning the content of `conf/config.yml`: the Spotify secrets and the playlist of each person"""
+    import yaml
+
+    with open(config_path) as f:
+        return yaml.safe_load(f)
 
 
 class PeoplesAnthem(object):
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str = None):
         """
         Class used for either of 2 reasons:
           - Extracting faces and saving them to disk for building a face dataset
@@ -43,36 +73,161 @@ class PeoplesAnthem(object):
 
         Parameters
         ----------
-        model_path : str
-            Filepath to the model to use for face recognition
+        model_path : str, optional
+            Filepath to the model to use for face recognition. Only needed for recognizing people, by default None
+
+        Notes
+        -----
+        Nothing is loaded here: each model, the music players and the config are created on first use, so that building
+        a face dataset does not pay for face recognition and music playback. `warmup` loads everything needed for
+        recognizing people upfront, so that the first recognition is not slowed down by deserialization.
         """
         self.counter = 0
-        self.model_path = Path(model_path)
+        self.model_path = Path(model_path) if model_path is not None else None
+        self.tracker = FaceTracker(iou_threshold=TRACK_IOU_THRESHOLD, max_missed=TRACK_MAX_MISSED)
+        self.motion_gate = (
+            MotionGate(max_interval=MOTION_MAX_INTERVAL, min_changed_fraction=MOTION_MIN_CHANGED_FRACTION)
+            if MOTION_GATE
+            else None
+        )
+
+        self._camera = None
+        self._playback = None
+        self._playlists = None
+        self._cooldown = None
+        self._warmed_up = set()
+
+    @property
+    def face_recognition_model(self) -> Any:
+        assert self.model_path is not None, "A `model_path` is needed for recognizing faces."
+
+        return ModelRegistry.get_classifier(model_path=self.model_path)
+
+    @property
+    def camera(self) -> CameraSession:
+        """Camera, kept open for the life of the process and configured by the `CAMERA` section of the config"""
+        if self._camera is None:
+            conf = (load_config() or dict()) if config_path.exists() else dict()
+            self._camera = CameraSession.from_config(conf.get("CAMERA", None))
+            metrics.add_collector("camera", self._camera.snapshot)
+
+        return self._camera
 
-        self.face_recognition_model = joblib.load(self.model_path).get("model")
+    @property
+    def playback(self) -> "PlaybackService":
+        if self._playback is None:
+            from utils.players import PlaybackService
 
-    def check_for_faces(self, cap: cv2.VideoCapture) -> Tuple[Image.Image, np.array]:
+            self._playback = PlaybackService().start()
+
+        return self._playback
+
+    @property
+    def playlists(self) -> "PlaylistCache":
+        if self._playlists is None:
+            from utils.players import PlaylistCache
+
+            conf = load_config()
+            self._playlists = PlaylistCache(
+                secret_dict=conf.get("SECRET", None), playlist_uri_dict=conf.get("PLAYLIST", None)
+            ).start()
+
+        return self._playlists
+
+    @property
+    def cooldown(self) -> IdentityCooldown:
+        if self._cooldown is None:
+            self._cooldown = IdentityCooldown(seconds=COOLDOWN_SECONDS, overrides=load_config().get("COOLDOWN", None))
+
+        return self._cooldown
+
+    def warmup(self, recognition: bool = True):
+        """
+        Method that loads upfront what is otherwise loaded on first use. Calling it again, for example from
+        `recognize_and_play_spotify` after the entry point already did, does nothing
+
+        Parameters
+        ----------
+        recognition : bool, optional
+            Whether to also load what is needed for recognizing people: the face recognition models, the music players
+            and the playlists. Otherwise, only the face detection models are loaded, by default True
+        """
+        if "detection" not in self._warmed_up:
+            ModelRegistry.get_face_cascade(model_path=FACE_DETECTION_MODEL_FILEPATH)
+            ModelRegistry.get_mtcnn()
+            self._warmed_up.add("detection")
+
+        if recognition and ("recognition" not in self._warmed_up):
+            ModelRegistry.warmup(model_path=self.model_path)
+            _ = self.playback, self.playlists, self.cooldown
+            self._warmed_up.add("recognition")
+
+    def check_for_faces(self, cap: CameraSession) -> Tuple[np.array, np.array]:
         """
         Method that returns the frame and the detected faces
 
         Parameters
         ----------
-        cap : cv2.VideoCapture
+        cap : CameraSession
             Video capture from webcam
 
         Returns
         -------
-        Tuple[Image.Image, np.array]
-            Tuple of the image capture and array of the coordinates of the detected face
+        Tuple[np.array, np.array]
+            Tuple of the image capture, in BGR, and array of the coordinates of the detected face. When the scene is
+            static (see `MOTION_GATE`) or when no frame could be read, face detection is skipped: the image is None and
+            no face is returned.
         """
-        _, frame = cap.read()
+        with metrics.measure("camera_read"):
+            ret, frame = cap.read()
+        metrics.increment("frames")
+
+        if not ret:
+            return None, np.empty((0, 4), dtype=int)
+
+        # A person standing still creates no motion: keep detecting while faces are being followed
+        if (self.motion_gate is not None) and not self.motion_gate.check(
+            frame=frame, force=(self.counter > 0) or (len(self.tracker.tracks) > 0)
+        ):
+            return None, np.empty((0, 4), dtype=int)
+
+        return self.detect_faces(frame=frame)
+
+    def detect_faces(self, frame: np.array) -> Tuple[np.array, np.array]:
+        """
+        Method that preprocesses a frame and returns it along with the detected faces
+
+        Only the grayscale frame seen by the haar cascade is computed for every frame. The frame in color, needed to
+        extract faces, is only computed when faces were detected.
+
+        Parameters
+        ----------
+        frame : np.array
+            Frame read from the webcam, in BGR
 
-        im = Image.fromarray(frame)
-        im = FrameExtractor.preprocess_im(im=im, rotation=180, height_offset=0, brightness_factor=None)
-        gray = cv2.cvtColor(np.array(im), cv2.COLOR_BGR2GRAY)
+        Returns
+        -------
+        Tuple[np.array, np.array]
+            Tuple of the preprocessed frame, in BGR, and array of the coordinates of the detected face. The frame is
+            None if no face was detected.
+        """
+        with metrics.measure("preprocess"):
+            gray = FrameExtractor.preprocess_arr(
+                arr=frame, rotation=180, height_offset=0, brightness_factor=None, conversion=cv2.COLOR_BGR2GRAY
+            )
 
         # This is a good resource, for setting detectMultiScale parameters: https://stackoverflow.com/a/20805153/4490749
-        faces_coordinates = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4)
+        face_cascade = ModelRegistry.get_face_cascade(model_path=FACE_DETECTION_MODEL_FILEPATH)
+        with metrics.measure("cascade"):
+            faces_coordinates = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4)
+
+        if len(faces_coordinates) == 0:
+            return None, faces_coordinates
+
+        metrics.increment("frames_with_faces")
+
+        with metrics.measure("preprocess"):
+            im = FrameExtractor.preprocess_arr(arr=frame, rotation=180, height_offset=0, brightness_factor=None)
 
         return im, faces_coordinates
 
@@ -92,7 +247,39 @@ class PeoplesAnthem(object):
             area = w * h
             logger.info(f"face detected on: {datetime.now()}; area was {area}")
 
-    def extract_faces(self, im: Image.Image) -> torch.Tensor:
+    @staticmethod
+    def get_face_mtcnn(im: np.array, faces_coordinates: np.array = None) -> torch.Tensor:
+        """
+        Method that extracts a face with MTCNN, according to `MTCNN_ROI_MARGIN`
+
+        Parameters
+        ----------
+        im : np.array
+            Image capture from the webcam, in BGR
+        faces_coordinates : np.array, optional
+            Array of the coordinates of the faces detected by the haar cascade. If given and `MTCNN_ROI_MARGIN` is not
+            None, MTCNN only looks around the largest of them, by default None
+
+        Returns
+        -------
+        torch.Tensor
+            Face extracted by MTCNN, or None if no face was found
+        """
+        with metrics.measure("mtcnn"):
+            if (MTCNN_ROI_MARGIN is not None) and (faces_coordinates is not None) and (len(faces_coordinates) >= 1):
+                face = FrameExtractor.get_largest_face(faces=faces_coordinates)
+                faces = FrameExtractor.get_face_mtcnn_roi(
+                    im=im, face=face, margin=MTCNN_ROI_MARGIN, brightness_factor=BRIGHTNESS_FACTOR
+                )
+            else:
+                faces = FrameExtractor.get_face_mtcnn(im=im, brightness_factor=BRIGHTNESS_FACTOR)
+
+        if faces is None:
+            metrics.increment("outcome.no_face_extracted")
+
+        return faces
+
+    def extract_faces(self, im: np.array, faces_coordinates: np.array = None) -> torch.Tensor:
         """
         Method that extract faces if enough face were detected consecutively
 
@@ -102,8 +289,10 @@ class PeoplesAnthem(object):
 
         Parameters
         ----------
-        im : Image.Image
-            Image capture from the webcam
+        im : np.array
+            Image capture from the webcam, in BGR
+        faces_coordinates : np.array, optional
+            Array of the coordinates of the faces detected by the haar cascade, by default None
 
         Returns
         -------
@@ -113,7 +302,7 @@ class PeoplesAnthem(object):
 
         if self.counter >= N_CONSECUTIVE_DETECTION:
             logger.info(f"Faces detected {N_CONSECUTIVE_DETECTION} times in a row: {datetime.now()}")
-            faces = FrameExtractor.get_face_mtcnn(im=im, brightness_factor=BRIGHTNESS_FACTOR)
+            faces = self.get_face_mtcnn(im=im, faces_coordinates=faces_coordinates)
 
         else:
             faces = self.counter
@@ -125,25 +314,24 @@ class PeoplesAnthem(object):
 
         return faces
 
-    def reset_video_capture(self, cap: cv2.VideoCapture) -> cv2.VideoCapture:
+    def reset_video_capture(self, cap: CameraSession) -> CameraSession:
         """
-        Method that reset the video capture and restart the face counter
+        Method that drops the frames buffered by the camera during a recognition and restart the face counter
+
+        The camera is not reopened: reopening it re-initializes the device and waits for its auto-exposure to settle.
 
         Parameters
         ----------
-        cap : cv2.VideoCapture
+        cap : CameraSession
             Video capture from webcam
 
         Returns
         -------
-        cv2.VideoCapture
-            Video capture from webcam
+        CameraSession
+            The same video capture, whose next frame is a live one
         """
-        cap.release()
-        cv2.destroyAllWindows()
-
+        cap.flush()
         self.counter = 0
-        cap = cv2.VideoCapture(0)
 
         return cap
 
@@ -154,49 +342,272 @@ class PeoplesAnthem(object):
 
         self.counter = 0
         logger.debug("No face detected")
-        time.sleep(0.1)
+        time.sleep(max(0.1, self.motion_gate.interval if self.motion_gate is not None else 0))
 
-    def recognize_and_play_spotify(self):
+    def recognize_face(self, faces: torch.Tensor) -> str:
+        """
+        Method that returns the identity of an extracted face
+
+        Parameters
+        ----------
+        faces : torch.Tensor
+            Face extracted by `FrameExtractor.get_face_mtcnn`, of shape (1, channel, w, h)
+
+        Returns
+        -------
+        str
+            Identity predicted by the face recognition model
+        """
+        return self.recognize_faces(faces=faces)[0]
+
+    def recognize_faces(self, faces: torch.Tensor) -> List[str]:
+        """
+        Method that returns the identity of each extracted face, embedding them in a single batch and classifying them
+        in a single call
+
+        Parameters
+        ----------
+        faces : torch.Tensor
+            Faces extracted by `FrameExtractor.get_faces_mtcnn`, of shape (n_faces, channel, w, h)
+
+        Returns
+        -------
+        List[str]
+            Identity predicted by the face recognition model, for each face
+        """
+        with metrics.measure("embedding"):
+            face_emb = FeatureExtractor.get_embeddings(
+                arr=faces, batch_size=len(faces), pre_process=True, model=ModelRegistry.get_resnet()
+            )
+
+        with metrics.measure("classifier"):
+            face_ids = list(self.face_recognition_model.predict(face_emb))
+
+        for face_id in face_ids:
+            metrics.increment(f"outcome.{'misc' if face_id.lower() == 'misc' else 'recognized'}")
+        logger.info(f"Detected: {', '.join(face_id.title() for face_id in face_ids)}.")
+
+        return face_ids
+
+    @property
+    def identities_present(self) -> List[str]:
+        """Identities of the people currently in front of the camera"""
+        return self.tracker.labels()
+
+    def choose_anthem(self, recognized: List[Tuple[Track, str]]) -> Optional[str]:
+        """
+        Method that returns whose anthem to play among the people just recognized, according to `WINNER_POLICY`
+
+        People whose anthem is already playing, being fetched or cooling down are left out, so that someone arriving
+        with a person whose anthem just played gets their anthem.
+
+        Parameters
+        ----------
+        recognized : List[Tuple[Track, str]]
+            Track and identity of each person just recognized
+
+        Returns
+        -------
+        Optional[str]
+            Identity whose anthem to play. None if nobody is eligible.
+        """
+        owners = self.playback.owners()
+        eligible = [
+            (track, face_id)
+            for track, face_id in recognized
+            if (face_id not in owners) and self.cooldown.available(identity=face_id)
+        ]
+
+        if not eligible:
+            # Let `play_anthem` log and count why nobody is eligible
+            return recognized[0][1] if recognized else None
+
+        keys = dict(
+            largest=lambda x: -x[0].area,
+            earliest=lambda x: x[0].created_at,
+            least_recent=lambda x: self.cooldown.last_triggered(identity=x[1]) or float("-inf"),
+        )
+        assert WINNER_POLICY in keys, f"`WINNER_POLICY` must be one of {list(keys)}, got {WINNER_POLICY}."
+
+        return min(eligible, key=keys[WINNER_POLICY])[1]
+
+    def play_anthem(self, face_id: str):
+        """
+        Method that hands the Spotify playlist of `face_id` over to the background player and returns immediately
+
+        If the anthem of `face_id` is already playing, queued or being fetched, or if it was played less than
+        `COOLDOWN_SECONDS` ago, nothing is done. Otherwise, depending on `PLAYBACK_POLICY`, it either preempts the
+        anthem currently playing or is queued after it. The cooldown only starts once the tracks were fetched and
+        handed to the player: if fetching them fails, `face_id` can be played again on the next recognition.
+
+        Parameters
+        ----------
+        face_id : str
+            Identity of the recognized person
+        """
+        if face_id in self.playback.owners():
+            logger.info(f"The anthem of {face_id.title()} is already playing or queued.")
+            metrics.increment("outcome.already_playing")
+            return
+
+        if not self.cooldown.reserve(identity=face_id):
+            if self.cooldown.is_reserved(identity=face_id):
+                logger.info(f"The anthem of {face_id.title()} is already being fetched.")
+                metrics.increment("outcome.already_playing")
+            else:
+                logger.info(f"{face_id.title()} is cooling down for {self.cooldown.remaining(identity=face_id):.0f}s.")
+                metrics.increment("outcome.cooldown")
+            return
+
+        # Called from the playback thread: the cooldown starts once the tracks are ready to be played
+        def get_tracks():
+            try:
+                with metrics.measure("spotify"):
+                    tracks = self.playlists.sample(user=face_id, n_tracks=N_TRACKS)
+            except Exception:
+                self.cooldown.release(identity=face_id)
+                raise
+
+            if tracks:
+                self.cooldown.trigger(identity=face_id)
+            else:
+                logger.warning(f"No track to play for {face_id.title()}.")
+                self.cooldown.release(identity=face_id)
+
+            return tracks
+
+        if PLAYBACK_POLICY == "preempt":
+            self.playback.preempt(tracks=get_tracks, owner=face_id)
+        else:
+            self.playback.enqueue(tracks=get_tracks, owner=face_id)
+
+    def _recognize_tracks(self, im: np.array, tracks: List[Track]) -> Optional[str]:
+        """
+        Method recognizing the faces of `tracks`, recording their identity in the tracker and returning whose anthem to
+        play. Used by `recognize_and_play_spotify`
+
+        With `MULTI_FACE`, when several faces arrive together, they are all extracted by a single MTCNN pass over the
+        frame and recognized in a single batch. Otherwise, only the largest face is recognized, MTCNN looking around it
+        only.
+
+        Parameters
+        ----------
+        im : np.array
+            Preprocessed frame in which faces were detected, in BGR
+        tracks : List[Track]
+            Tracks of the faces to recognize, from the largest face
+
+        Returns
+        -------
+        Optional[str]
+            Identity whose anthem to play, see `choose_anthem`. None if no face could be extracted or if every face is
+            from the `misc` category.
+        """
+        if MULTI_FACE and (len(tracks) > 1):
+            with metrics.measure("mtcnn"):
+                faces, boxes = FrameExtractor.get_faces_mtcnn(
+                    im=im, brightness_factor=BRIGHTNESS_FACTOR, min_probability=MTCNN_MIN_PROBABILITY
+                )
+
+            matches = match_boxes(tracks=tracks, boxes=boxes) if boxes is not None else dict()
+            face_ids = self.recognize_faces(faces=faces[list(matches.values())]) if matches else []
+            labels = dict(zip(matches.keys(), face_ids))
+        else:
+            tracks = tracks[:1]
+            faces = self.get_face_mtcnn(im=im, faces_coordinates=np.array([tracks[0].box]))
+
+            if (faces is not None) and (len(faces.shape) == 3):
+                faces = faces.unsqueeze(0)
+
+            labels = {tracks[0].track_id: self.recognize_face(faces=faces)} if faces is not None else dict()
+
+        recognized = []
+        for track in tracks:
+            face_id = labels.get(track.track_id)
+            face_id = None if (face_id is None) or (face_id.lower() == "misc") else face_id
+            self.tracker.record(track=track, label=face_id)
+
+            if face_id is not None:
+                recognized.append((track, face_id))
+
+        if len(recognized) > 1:
+            logger.info(f"Present: {', '.join(face_id.title() for face_id in self.identities_present)}.")
+
+        return self.choose_anthem(recognized=recognized)
+
+    def recognize_and_play_spotify(self, pipelined: bool = False):
         """
         Face detection with opencv and haar cascade for rapid inference. This runs almost instantly on a rpi4
-        If detecting faces in `N_CONSECUTIVE_DETECTION` consecutive frames, performs face recognition
+        Faces are tracked across frames. Once a face was detected in `N_CONSECUTIVE_DETECTION` frames, performs face
+        recognition. The face then keeps its identity while it stays in front of the camera, so that face recognition
+        runs once per arrival and not on every frame.
 
         Face recognition uses MTCNN (face extraction) and facenet_pytorch (face recognition).
         This runs in roughly 1.5s on a rpi4
+
+        Parameters
+        ----------
+        pipelined : bool, optional
+            If True, capture, face detection and face recognition run in their own threads (see `RecognitionPipeline`)
+            so that frames keep being read and faces keep being detected while a recognition is in flight. By default
+            False
         """
+        self.warmup()
+
+        if self.motion_gate is not None:
+            metrics.add_collector("motion", self.motion_gate.snapshot)
+
+        if pipelined:
+            pipeline = RecognitionPipeline(
+                capture_factory=lambda: self.camera,
+                detect=lambda frame: self.detect_faces(frame=frame),
+                recognize=self._recognize_tracks,
+                on_result=self.play_anthem,
+                n_consecutive_detection=N_CONSECUTIVE_DETECTION,
+                tracker=self.tracker,
+                max_attempts=MAX_RECOGNITION_ATTEMPTS,
+                motion_gate=self.motion_gate,
+            )
+            metrics.add_collector("pipeline", pipeline.snapshot)
+            pipeline.run()
+
+            return
+
         self.counter = 0
-        cap = cv2.VideoCapture(0)
+        cap = self.camera
 
         while cap.isOpened():
             im, faces_coordinates = self.check_for_faces(cap=cap)
-            self.increase_counter(faces_coordinates=faces_coordinates)
-            extracted_faces = self.extract_faces(im=im)
+            tracks = self.tracker.update(faces_coordinates=faces_coordinates)
 
-            if isinstance(extracted_faces, torch.Tensor):
+            if len(faces_coordinates) == 0:
+                self.no_face_detected()
+                continue
 
-                face_emb = FeatureExtractor.get_embeddings(arr=extracted_faces, pre_process=True)
-                face_id = self.face_recognition_model.predict(face_emb)[0]
-                logger.info(f"Detected: {face_id.title()}.")
+            self.increase_counter(faces_coordinates=faces_coordinates)
 
-                # If detecting noise, do nothing. Else, send face_id to music player.
-                if face_id.lower() == "misc":
-                    continue
-                else:
-                    secret = conf.get("SECRET", None)
-                    playlist = conf.get("PLAYLIST", None)
-                    SpotifyPlayer.get_and_play_tracks(
-                        secret_dict=secret, playlist_uri_dict=playlist, user=face_id, n_tracks=N_TRACKS
-                    )
+            # Faces already identified keep their label: the heavy models only run for someone who just arrived
+            pending = self.tracker.pending(
+                tracks=tracks, min_hits=N_CONSECUTIVE_DETECTION, max_attempts=MAX_RECOGNITION_ATTEMPTS
+            )
+            if not pending:
+                metrics.increment("outcome.tracked")
+                continue
 
-                cap = self.reset_video_capture(cap=cap)
+            face_id = self._recognize_tracks(im=im, tracks=pending)
 
-            elif (extracted_faces is None) | (len(faces_coordinates) == 0):
-                self.no_face_detected()
+            # If detecting noise, do nothing. Else, send face_id to music player.
+            if face_id is None:
+                continue
+
+            self.play_anthem(face_id=face_id)
+            cap = self.reset_video_capture(cap=cap)
 
     def detect_and_save_image(self, path: str):
         """
         Face detection with opencv and haar cascade for rapid inference. This runs almost instantly on a rpi4
-        If detecting faces in `N_CONSECUTIVE_DETECTION` consecutive frames, extract face from image and save to disk
+        If detecting faces in `N_CONSECUTIVE_DETECTION` consecutive frames, extract face from image and save to disk.
+        Faces keep being saved, at up to the frame rate of the camera, while they stay in front of it.
 
         Face extraction uses MTCNN.
         This runs in roughly 1.0s on a rpi4
@@ -207,27 +618,36 @@ class PeoplesAnthem(object):
             Directory where to save the images of detected faces. Those will be used for training the face recognition
             model
         """
+        self.warmup(recognition=False)
+
         self.counter = 0
-        cap = cv2.VideoCapture(0)
+        cap = self.camera
 
         path = Path(path)
         path.mkdir(parents=True, exist_ok=True)
 
         while cap.isOpened():
             im, faces_coordinates = self.check_for_faces(cap=cap)
+
+            if len(faces_coordinates) == 0:
+                self.no_face_detected()
+                continue
+
             self.increase_counter(faces_coordinates=faces_coordinates)
-            extracted_faces = self.extract_faces(im=im)
+            extracted_faces = self.extract_faces(im=im, faces_coordinates=faces_coordinates)
 
             if isinstance(extracted_faces, torch.Tensor):
-                now = datetime.now().strftime("%Y%m%d-%Hh%Mm%Ss")
+                now = datetime.now().strftime("%Y%m%d-%Hh%Mm%Ss-%f")
 
                 extracted_faces = extracted_faces.squeeze()
                 arr = np.transpose(extracted_faces.cpu().numpy(), (1, 2, 0)).astype("int8")
                 im = Image.fromarray(arr, mode="RGB")
 
                 im.save(path.joinpath(f"face-{now}.png"))
+                metrics.increment("faces_saved")
 
-                cap = self.reset_video_capture(cap=cap)
+                # Only drop the frames buffered while MTCNN ran: the counter is kept, so that the next frame is used
+                cap.flush()
 
-            elif (extracted_faces is None) | (len(faces_coordinates) == 0):
+            elif extracted_faces is None:
                 self.no_face_detected()
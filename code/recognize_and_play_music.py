@@ -1,6 +1,7 @@
 # Script used to recognize faces and to trigger a specific spotify playlist upon recognizing a specific person
 
-from peoples_anthem import PeoplesAnthem
+from utils.metrics import add_metrics_arguments, setup_metrics
+from utils.startup import profiler
 
 if __name__ == "__main__":
 
@@ -13,8 +14,72 @@ if __name__ == "__main__":
         required=True,
         help="Filepath to the model to use for face recognition",
     )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Read frames, detect faces and recognize faces in separate threads",
+    )
+    parser.add_argument(
+        "--quantization",
+        type=str,
+        default=None,
+        choices=["dynamic", "static"],
+        help="Run the ResNet and MTCNN with int8 kernels on CPU, static requires torch >= 1.13. Check accuracy first "
+        "with `benchmarks.cpu_inference`",
+    )
+    parser.add_argument(
+        "--calibration-path",
+        type=str,
+        default=None,
+        help="[static quantization] Directory of faces, classified by person, for example the training set",
+    )
+    parser.add_argument("--channels-last", action="store_true", help="Use the channels-last memory format on CPU")
+    parser.add_argument("--n-threads", type=int, default=None, help="Number of intra-op threads used by torch")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print how long each import and initialization step took before watching the camera",
+    )
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
 
+    if args.profile_startup:
+        profiler.enable()
+
+    setup_metrics(args)
+
+    # Imported after parsing the arguments, so that `--help` and `--profile-startup` do not wait for torch and OpenCV
+    with profiler.measure_imports():
+        from peoples_anthem import PeoplesAnthem
+
+    if args.quantization or args.channels_last or args.n_threads:
+        from utils import inference
+        from utils.feature_extractor import FeatureExtractor
+        from utils.model_registry import ModelRegistry
+
+        if (args.quantization == "static") and not inference.supports_static_quantization():
+            parser.error("--quantization static requires torch >= 1.13, use --quantization dynamic instead")
+
+        calibration = None
+        if args.quantization == "static":
+            assert args.calibration_path is not None, "Static quantization requires `--calibration-path`."
+            X, _ = FeatureExtractor.load_faces(args.calibration_path, n_images=64)
+            calibration = FeatureExtractor.to_tensor(X, pre_process=True)
+
+        ModelRegistry.configure_cpu_inference(
+            quantization=args.quantization,
+            channels_last=args.channels_last,
+            n_threads=args.n_threads,
+            calibration=calibration,
+        )
+
     peoples_anthem = PeoplesAnthem(model_path=args.model_filepath)
-    peoples_anthem.recognize_and_play_spotify()
+
+    with profiler.measure("warmup"):
+        peoples_anthem.warmup()
+
+    if args.profile_startup:
+        print(profiler.report())
+
+    peoples_anthem.recognize_and_play_spotify(pipelined=args.pipelined)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from sklearn import svm
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import Normalizer
+from utils.gallery import EmbeddingGallery
+from utils.model import load_model, read_metadata, serialize_model
+
+
+@pytest.fixture
+def embeddings():
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(60, 16)).astype(np.float32)
+    y = np.repeat(["alice", "bob", "misc"], 20)
+
+    return X, y
+
+
+def _round_trip(model, path, **kwargs):
+    serialize_model(model=model, parameters=dict(), performance=dict(), dataset_path="", output_path=path)
+
+    return load_model(path, **kwargs)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_svm_round_trip_predicts(embeddings, tmp_path, mmap):
+    X, y = embeddings
+    pipe = make_pipeline(Normalizer(norm="l2"), svm.NuSVC(nu=0.3, kernel="linear", probability=True)).fit(X, y)
+
+    loaded = _round_trip(pipe, tmp_path.joinpath("model.pklz"), mmap=mmap)
+
+    np.testing.assert_array_equal(loaded.predict(X), pipe.predict(X))
+    np.testing.assert_allclose(loaded.predict_proba(X), pipe.predict_proba(X))
+    assert not read_metadata(tmp_path.joinpath("model.pklz"))["memory_mappable"]
+
+
+def test_gallery_round_trip_is_memory_mapped(embeddings, tmp_path):
+    X, y = embeddings
+    gallery = EmbeddingGallery().fit(X, y)
+
+    loaded = _round_trip(gallery, tmp_path.joinpath("model.pklz"))
+
+    assert isinstance(loaded._embeddings, np.memmap)
+    np.testing.assert_array_equal(loaded.predict(X), gallery.predict(X))
+
+    # Enrollment replaces the memory-mapped arrays instead of writing into them
+    loaded.add(X[:2], ["carol", "carol"])
+    assert "carol" in loaded.identities()
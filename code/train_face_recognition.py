@@ -4,9 +4,11 @@ from pathlib import Path
 import pandas as pd
 from sklearn import svm
 from sklearn.pipeline import make_pipeline
-from sklearn.preprocessing import Normalizer
+from sklearn.preprocessing import Normalizer, StandardScaler
 from utils.feature_extractor import FeatureExtractor
+from utils.gallery import EmbeddingGallery
 from utils.model import serialize_model
+from utils.search import search_hyperparameters
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,6 +23,14 @@ _PARAMS = params = dict(
     verbose=0,
 )
 
+# Values tried by `--search`. Parameters of the `NuSVC` that are not searched are taken from `_PARAMS`.
+_SEARCH_SPACE = dict(
+    normalizer=[Normalizer(norm="l2"), Normalizer(norm="l1"), StandardScaler(), "passthrough"],
+    nusvc__nu=[0.05, 0.1, 0.2, 0.3, 0.4, 0.5],
+    nusvc__kernel=["linear", "poly", "rbf", "sigmoid"],
+    nusvc__class_weight=[None, "balanced"],
+)
+
 if __name__ == "__main__":
     import argparse
 
@@ -39,8 +49,68 @@ if __name__ == "__main__":
         help="Filepath where to save the trained model",
     )
 
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        default=None,
+        help="Directory where face embeddings are cached between runs. By default, `<input-path>/.embedding-cache`",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Re-compute the embeddings of every image instead of reusing the cached ones",
+    )
+
+    parser.add_argument(
+        "--recognizer",
+        type=str,
+        default="svm",
+        choices=["svm", "gallery"],
+        help="Either a `NuSVC` classifier or an `EmbeddingGallery`, to which identities can be added without training",
+    )
+
+    parser.add_argument(
+        "--centroids",
+        action="store_true",
+        help="[gallery] Compare faces to the mean embedding of each identity instead of to every image",
+    )
+
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help="[gallery] Distance above which a face is predicted as `misc`, by default always predict the nearest",
+    )
+
+    parser.add_argument(
+        "--search",
+        type=str,
+        default=None,
+        choices=["grid", "random"],
+        help="[svm] Search the hyperparameters in `_SEARCH_SPACE` by cross-validation instead of using `_PARAMS`",
+    )
+
+    parser.add_argument(
+        "--n-iter", type=int, default=20, help="[random search] Number of configurations sampled at random"
+    )
+
+    parser.add_argument("--cv", type=int, default=5, help="[search] Number of cross-validation folds")
+
+    parser.add_argument(
+        "--n-jobs", type=int, default=-1, help="[search] Number of processes, by default one per CPU core"
+    )
+
     args = parser.parse_args()
 
+    search_options = [
+        f"--{name.replace('_', '-')}"
+        for name in ["search", "n_iter", "cv", "n_jobs"]
+        if getattr(args, name) != parser.get_default(name)
+    ]
+    if (args.recognizer == "gallery") and search_options:
+        parser.error(f"{', '.join(search_options)}: hyperparameter search is only available with `--recognizer svm`")
+
     output_filepath = Path(args.output_filepath)
 
     data_path = Path(args.input_path)
@@ -54,23 +124,50 @@ if __name__ == "__main__":
         ".pklz",
     ], f"The output file must have a suffix in `.pkl` or `.pklz` but got `{output_filepath.name}`."
 
+    cache_path = None if args.no_cache else Path(args.cache_path or data_path.joinpath(".embedding-cache"))
+
     # OBTAINING FACE EMBEDDIGNS AND LABELS
-    X_train, y_train = FeatureExtractor.prepare_data(train_path, pre_process=True, batch_size=32)
-    X_test, y_test = FeatureExtractor.prepare_data(test_path, pre_process=True, batch_size=32)
+    X_train, y_train = FeatureExtractor.prepare_data(train_path, cache_path=cache_path, pre_process=True, batch_size=32)
+    X_test, y_test = FeatureExtractor.prepare_data(test_path, cache_path=cache_path, pre_process=True, batch_size=32)
 
     # DEFINING MODEL
-    scaler = Normalizer(norm="l2")
-    clf = svm.NuSVC(**_PARAMS)
-    pipe = make_pipeline(scaler, clf)
+    if args.recognizer == "gallery":
+        params = dict(recognizer="gallery", use_centroids=args.centroids, threshold=args.threshold)
+        pipe = EmbeddingGallery(use_centroids=args.centroids, threshold=args.threshold)
+    else:
+        scaler = Normalizer(norm="l2")
+        clf = svm.NuSVC(**_PARAMS)
+        pipe = make_pipeline(scaler, clf)
 
     # TRAINING AND SAVING MODEL TO DISK
-    pipe.fit(X=X_train, y=y_train)
+    search_results = None
+    if args.search is not None:
+        base_params = {k: v for k, v in _PARAMS.items() if f"nusvc__{k}" not in _SEARCH_SPACE}
+        pipe, search_results = search_hyperparameters(
+            X=X_train,
+            y=y_train,
+            param_grid=_SEARCH_SPACE,
+            base_params=base_params,
+            n_iter=args.n_iter if args.search == "random" else None,
+            cv=args.cv,
+            n_jobs=args.n_jobs,
+        )
+        params = dict(base_params, **search_results[0]["params"])
+
+        logger.info(f"Best configuration: {search_results[0]}.")
+    else:
+        pipe.fit(X=X_train, y=y_train)
 
     performance = dict(accuracy_train=pipe.score(X=X_train, y=y_train), accuracy_test=pipe.score(X=X_test, y=y_test))
     performance = {k: float(format(v, ".4f")) for k, v in performance.items()}
 
     output_path = serialize_model(
-        model=pipe, parameters=params, performance=performance, dataset_path=data_path, output_path=output_filepath
+        model=pipe,
+        parameters=params,
+        performance=performance,
+        dataset_path=data_path,
+        output_path=output_filepath,
+        search_results=search_results,
     )
 
     logger.info(f"Saved serialized model at {output_path}...")
@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_CAMERA_FPS = 30.0
+
+
+class CameraSession:
+    def __init__(
+        self,
+        device: Union[int, str] = 0,
+        width: int = None,
+        height: int = None,
+        fps: float = None,
+        buffer_size: int = 1,
+        max_reconnects: int = 5,
+        reconnect_delay: float = 1.0,
+    ):
+        """
+        Video capture that stays open for the life of the process
+
+        Opening a camera re-initializes the device and lets its auto-exposure settle, which delays the next usable
+        frame. Instead of being reopened to get rid of the frames buffered during a slow recognition, the session is
+        kept open and those frames are dropped with `flush`. The camera is only reopened when a read actually fails,
+        for example because it was unplugged.
+
+        It can be used in place of a `cv2.VideoCapture`: it is opened on first use and exposes `read`, `isOpened` and
+        `release`. Once released, it is never reopened.
+
+        Parameters
+        ----------
+        device : Union[int, str], optional
+            Index or path of the camera, by default 0
+        width : int, optional
+            Width of the frames to request from the camera. If None, the camera's default is kept, by default None
+        height : int, optional
+            Height of the frames to request from the camera. If None, the camera's default is kept, by default None
+        fps : float, optional
+            Frame rate to request from the camera. If None, the camera's default is kept, by default None
+        buffer_size : int, optional
+            Number of frames buffered by the driver. Not every backend supports it, hence `flush`, by default 1
+        max_reconnects : int, optional
+            Number of attempts at reopening the camera after a failed read before giving up, by default 5
+        reconnect_delay : float, optional
+            Number of seconds to wait before the first attempt at reopening the camera, doubled after each failed
+            attempt, by default 1.0
+        """
+        self.device = device
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.buffer_size = buffer_size
+        self.max_reconnects = max_reconnects
+        self.reconnect_delay = reconnect_delay
+
+        self.n_reads = 0
+        self.n_flushed = 0
+        self.n_reconnects = 0
+
+        self._cap = None
+        self._closed = False
+        self._live_frame = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls, conf: dict = None) -> "CameraSession":
+        """
+        Method that creates a session from the `CAMERA` section of `conf/config.yml`
+
+        Parameters
+        ----------
+        conf : dict, optional
+            Keyword arguments of `CameraSession`, for example `dict(width=640, height=480, fps=15)`. If None, the
+            defaults are used, by default None
+        """
+        return cls(**(conf or dict()))
+
+    def _open(self) -> cv2.VideoCapture:
+        start = time.perf_counter()
+        cap = cv2.VideoCapture(self.device)
+
+        for prop, value in [
+            (cv2.CAP_PROP_FRAME_WIDTH, self.width),
+            (cv2.CAP_PROP_FRAME_HEIGHT, self.height),
+            (cv2.CAP_PROP_FPS, self.fps),
+            (cv2.CAP_PROP_BUFFERSIZE, self.buffer_size),
+        ]:
+            if (value is not None) and not cap.set(prop, value):
+                logger.debug(f"The camera does not support setting property {prop} to {value}.")
+
+        logger.info(
+            f"Opened camera {self.device} in {time.perf_counter() - start:.2f}s: "
+            f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))} "
+            f"at {cap.get(cv2.CAP_PROP_FPS):.0f} fps."
+        )
+
+        return cap
+
+    @property
+    def cap(self) -> Optional[cv2.VideoCapture]:
+        """Underlying video capture, opened on first use. None once the session is released"""
+        with self._lock:
+            if (self._cap is None) and not self._closed:
+                self._cap = self._open()
+
+            return self._cap
+
+    def isOpened(self) -> bool:
+        return (not self._closed) and self.cap.isOpened()
+
+    def read(self) -> Tuple[bool, np.array]:
+        """
+        Method that returns the next frame, reopening the camera if it cannot be read
+
+        Returns
+        -------
+        Tuple[bool, np.array]
+            Whether a frame was read and the frame, in BGR. (False, None) once the session is released, for example
+            because the camera could not be reopened after `max_reconnects` attempts.
+        """
+        with self._lock:
+            if self._closed:
+                return False, None
+
+            if self._live_frame is not None:
+                frame, self._live_frame = self._live_frame, None
+                self.n_reads += 1
+                return True, frame
+
+            ret, frame = self.cap.read()
+
+            delay = self.reconnect_delay
+            for _ in range(self.max_reconnects):
+                if ret:
+                    break
+
+                logger.warning(f"Could not read from camera {self.device}: reopening it in {delay:.1f}s...")
+                self._cap.release()
+                time.sleep(delay)
+                delay *= 2
+
+                self._cap = self._open()
+                self.n_reconnects += 1
+                ret, frame = self._cap.read()
+
+            if not ret:
+                logger.error(f"Camera {self.device} could not be reopened: closing the session.")
+                self.release()
+                return False, None
+
+            self.n_reads += 1
+
+        return ret, frame
+
+    def flush(self, max_frames: int = 10):
+        """
+        Method that drops the frames buffered by the driver, so that the next `read` returns a frame captured after the
+        call
+
+        Buffered frames are returned immediately, while a live frame takes up to a frame period to arrive: frames are
+        grabbed, without being decoded, until one takes more than half a frame period. That one is live: it is decoded
+        and returned by the next `read`, instead of waiting for another frame.
+
+        Parameters
+        ----------
+        max_frames : int, optional
+            Maximum number of frames to drop, by default 10
+        """
+        with self._lock:
+            if self._closed:
+                return
+
+            cap = self.cap
+            period = 1 / (cap.get(cv2.CAP_PROP_FPS) or _DEFAULT_CAMERA_FPS)
+            self._live_frame = None
+
+            for _ in range(max_frames):
+                start = time.perf_counter()
+
+                if not cap.grab():
+                    break
+
+                if time.perf_counter() - start > period / 2:
+                    ret, frame = cap.retrieve()
+                    self._live_frame = frame if ret else None
+                    break
+
+                self.n_flushed += 1
+
+    def release(self):
+        with self._lock:
+            self._closed = True
+            self._live_frame = None
+
+            if self._cap is not None:
+                self._cap.release()
+                self._cap = None
+
+    def __enter__(self) -> "CameraSession":
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def snapshot(self) -> dict:
+        """Method that returns the number of frames read and flushed, and the number of times the camera was reopened"""
+        return dict(n_reads=self.n_reads, n_flushed=self.n_flushed, n_reconnects=self.n_reconnects)
@@ -0,0 +1,84 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def _read_image(fp: Path) -> np.array:
+    """Function that decodes an image from disk into an array"""
+    with Image.open(fp) as im:
+        return np.array(im)
+
+
+class ImageBatchLoader:
+    def __init__(
+        self, fps: List[Path], labels: List[str], batch_size: int = 32, n_workers: int = 4, max_in_flight: int = 2
+    ):
+        """
+        Streaming loader yielding fixed-size batches of images decoded from disk
+
+        Images are decoded by a pool of threads, ahead of the consumer, so that decoding the next batches overlaps with
+        whatever is done with the current one (for example computing embeddings). At most `max_in_flight` batches are
+        being decoded or waiting to be consumed at any time, which bounds the memory used independently of the size
+        of the dataset.
+
+        Parameters
+        ----------
+        fps : List[Path]
+            Filepaths of the images to load
+        labels : List[str]
+            Labels of the images, in the same order as `fps`
+        batch_size : int, optional
+            Number of images per batch, by default 32
+        n_workers : int, optional
+            Number of threads decoding images, by default 4
+        max_in_flight : int, optional
+            Maximum number of batches decoded ahead of the consumer, by default 2
+        """
+        assert len(fps) == len(labels), f"Got {len(fps)} filepaths but {len(labels)} labels."
+        assert batch_size >= 1, f"`batch_size` must be at least 1 but got {batch_size}."
+        assert max_in_flight >= 1, f"`max_in_flight` must be at least 1 but got {max_in_flight}."
+
+        self.fps = list(fps)
+        self.labels = list(labels)
+        self.batch_size = batch_size
+        self.n_workers = n_workers
+        self.max_in_flight = max_in_flight
+
+    def __len__(self) -> int:
+        return (len(self.fps) + self.batch_size - 1) // self.batch_size
+
+    def _batches(self) -> Iterator[Tuple[List[Path], List[str]]]:
+        for start in range(0, len(self.fps), self.batch_size):
+            end = start + self.batch_size
+            yield self.fps[start:end], self.labels[start:end]
+
+    def __iter__(self) -> Iterator[Tuple[np.array, List[str]]]:
+        """
+        Iterates over the dataset
+
+        Yields
+        -------
+        Tuple[np.array, List[str]]
+            A batch of images, of shape (batch_size, height, width, channel), and their corresponding labels
+        """
+        batches = self._batches()
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            for fps, labels in batches:
+                pending.append(([executor.submit(_read_image, fp) for fp in fps], labels))
+
+                if len(pending) >= self.max_in_flight:
+                    futures, labels = pending.popleft()
+                    yield np.stack([f.result() for f in futures]), labels
+
+            while pending:
+                futures, labels = pending.popleft()
+                yield np.stack([f.result() for f in futures]), labels
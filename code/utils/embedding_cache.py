@@ -0,0 +1,224 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_CACHE_FILENAME = "embeddings.npz"
+# Format of the caches written before the index and the embeddings were saved together
+_LEGACY_EMBEDDINGS_FILENAME = "embeddings.npy"
+_LEGACY_INDEX_FILENAME = "index.json"
+_HASH_CHUNK_SIZE = 1024 ** 2
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model_id: str):
+        """
+        Persistent, content-addressed cache of face embeddings
+
+        Embeddings are stored as rows of a single `float32` array and an index maps each key to its row. Both are saved
+        in a single file (`embeddings.npz`), so that an index is never paired with the embeddings of another version of
+        the cache. A key is made of the identity of the model, the `pre_process` flag and the hash of the content of the
+        image, so that renaming an image does not invalidate its embedding but changing its content does.
+
+        Parameters
+        ----------
+        path : str
+            Directory where the cache is stored
+        model_id : str
+            Identity of the model used to compute the embeddings, for example "InceptionResnetV1-vggface2"
+        """
+        self.path = Path(path)
+        self.model_id = model_id
+
+        self._rows = dict()  # key -> row in `self._embeddings`
+        self._files = dict()  # filepath -> key
+        self._embeddings = None
+
+        self.load()
+
+    @property
+    def cache_path(self) -> Path:
+        return self.path.joinpath(_CACHE_FILENAME)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    @staticmethod
+    def hash_file(fp: str) -> str:
+        """
+        Method that returns the hash of the content of a file
+
+        Parameters
+        ----------
+        fp : str
+            Filepath to the file to hash
+
+        Returns
+        -------
+        str
+            Hexadecimal sha1 digest of the content of the file
+        """
+        digest = hashlib.sha1()
+
+        with open(fp, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def key(self, fp: str, pre_process: bool) -> str:
+        """
+        Method that returns the cache key of an image and records that `fp` currently points to that key
+
+        Parameters
+        ----------
+        fp : str
+            Filepath to the image
+        pre_process : bool
+            Whether the images are pre-processed before computing the embeddings
+
+        Returns
+        -------
+        str
+            Cache key of the image
+        """
+        key = f"{self.model_id}:{int(pre_process)}:{self.hash_file(fp)}"
+        self._files[str(fp)] = key
+
+        return key
+
+    def get(self, keys: List[str]) -> np.array:
+        """
+        Method that returns the embeddings stored under `keys`
+
+        Parameters
+        ----------
+        keys : List[str]
+            Keys of the embeddings to return. All of them must be in the cache.
+
+        Returns
+        -------
+        np.array
+            Embeddings, one row per key
+        """
+        rows = [self._rows[k] for k in keys]
+
+        return self._embeddings[rows]
+
+    def add(self, keys: List[str], embeddings: np.array):
+        """
+        Method that adds embeddings to the cache
+
+        Parameters
+        ----------
+        keys : List[str]
+            Keys of the embeddings to add
+        embeddings : np.array
+            Embeddings to add, one row per key
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        n_rows = 0 if self._embeddings is None else self._embeddings.shape[0]
+
+        for i, key in enumerate(keys):
+            self._rows[key] = n_rows + i
+
+        if self._embeddings is None:
+            self._embeddings = embeddings
+        else:
+            self._embeddings = np.vstack([self._embeddings, embeddings])
+
+    def evict_stale(self) -> int:
+        """
+        Method that removes the embeddings whose source files do not exist anymore or whose content changed
+
+        Returns
+        -------
+        int
+            Number of embeddings evicted
+        """
+        self._files = {fp: key for fp, key in self._files.items() if Path(fp).is_file()}
+
+        alive = sorted(set(self._files.values()) & set(self._rows), key=lambda k: self._rows[k])
+        n_evicted = len(self._rows) - len(alive)
+
+        if n_evicted > 0:
+            self._embeddings = self._embeddings[[self._rows[k] for k in alive]]
+            self._rows = {k: row for row, k in enumerate(alive)}
+            logger.info(f"Evicted {n_evicted} stale embeddings from {self.path}.")
+
+        return n_evicted
+
+    def _read(self) -> Tuple[dict, np.array]:
+        """Method that returns the index and the embeddings saved on disk, in either format, or (None, None)"""
+        if self.cache_path.is_file():
+            with np.load(self.cache_path) as npz:
+                return json.loads(str(npz["index"])), npz["embeddings"]
+
+        legacy_index_path = self.path.joinpath(_LEGACY_INDEX_FILENAME)
+        legacy_embeddings_path = self.path.joinpath(_LEGACY_EMBEDDINGS_FILENAME)
+
+        if legacy_index_path.is_file() and legacy_embeddings_path.is_file():
+            with open(legacy_index_path) as f:
+                return json.load(f), np.load(legacy_embeddings_path)
+
+        return None, None
+
+    def load(self):
+        """
+        Method that loads the cache from disk, if it exists
+
+        A cache whose index does not match its embeddings, for example because it was written by an interrupted
+        process with the previous format, is discarded: its embeddings are computed again rather than risking returning
+        the embedding of another image.
+        """
+        index, embeddings = self._read()
+
+        if index is None:
+            return
+
+        rows, files = index.get("rows") or dict(), index.get("files") or dict()
+
+        if sorted(rows.values()) != list(range(embeddings.shape[0])):
+            logger.warning(
+                f"The index of the embedding cache in {self.path} has {len(rows)} rows but {embeddings.shape[0]} "
+                "embeddings: discarding the cache."
+            )
+            return
+
+        self._rows = rows
+        self._files = files
+        self._embeddings = embeddings if rows else None
+
+        logger.info(f"Loaded {len(self)} cached embeddings from {self.path}.")
+
+    def save(self):
+        """
+        Method that writes the cache to disk
+
+        The index and the embeddings are written to a temporary file, which then replaces the cache atomically: an
+        interrupted write leaves the previous cache untouched.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        embeddings = self._embeddings if self._embeddings is not None else np.zeros((0, 0), dtype=np.float32)
+        index: Dict[str, dict] = dict(rows=self._rows, files=self._files)
+
+        tmp_path = self.cache_path.with_name(f".{self.cache_path.name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, index=np.array(json.dumps(index)), embeddings=embeddings)
+
+        os.replace(tmp_path, self.cache_path)
+
+        # Once migrated, the files of the previous format would be read if the new one was removed
+        for filename in [_LEGACY_EMBEDDINGS_FILENAME, _LEGACY_INDEX_FILENAME]:
+            if self.path.joinpath(filename).is_file():
+                self.path.joinpath(filename).unlink()
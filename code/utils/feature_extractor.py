@@ -1,19 +1,29 @@
 import logging
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
 
 import numpy as np
 import torch
-from facenet_pytorch import InceptionResnetV1, fixed_image_standardization
-from PIL import Image
 from tqdm import tqdm
+from utils import inference
+from utils.data_loader import ImageBatchLoader
+from utils.embedding_cache import EmbeddingCache
+from utils.model_registry import ModelRegistry
 
 logger = logging.getLogger(__name__)
 
+_DEFAULT_MODEL_ID = "InceptionResnetV1-vggface2"
+
 
 class FeatureExtractor:
     @staticmethod
-    def get_embeddings(arr: np.array, batch_size: int = 4, pre_process: bool = False) -> np.array:
+    def get_embeddings(
+        arr: np.array,
+        batch_size: int = 4,
+        pre_process: bool = False,
+        model: torch.nn.Module = None,
+        verbose: bool = True,
+    ) -> np.array:
         """
         Method that returns InceptionRestnetV1 embeddings as trained on VGGFace2
 
@@ -29,37 +39,165 @@ class FeatureExtractor:
             Whether to pre_process the images or not. Rule of thumb, if you loaded your images from disk and these
             images looked normal, you should opt for pre-processing the imag. By default False.
 
+        model: torch.nn.Module
+            Already loaded InceptionRestnetV1 to use. If None, the one shared by `ModelRegistry` is used, by default
+            None.
+
+        verbose: bool
+            Whether to display a progress bar, by default True.
+
         Returns
         -------
         np.array
             InceptionRestnetV1 embeddings as trained on VGGFace2
         """
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-        resnet = InceptionResnetV1(pretrained="vggface2").eval().to(device)
+        resnet = model if model is not None else ModelRegistry.get_resnet()
+        T = FeatureExtractor.to_tensor(arr=arr, pre_process=pre_process, device=inference.model_device(resnet))
+
+        if ModelRegistry.cpu_inference()["channels_last"]:
+            T = T.contiguous(memory_format=torch.channels_last)
+
+        n_batches = (T.shape[0] + batch_size - 1) // batch_size
+
+        with inference.inference_mode():
+            embeddings = [
+                resnet(T[batch_size * idx : batch_size * (idx + 1), :, :, :]).detach().cpu()
+                for idx in tqdm(range(n_batches), disable=not verbose)
+            ]
+
+        arr = np.vstack(embeddings)
+
+        return arr
+
+    @staticmethod
+    def to_tensor(arr: np.array, pre_process: bool = False, device: torch.device = None) -> torch.Tensor:
+        """
+        Method that returns images of faces as the ResNet expects them
+
+        Parameters
+        ----------
+        arr : np.array
+            Batch of images of faces, of shape (batch_size, channel, w, h) or (batch_size, w, h, channel)
+        pre_process : bool, optional
+            Whether to standardize the images, see `get_embeddings`, by default False
+        device : torch.device, optional
+            Device on which to put the images. If None, they stay on CPU, by default None
 
-        T = torch.Tensor(arr).to(device)
+        Returns
+        -------
+        torch.Tensor
+            Images, of shape (batch_size, channel, w, h)
+        """
+        T = torch.Tensor(arr).to(device or torch.device("cpu"))
 
         if T.shape[-1] == 3:
             T = T.permute(0, 3, 1, 2)
 
         if pre_process:
-            logger.info("Pre-processing images...")
+            from facenet_pytorch import fixed_image_standardization
+
+            logger.debug("Pre-processing images...")
             T = fixed_image_standardization(T)
 
-        n_batches = T.shape[0] // batch_size + 1
+        return T
 
-        with torch.no_grad():
-            embeddings = [
-                resnet(T[batch_size * idx : batch_size * (idx + 1), :, :, :]).detach().cpu()
-                for idx in tqdm(range(n_batches))
-            ]
+    @classmethod
+    def load_faces(cls, path: str, n_images: int = None, seed: int = 0) -> Tuple[np.array, List[str]]:
+        """
+        Method that loads the images of faces under each sub-directory of `path`, along with their labels
 
-        arr = np.vstack(embeddings)
+        Parameters
+        ----------
+        path : str
+            Directory with sub-directories. Each sub-directories contains `.png` of a single person to recognize.
+        n_images : int, optional
+            Number of images to sample at random. If None, all images are loaded, by default None
+        seed : int, optional
+            Seed of the sampling, by default 0
 
-        return arr
+        Returns
+        -------
+        Tuple[np.array, List[str]]
+            The images, of shape (N, w, h, channel), and their corresponding labels
+        """
+        fps, y = cls._list_images(Path(path))
+
+        if (n_images is not None) and (n_images < len(fps)):
+            idx = sorted(np.random.default_rng(seed).choice(len(fps), size=n_images, replace=False))
+            fps, y = [fps[i] for i in idx], [y[i] for i in idx]
+
+        assert len(fps) > 0, f"No `.png` image found under {path}."
+
+        return np.concatenate([X for X, _ in ImageBatchLoader(fps=fps, labels=y)]), y
+
+    @staticmethod
+    def _list_images(path: Path) -> Tuple[List[Path], List[str]]:
+        """
+        Method that lists the `.png` images under each sub-directory of `path`, along with their labels
+
+        Parameters
+        ----------
+        path : Path
+            Directory with sub-directories. Each sub-directories contains `.png` of a single person to recognize.
+
+        Returns
+        -------
+        Tuple[List[Path], List[str]]
+            The filepaths of the images and their corresponding labels
+        """
+        labels = sorted(x.name for x in path.iterdir() if x.is_dir() and not x.name.startswith("."))
+
+        fps = [fp for label in labels for fp in sorted(path.joinpath(label).glob("*.png"))]
+        y = [fp.parent.name for fp in fps]
+
+        return fps, y
 
     @classmethod
-    def prepare_data(cls, path: str, **kwargs) -> Tuple[np.array, np.array]:
+    def _embed_files(
+        cls, fps: List[Path], batch_size: int = 32, n_workers: int = 4, max_in_flight: int = 2, **kwargs
+    ) -> np.array:
+        """
+        Method that streams images from disk and returns their embeddings
+
+        Images are decoded by `ImageBatchLoader` while the previous batch goes through the ResNet, so that only
+        `max_in_flight` batches of images are held in memory at any time.
+
+        Parameters
+        ----------
+        fps : List[Path]
+            Filepaths of the images to embed
+        batch_size : int, optional
+            Number of images decoded and embedded at once, by default 32
+        n_workers : int, optional
+            Number of threads decoding images, by default 4
+        max_in_flight : int, optional
+            Maximum number of batches decoded ahead of the ResNet, by default 2
+
+        Returns
+        -------
+        np.array
+            Embeddings of the images, in the same order as `fps`
+        """
+        loader = ImageBatchLoader(
+            fps=fps, labels=fps, batch_size=batch_size, n_workers=n_workers, max_in_flight=max_in_flight
+        )
+
+        embeddings = [
+            cls.get_embeddings(arr=X, batch_size=batch_size, verbose=False, **kwargs) for X, _ in tqdm(loader)
+        ]
+
+        return np.vstack(embeddings)
+
+    @classmethod
+    def prepare_data(
+        cls,
+        path: str,
+        cache_path: str = None,
+        model_id: str = _DEFAULT_MODEL_ID,
+        n_workers: int = 4,
+        max_in_flight: int = 2,
+        **kwargs,
+    ) -> Tuple[np.array, np.array]:
         """
         Method that 1. gets the list of labels (for example, the name of the persons to recognize) and 2. extracts the
         `facenet` embeddings from the image from disk.
@@ -68,6 +206,17 @@ class FeatureExtractor:
         ----------
         path : str
             Directory with sub-directories. Each sub-directories contains `.png` of a single person to recognize.
+        cache_path : str, optional
+            Directory of the `EmbeddingCache` to use. When given, only the images that are new or whose content changed
+            are embedded and the embeddings of the others are read from the cache. If None, every image is embedded, by
+            default None.
+        model_id : str, optional
+            Identity of the model computing the embeddings, used as part of the cache key, by default
+            "InceptionResnetV1-vggface2".
+        n_workers : int, optional
+            Number of threads decoding images, by default 4
+        max_in_flight : int, optional
+            Maximum number of batches of images held in memory, by default 2
 
         Returns
         -------
@@ -80,16 +229,29 @@ class FeatureExtractor:
         "other" as its distinct category.
         """
         path = Path(path)
+        fps, y = cls._list_images(path=path)
+        loader_kwargs = dict(n_workers=n_workers, max_in_flight=max_in_flight, **kwargs)
+
+        if cache_path is None:
+            X = cls._embed_files(fps=fps, **loader_kwargs)
+
+            return X, y
+
+        cache = EmbeddingCache(path=cache_path, model_id=model_id)
+        keys = [cache.key(fp=fp, pre_process=kwargs.get("pre_process", False)) for fp in fps]
+
+        # An image may be present more than once in the dataset: only embed each missing content once
+        missing = {k: fp for k, fp in zip(keys, fps) if k not in cache}
+        logger.info(f"Embedding {len(missing)} new images out of {len(fps)} in {path}...")
 
-        labels = list(set([x.name for x in path.iterdir()]))
-        # Get a dictionary with 1 key per labels and an array of all images correspondings to that labels as its values
-        d = {k: np.array(list(map(np.array, map(Image.open, path.joinpath(k).glob("*.png"))))) for k in labels}
+        if missing:
+            cache.add(
+                keys=list(missing.keys()), embeddings=cls._embed_files(fps=list(missing.values()), **loader_kwargs)
+            )
 
-        # Create a single `numpy.array` with all images and get a corresponding array with the labels repeated
-        # appropriately.
-        X = np.vstack([x for x in d.values()])
-        y = [item for item, count in zip(d.keys(), [x.shape[0] for x in d.values()]) for i in range(count)]
+        cache.evict_stale()
+        cache.save()
 
-        X = cls.get_embeddings(arr=X, **kwargs)
+        X = cache.get(keys=keys)
 
         return X, y
@@ -1,32 +1,27 @@
+import functools
+import logging
+import time
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple, Union
 
 import cv2
-import mmcv
 import numpy as np
 import torch
-from facenet_pytorch import MTCNN
 from PIL import Image, ImageEnhance
+from utils import inference
+from utils.frame_source import FrameSource
+from utils.ledger import VideoLedger
+from utils.model_registry import ModelRegistry
 
-device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+logger = logging.getLogger(__name__)
 
-mtcnn_params = dict(
-    image_size=160,
-    margin=0,
-    min_face_size=30,
-    thresholds=[0.6, 0.7, 0.7],
-    factor=0.709,
-    post_process=False,
-    selection_method="probability",
-    select_largest=True,
-    keep_all=False,
-    device=device,
-)
-
-mtcnn = MTCNN(**mtcnn_params)
+# Counterclockwise rotations, as `Image.rotate`. Rotations by 180 degrees are done in place with `cv2.flip`
+_ROTATIONS = {90: cv2.ROTATE_90_COUNTERCLOCKWISE, 270: cv2.ROTATE_90_CLOCKWISE}
 
 
 class FrameExtractor(object):
+    _tuned_mtcnn_batch_size = None
+
     @staticmethod
     def get_video(fp: str) -> cv2.VideoCapture:
         """
@@ -141,6 +136,72 @@ class FrameExtractor(object):
 
         return im
 
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def brightness_lut(brightness_factor: float) -> np.array:
+        """
+        Method returning the lookup table scaling the brightness of a `uint8` image, as `ImageEnhance.Brightness`
+
+        PIL blends the image with a black one in single precision and truncates the result: computing the table in
+        double precision, or rounding it, is off by one for some pixel values and factors, for example 0.7 and 1.3.
+        """
+        lut = np.arange(256, dtype=np.float32) * np.float32(brightness_factor)
+
+        return np.clip(lut, 0, 255).astype(np.uint8)
+
+    @classmethod
+    def preprocess_arr(
+        cls,
+        arr: np.array,
+        height_offset: int = 100,
+        rotation: int = 180,
+        brightness_factor: float = None,
+        conversion: int = None,
+    ) -> np.array:
+        """
+        Method preprocessing a frame like `preprocess_im`, without converting it to a PIL image and back
+
+        The crop is a view of `arr`. Every other step writes into the copy made by the first of them, so a frame is
+        copied once (twice for rotations by 90 or 270 degrees), instead of once per step with PIL.
+
+        Parameters
+        ----------
+        arr : np.array
+            Frame to be preprocessed, of shape (h, w, channel) or (h, w), of type `uint8`
+        height_offset : int, optional
+            `height_offset` will be cropped from the top of the frame, before `rotation`, by default 100
+        rotation : int, optional
+            Rotate the frame counterclockwise by `rotation` degrees, a multiple of 90. Unlike `Image.rotate`, rotating
+            by 90 or 270 degrees swaps the width and the height of the frame, by default 180
+        brightness_factor : float, optional
+            Factor by which to scale the brightness by. If None, leave the brightness unadjusted, by default None
+        conversion : int, optional
+            `cv2.cvtColor` code of the color conversion to apply, for example `cv2.COLOR_BGR2RGB`. If None, the colors
+            are left unchanged, by default None
+
+        Returns
+        -------
+        np.array
+            Frame preprocessed
+        """
+        assert rotation % 90 == 0, f"`rotation` must be a multiple of 90 but got {rotation}."
+
+        arr = arr[height_offset:]
+        copied = False
+
+        if conversion is not None:
+            arr, copied = cv2.cvtColor(arr, conversion), True
+
+        if rotation % 360 == 180:
+            arr, copied = cv2.flip(arr, -1, dst=arr if copied else None), True
+        elif rotation % 360 != 0:
+            arr, copied = cv2.rotate(arr, _ROTATIONS[rotation % 360]), True
+
+        if brightness_factor is not None:
+            arr = cv2.LUT(arr, cls.brightness_lut(brightness_factor), dst=arr if copied else None)
+
+        return arr
+
     @staticmethod
     def get_largest_face(faces: List[tuple]) -> tuple:
         max_area = 0
@@ -175,72 +236,136 @@ class FrameExtractor(object):
 
         return im
 
+    @classmethod
+    def _detect_largest_face(cls, face_cascade: cv2.CascadeClassifier, frame: np.array) -> Tuple[Image.Image, tuple]:
+        """
+        Method that preprocesses a video frame and detects the largest face in it with a haar cascade
+
+        Parameters
+        ----------
+        face_cascade : cv2.CascadeClassifier
+            Haar cascade used for detecting faces
+        frame : np.array
+            Frame read from the video, in BGR
+
+        Returns
+        -------
+        Tuple[Image.Image, tuple]
+            Tuple of the preprocessed frame and the coordinates `(x, y, w, h)` of its largest face. The coordinates are
+            None if no face was detected.
+        """
+        arr = cls.preprocess_arr(arr=frame, height_offset=100, rotation=180, brightness_factor=None)
+        gray = cv2.cvtColor(arr, cv2.COLOR_BGR2GRAY)
+
+        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+        face = cls.get_largest_face(faces=faces) if len(faces) >= 1 else None
+
+        return Image.fromarray(arr), face
+
     @classmethod
     def find_frames_with_faces(cls, cap: cv2.VideoCapture, model_path: str, frame_step: int = 5) -> List[dict]:
 
         model_path = str(model_path)
         face_cascade = cv2.CascadeClassifier(model_path)
 
-        idx = -1
         frame_with_face_idx = []
-        while cap.isOpened():
-            idx += 1
-            ret, frame = cap.read()
-
-            if ret != True:
-                cls._close_video(cap=cap)
-                return frame_with_face_idx
-            elif idx % frame_step != 0:
-                continue
-            else:
-                im = Image.fromarray(frame)
-                im = cls.preprocess_im(im=im, height_offset=100, rotation=180, brightness_factor=None)
-
-                gray = cv2.cvtColor(np.array(im), cv2.COLOR_BGR2GRAY)
-
-                faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-                if len(faces) >= 1:
-                    face = cls.get_largest_face(faces=faces)
-                    tmp_dict = dict(idx=idx, face=face)
-                    frame_with_face_idx.append(tmp_dict)
+        for idx, frame in FrameSource(src=cap, frame_step=frame_step):
+            _, face = cls._detect_largest_face(face_cascade=face_cascade, frame=frame)
+
+            if face is not None:
+                tmp_dict = dict(idx=idx, face=face)
+                frame_with_face_idx.append(tmp_dict)
+
+        cls._close_video(cap=cap)
+
+        return frame_with_face_idx
 
     @classmethod
     def _extract_faces_cascade(
-        cls, to: str, src: str, model_path: str, scale: float, frame_step: int = 5, rm_faceless: bool = False
+        cls,
+        to: str,
+        src: str,
+        model_path: str,
+        scale: float,
+        frame_step: int = 5,
+        rm_faceless: bool = False,
+        fps: float = None,
     ):
-        Path.mkdir(to, parents=True, exist_ok=True)
+        """
+        Method that extracts faces from a video with a haar cascade and saves them to disk
+
+        The video is decoded once, sequentially: each face is cropped and saved as soon as it is detected, instead of
+        seeking back to the frames with faces once the whole video was scanned.
+
+        Parameters
+        ----------
+        to : str
+            Directory where to save the images of the faces
+        src : str
+            Filepath to the video
+        model_path : str
+            Filepath to the haar cascade `.xml`
+        scale : float
+            Scaling factor to crop a larger crop than just the face, see `_crop_face`
+        frame_step : int, optional
+            Only look for faces in one frame out of `frame_step`, by default 5
+        rm_faceless : bool, optional
+            Whether to delete the video if no face was found in it, by default False
+        fps : float, optional
+            If given, look for faces in `fps` frames per second of video instead of one frame out of `frame_step`, by
+            default None
+
+        Returns
+        -------
+        Dict[str, int]
+            Number of frames read from the video (`n_frames`), of frames in which faces were looked for (`n_sampled`)
+            and of faces saved (`n_faces`)
+        """
         to = Path(to)
+        to.mkdir(parents=True, exist_ok=True)
         fname = Path(src).stem
 
-        cap = cls.get_video(fp=src)
-        frame_with_face_idx = cls.find_frames_with_faces(cap=cap, model_path=model_path, frame_step=frame_step)
+        face_cascade = ModelRegistry.get_face_cascade(model_path=model_path)
+        frames = FrameSource(src=src, frame_step=frame_step, fps=fps)
 
-        cap = cls.get_video(fp=src)
-        for i, frame_info in enumerate(frame_with_face_idx):
-            fn = fname + f"_{i}.png"
-            fn = to.joinpath(fn)
+        n_faces = 0
+        for _, frame in frames:
+            im, face = cls._detect_largest_face(face_cascade=face_cascade, frame=frame)
 
-            idx = frame_info.get("idx")
-            (x, y, w, h) = frame_info.get("face")
+            if face is not None:
+                (x, y, w, h) = face
+                im = cls._crop_face(im=im, x=x, y=y, w=w, h=h, scale=scale)
+                im.save(to.joinpath(fname + f"_{n_faces}.png"))
+                n_faces += 1
 
-            im = cls.get_one_frame(cap=cap, frame_no=idx)
-            im = cls._crop_face(im=im, x=x, y=y, w=w, h=h, scale=scale)
-            im.save(fn)
+        cls._close_video(cap=frames.cap)
 
-        cls._close_video(cap=cap)
-
-        if (rm_faceless) and (not frame_with_face_idx):
+        if (rm_faceless) and (n_faces == 0):
             Path(src).unlink()
 
+        return dict(n_frames=frames.n_grabbed, n_sampled=frames.n_decoded, n_faces=n_faces)
+
     @classmethod
-    def get_face_mtcnn(cls, im: Image, brightness_factor: int = 2.5) -> np.array:
-        faces = None
+    def _mtcnn_input(cls, im: Union[Image.Image, np.array], brightness_factor: int) -> Image.Image:
+        """Method converting an image in BGR to the brightened RGB image expected by MTCNN, with a single copy"""
+        arr = cls.preprocess_arr(
+            arr=np.asarray(im),
+            height_offset=0,
+            rotation=0,
+            brightness_factor=brightness_factor,
+            conversion=cv2.COLOR_BGR2RGB,
+        )
 
-        arr = np.array(im)
-        im = Image.fromarray(cv2.cvtColor(arr, cv2.COLOR_BGR2RGB))
-        im = cls.preprocess_im(im=im, height_offset=0, rotation=0, brightness_factor=brightness_factor)
+        return Image.fromarray(arr)
 
-        boxes, boxes_probability = mtcnn.detect(im)
+    @classmethod
+    def get_face_mtcnn(cls, im: Union[Image.Image, np.array], brightness_factor: int = 2.5) -> np.array:
+        faces = None
+        im = cls._mtcnn_input(im=im, brightness_factor=brightness_factor)
+
+        mtcnn = ModelRegistry.get_mtcnn()
+        with inference.inference_mode():
+            boxes, boxes_probability = mtcnn.detect(im)
 
         if (boxes_probability[0] is not None) and (boxes_probability[0] > 0.95):
             boxes = boxes[0][None, :]
@@ -248,68 +373,385 @@ class FrameExtractor(object):
 
         return faces
 
+    @classmethod
+    def get_faces_mtcnn(
+        cls, im: Union[Image.Image, np.array], brightness_factor: int = 2.5, min_probability: float = 0.95
+    ) -> Tuple[torch.Tensor, np.array]:
+        """
+        Method that extracts every face of an image with MTCNN, in a single pass
+
+        Unlike `get_face_mtcnn`, which only keeps the most probable face, every face detected with a probability above
+        `min_probability` is kept, so that a group of people can be recognized with a single batch.
+
+        Parameters
+        ----------
+        im : Union[Image.Image, np.array]
+            Image, in BGR
+        brightness_factor : int, optional
+            Factor by which to scale the brightness of the image, by default 2.5
+        min_probability : float, optional
+            Minimum probability of a face to be kept, by default 0.95
+
+        Returns
+        -------
+        Tuple[torch.Tensor, np.array]
+            Faces, of shape (n_faces, channel, w, h), and their coordinates `(x, y, w, h)` in `im`. (None, None) if no
+            face was found
+        """
+        from facenet_pytorch import fixed_image_standardization
+        from facenet_pytorch.models.utils.detect_face import extract_face
+
+        im = cls._mtcnn_input(im=im, brightness_factor=brightness_factor)
+
+        mtcnn = ModelRegistry.get_mtcnn()
+        with inference.inference_mode():
+            boxes, boxes_probability = mtcnn.detect(im)
+
+        if boxes is None:
+            return None, None
+
+        boxes = boxes[np.asarray(boxes_probability) > min_probability]
+        if len(boxes) == 0:
+            return None, None
+
+        # `MTCNN.extract` only keeps the first box when the MTCNN is not built with `keep_all`
+        faces = torch.stack([extract_face(im, box, mtcnn.image_size, mtcnn.margin) for box in boxes])
+        if mtcnn.post_process:
+            faces = fixed_image_standardization(faces)
+
+        coordinates = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]]).astype(int)
+
+        return faces, coordinates
+
+    @staticmethod
+    def _expand_box(face: tuple, margin: float, width: int, height: int) -> Tuple[int, int, int, int]:
+        """
+        Method that returns the box of a face, enlarged by `margin` on each side and clipped to the image
+
+        Parameters
+        ----------
+        face : tuple
+            Coordinates `(x, y, w, h)` of the face
+        margin : float
+            Fraction of the width (resp. height) of the face added to its left and right (resp. top and bottom)
+        width : int
+            Width of the image
+        height : int
+            Height of the image
+
+        Returns
+        -------
+        Tuple[int, int, int, int]
+            Box `(left, upper, right, lower)`, as expected by `Image.crop`
+        """
+        x, y, w, h = face
+        dx, dy = int(w * margin), int(h * margin)
+
+        return max(0, x - dx), max(0, y - dy), min(width, x + w + dx), min(height, y + h + dy)
+
+    @classmethod
+    def get_face_mtcnn_roi(
+        cls, im: Union[Image.Image, np.array], face: tuple, margin: float = 0.5, brightness_factor: int = 2.5
+    ) -> np.array:
+        """
+        Method that extracts a face with MTCNN, only looking in the region of a face already found by the haar cascade
+
+        Most of the cost of MTCNN comes from scanning the whole image pyramid with its P-Net. Running it on the region
+        of interest only is much cheaper. If MTCNN does not confirm the face in that region, the whole image is used.
+
+        Parameters
+        ----------
+        im : Union[Image.Image, np.array]
+            Image in which the face was detected, in BGR
+        face : tuple
+            Coordinates `(x, y, w, h)` of the face in `im`, for example from `get_largest_face`
+        margin : float, optional
+            Fraction of the size of the face added on each side of it, so that MTCNN sees the whole face, by default 0.5
+        brightness_factor : int, optional
+            Factor by which to scale the brightness of the image, by default 2.5
+
+        Returns
+        -------
+        np.array
+            Face extracted by MTCNN, or None if no face was found
+        """
+        arr = np.asarray(im)
+        height, width = arr.shape[:2]
+        left, upper, right, lower = cls._expand_box(face=face, margin=margin, width=width, height=height)
+
+        # Only the region of interest is converted to RGB and brightened
+        faces = cls.get_face_mtcnn(im=arr[upper:lower, left:right], brightness_factor=brightness_factor)
+
+        if faces is None:
+            logger.debug("MTCNN found no face in the region of interest: falling back to the whole image.")
+            faces = cls.get_face_mtcnn(im=arr, brightness_factor=brightness_factor)
+
+        return faces
+
+    @staticmethod
+    def _extract_batch_mtcnn(ims: List[Image.Image], save_paths: List[Path]) -> List[bool]:
+        """
+        Method that detects faces in a batch of images of the same size with MTCNN and saves the ones detected with a
+        probability above 0.95
+
+        Parameters
+        ----------
+        ims : List[Image.Image]
+            Images, in RGB, all of the same size
+        save_paths : List[Path]
+            Filepath where to save the face extracted from each image
+
+        Returns
+        -------
+        List[bool]
+            Whether a face was saved, for each image
+        """
+        mtcnn = ModelRegistry.get_mtcnn()
+        with inference.inference_mode():
+            batch_boxes, batch_probability = mtcnn.detect(ims)
+
+        # The probability filter is applied per image. Images without a face are passed to `extract` with no box,
+        # which skips them.
+        batch_boxes = [
+            boxes[0][None, :] if (probability[0] is not None) and (probability[0] > 0.95) else None
+            for boxes, probability in zip(batch_boxes, batch_probability)
+        ]
+
+        faces = mtcnn.extract(img=ims, batch_boxes=batch_boxes, save_path=[str(fp) for fp in save_paths])
+
+        return [face is not None for face in faces]
+
+    @classmethod
+    def autotune_mtcnn_batch_size(
+        cls,
+        src: str,
+        candidates: Tuple[int, ...] = (1, 2, 4, 8, 16),
+        frame_step: int = 5,
+        brightness_factor: int = 2.5,
+    ) -> int:
+        """
+        Method that returns the batch size for which MTCNN detects faces the fastest on this machine
+
+        The frames of `src` are preprocessed once, then MTCNN is timed on the same frames with each candidate batch
+        size. The result is kept for the life of the process, so that tuning only happens once.
+
+        Parameters
+        ----------
+        src : str
+            Filepath to a video representative of the ones to process
+        candidates : Tuple[int, ...], optional
+            Batch sizes to try, by default (1, 2, 4, 8, 16)
+        frame_step : int, optional
+            Sample one frame out of `frame_step` from `src`, by default 5
+        brightness_factor : int, optional
+            Factor by which to scale the brightness of each frame, by default 2.5
+
+        Returns
+        -------
+        int
+            The fastest batch size
+        """
+        if cls._tuned_mtcnn_batch_size is not None:
+            return cls._tuned_mtcnn_batch_size
+
+        n_frames = 2 * max(candidates)
+        ims = []
+        with FrameSource(src=src, frame_step=frame_step) as frames:
+            for _, frame in frames:
+                arr = cls.preprocess_arr(
+                    arr=frame,
+                    height_offset=100,
+                    rotation=180,
+                    brightness_factor=brightness_factor,
+                    conversion=cv2.COLOR_BGR2RGB,
+                )
+                ims.append(Image.fromarray(arr))
+
+                if len(ims) == n_frames:
+                    break
+
+        if not ims:
+            return 1
+
+        mtcnn = ModelRegistry.get_mtcnn()
+        with inference.inference_mode():
+            mtcnn.detect(ims[:1])  # Warm up
+
+            frames_per_second = dict()
+            for batch_size in candidates:
+                start = time.perf_counter()
+                for i in range(0, len(ims), batch_size):
+                    mtcnn.detect(ims[i : i + batch_size])
+
+                frames_per_second[batch_size] = len(ims) / (time.perf_counter() - start)
+
+        logger.info(f"MTCNN frames/sec per batch size: {frames_per_second}")
+        cls._tuned_mtcnn_batch_size = max(frames_per_second, key=frames_per_second.get)
+
+        return cls._tuned_mtcnn_batch_size
+
     @classmethod
     def _extract_faces_mtcnn(
-        cls, to: str, src: str, frame_step: int = 5, rm_faceless: bool = False, brightness_factor: int = 2.5
+        cls,
+        to: str,
+        src: str,
+        frame_step: int = 5,
+        rm_faceless: bool = False,
+        brightness_factor: int = 2.5,
+        fps: float = None,
+        batch_size: Union[int, str] = 1,
     ):
+        """
+        Method that extracts faces from a video with MTCNN and saves them to disk
 
-        Path.mkdir(to, parents=True, exist_ok=True)
+        Parameters
+        ----------
+        to : str
+            Directory where to save the images of the faces
+        src : str
+            Filepath to the video
+        frame_step : int, optional
+            Only look for faces in one frame out of `frame_step`, by default 5
+        rm_faceless : bool, optional
+            Whether to delete the video if no face was found in it, by default False
+        brightness_factor : int, optional
+            Factor by which to scale the brightness of each frame, by default 2.5
+        fps : float, optional
+            If given, look for faces in `fps` frames per second of video instead of one frame out of `frame_step`, by
+            default None
+        batch_size : Union[int, str], optional
+            Number of frames passed to MTCNN at once. If "auto", use the fastest batch size on this machine, as found by
+            `autotune_mtcnn_batch_size`, by default 1
+
+        Returns
+        -------
+        Dict[str, int]
+            Number of frames read from the video (`n_frames`), of frames in which faces were looked for (`n_sampled`)
+            and of faces saved (`n_faces`)
+        """
         to = Path(to)
+        to.mkdir(parents=True, exist_ok=True)
         fname = Path(src).stem
 
-        cap = mmcv.VideoReader(str(src))
+        if batch_size == "auto":
+            batch_size = cls.autotune_mtcnn_batch_size(
+                src=src, frame_step=frame_step, brightness_factor=brightness_factor
+            )
 
-        idx = -1
-        frame_with_face_idx = []
-        for idx, frame in enumerate(cap):
-            idx += 1
+        frames = FrameSource(src=src, frame_step=frame_step, fps=fps)
 
-            if idx % frame_step != 0:
-                continue
-            else:
-                save_to_file = to.joinpath(fname + f"_{idx}.png")
+        frame_with_face_idx = []
+        batch = []
+        for idx, frame in frames:
+            arr = cls.preprocess_arr(
+                arr=frame,
+                height_offset=100,
+                rotation=180,
+                brightness_factor=brightness_factor,
+                conversion=cv2.COLOR_BGR2RGB,
+            )
+            batch.append((idx, Image.fromarray(arr)))
+
+            if len(batch) == batch_size:
+                frame_with_face_idx += cls._extract_batch_and_get_idx(batch=batch, to=to, fname=fname)
+                batch = []
+
+        if batch:
+            frame_with_face_idx += cls._extract_batch_and_get_idx(batch=batch, to=to, fname=fname)
+
+        cls._close_video(cap=frames.cap)
 
-                im = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                im = cls.preprocess_im(im=im, height_offset=100, rotation=180, brightness_factor=brightness_factor)
+        if (rm_faceless) and (not frame_with_face_idx):
+            Path(src).unlink()
 
-                boxes, boxes_probability = mtcnn.detect(im)
+        return dict(n_frames=frames.n_grabbed, n_sampled=frames.n_decoded, n_faces=len(frame_with_face_idx))
 
-                if (boxes_probability[0] is not None) and (boxes_probability[0] > 0.95):
-                    boxes = boxes[0][None, :]
-                    faces = mtcnn.extract(img=im, batch_boxes=boxes, save_path=str(save_to_file))
+    @classmethod
+    def _extract_batch_and_get_idx(cls, batch: List[Tuple[int, Image.Image]], to: Path, fname: str) -> List[int]:
+        """Method that runs `_extract_batch_mtcnn` on a batch of `(frame index, image)` and returns the indices of the
+        frames in which a face was saved"""
+        idx, ims = zip(*batch)
+        save_paths = [to.joinpath(fname + f"_{i}.png") for i in idx]
 
-                    if faces is not None:
-                        frame_with_face_idx.append(idx)
+        has_face = cls._extract_batch_mtcnn(ims=list(ims), save_paths=save_paths)
 
-        if (rm_faceless) and (not frame_with_face_idx):
-            Path(src).unlink()
+        return [i for i, saved in zip(idx, has_face) if saved]
 
     @classmethod
-    def extract_faces(cls, to: str, src: str, detector: str, frame_step: int = 5, rm_faceless: bool = False, **kwargs):
+    def extract_faces(
+        cls, to: str, src: str, detector: str, frame_step: int = 5, rm_faceless: bool = False, **kwargs
+    ) -> Dict[str, int]:
+        """
+        Method that extracts faces from a video and saves them to disk
+
+        Parameters
+        ----------
+        to : str
+            Directory where to save the images of the faces
+        src : str
+            Filepath to the video
+        detector : str
+            Either "cascade" (see `_extract_faces_cascade`, which requires `model_path` and `scale`) or "mtcnn" (see
+            `_extract_faces_mtcnn`)
+        frame_step : int, optional
+            Only look for faces in one frame out of `frame_step`, by default 5
+        rm_faceless : bool, optional
+            Whether to delete the video if no face was found in it, by default False
+
+        Returns
+        -------
+        Dict[str, int]
+            Number of frames read from the video (`n_frames`), of frames in which faces were looked for (`n_sampled`)
+            and of faces saved (`n_faces`)
+        """
         assert detector.lower() in ["cascade", "mtcnn"], (
-            f"Error: `detector` expected to be in ['cascade', 'mtcnn']" + " but got {detector}."
+            f"Error: `detector` expected to be in ['cascade', 'mtcnn']" + f" but got {detector}."
         )
 
         src = Path(src)
 
         if detector.lower() == "cascade":
-            cls._extract_faces_cascade(to=to, scr=src, frame_step=frame_step, rm_faceless=rm_faceless, **kwargs)
+            return cls._extract_faces_cascade(to=to, src=src, frame_step=frame_step, rm_faceless=rm_faceless, **kwargs)
         elif detector.lower() == "mtcnn":
-            cls._extract_faces_mtcnn(to=to, src=src, frame_step=frame_step, rm_faceless=rm_faceless, **kwargs)
+            return cls._extract_faces_mtcnn(to=to, src=src, frame_step=frame_step, rm_faceless=rm_faceless, **kwargs)
 
     @staticmethod
-    def delete_processed_videos(videos_path: str, output_path: str):
+    def delete_processed_videos(videos_path: str, output_path: str, ledger_path: str = None):
+        """
+        Method that deletes the videos from which faces were already extracted
+
+        Parameters
+        ----------
+        videos_path : str
+            Directory with the videos
+        output_path : str
+            Directory where the images of the faces were saved
+        ledger_path : str, optional
+            Filepath to the `VideoLedger` of the videos. If given, the videos marked as processed in it are deleted and
+            `output_path` is not scanned. If None, a video is considered processed if an image named after it is in
+            `output_path`, by default None
+        """
+        videos_path = Path(videos_path)
+
+        if ledger_path is not None:
+            with VideoLedger(path=ledger_path) as ledger:
+                processed_videos_list = [x for x in ledger.processed_videos() if x.parent == videos_path.resolve()]
+
+                for x in processed_videos_list:
+                    if x.exists():
+                        x.unlink()
+                    ledger.mark_deleted(path=x)
 
-        videos_list = Path(videos_path).glob("*.mp4")
-        output_list = [str(x) for x in Path(output_path).glob("*.png")]
+        else:
+            # Images are named `<video stem>_<index>.png`
+            processed_stems = {x.stem.rsplit("_", 1)[0] for x in Path(output_path).glob("*.png")}
+            processed_videos_list = [x for x in videos_path.glob("*.mp4") if x.stem in processed_stems]
 
-        processed_videos_list = [x for x in videos_list if str(x.stem) in "\t".join(output_list)]
+            _ = [x.unlink() for x in processed_videos_list]
 
         n_vid_to_delete = len(processed_videos_list)
         plural = "s" if n_vid_to_delete > 1 else ""
-        print(f"Deleting {n_vid_to_delete} file{plural}...")
-
-        _ = [x.unlink() for x in processed_videos_list]
+        print(f"Deleted {n_vid_to_delete} file{plural}...")
 
 
 if __name__ == "__main__":
@@ -320,4 +762,7 @@ if __name__ == "__main__":
     vid_path = f"/home/{user}/pikrellcam/media/videos"
     img_path = "/data/faces/mixed"
 
-    FrameExtractor.delete_processed_videos(videos_path=vid_path, output_path=img_path)
+    ledger_path = Path(img_path).joinpath(".ledger.sqlite")
+    ledger_path = ledger_path if ledger_path.is_file() else None
+
+    FrameExtractor.delete_processed_videos(videos_path=vid_path, output_path=img_path, ledger_path=ledger_path)
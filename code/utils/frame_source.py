@@ -0,0 +1,97 @@
+import logging
+from pathlib import Path
+from typing import Iterator, Tuple, Union
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_VIDEO_FPS = 25.0
+
+
+class FrameSource:
+    def __init__(self, src: Union[str, Path, cv2.VideoCapture], frame_step: int = 1, fps: float = None):
+        """
+        Iterator over the sampled frames of a video
+
+        Frames are sampled either by index (one frame out of `frame_step`) or by time (`fps` frames per second of
+        video). Skipped frames are only grabbed (`cv2.VideoCapture.grab`): they are not converted to BGR nor copied into
+        a `numpy.array`, which is only done, with `cv2.VideoCapture.retrieve`, for the sampled frames.
+
+        Parameters
+        ----------
+        src : Union[str, Path, cv2.VideoCapture]
+            Filepath to the video, or video capture already opened
+        frame_step : int, optional
+            Sample one frame out of `frame_step`. Ignored if `fps` is given, by default 1
+        fps : float, optional
+            Number of frames to sample per second of video. If None, frames are sampled by index, by default None
+        """
+        assert frame_step >= 1, f"`frame_step` must be at least 1 but got {frame_step}."
+        assert (fps is None) or (fps > 0), f"`fps` must be positive but got {fps}."
+
+        self.cap = src if isinstance(src, cv2.VideoCapture) else cv2.VideoCapture(str(src))
+        self.frame_step = frame_step
+        self.fps = fps
+
+        self.n_grabbed = 0
+        self.n_decoded = 0
+
+    @property
+    def video_fps(self) -> float:
+        """Frame rate of the video. Some containers do not report it, in which case 25 fps is assumed."""
+        return self.cap.get(cv2.CAP_PROP_FPS) or _DEFAULT_VIDEO_FPS
+
+    @property
+    def n_frames(self) -> int:
+        """Number of frames of the video, as reported by its container"""
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def __enter__(self) -> "FrameSource":
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def release(self):
+        self.cap.release()
+
+    def __iter__(self) -> Iterator[Tuple[int, np.array]]:
+        """
+        Iterates over the sampled frames
+
+        Yields
+        -------
+        Tuple[int, np.array]
+            Index of the frame in the video and the frame, in BGR
+        """
+        video_fps = self.video_fps
+        next_sample_time = 0.0
+
+        idx = -1
+        while self.cap.isOpened():
+            idx += 1
+
+            if not self.cap.grab():
+                break
+
+            self.n_grabbed += 1
+
+            if self.fps is None:
+                if idx % self.frame_step != 0:
+                    continue
+            else:
+                if idx / video_fps < next_sample_time:
+                    continue
+
+                next_sample_time += 1 / self.fps
+
+            ret, frame = self.cap.retrieve()
+
+            if not ret:
+                break
+
+            self.n_decoded += 1
+
+            yield idx, frame
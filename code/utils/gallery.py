@@ -0,0 +1,192 @@
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+UNKNOWN_LABEL = "misc"
+
+
+def _l2_normalize(X: np.array) -> np.array:
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+
+    return X / np.maximum(norms, np.finfo(np.float32).eps)
+
+
+class EmbeddingGallery(object):
+    # Its arrays are only read by NumPy, and replaced rather than modified: `utils.model.load_model` can memory-map them
+    memory_mappable = True
+
+    def __init__(self, use_centroids: bool = False, threshold: float = None, unknown_label: str = UNKNOWN_LABEL):
+        """
+        Face recognition model that compares a face embedding to a gallery of known embeddings
+
+        Embeddings are L2-normalized and stored in a single contiguous array, so that a query is answered with one
+        matrix product. Identities are added or removed without retraining. The gallery follows the scikit-learn
+        `fit`/`predict`/`score` interface and is serialized with `utils.model.serialize_model`, so `PeoplesAnthem` loads
+        it like the `NuSVC` pipeline.
+
+        Parameters
+        ----------
+        use_centroids : bool, optional
+            Whether to compare queries to the normalized mean embedding of each identity instead of to every embedding
+            of the gallery, by default False
+        threshold : float, optional
+            Euclidean distance, between normalized embeddings, above which a face is predicted as `unknown_label`. This
+            is an alternative to training with a `misc` class. If None, the nearest identity is always predicted, by
+            default None
+        unknown_label : str, optional
+            Label predicted for faces further than `threshold` from the gallery, by default "misc"
+        """
+        self.use_centroids = use_centroids
+        self.threshold = threshold
+        self.unknown_label = unknown_label
+
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._labels = np.empty((0,), dtype=str)
+        self._centroids = np.empty((0, 0), dtype=np.float32)
+        self.classes_ = np.empty((0,), dtype=str)
+
+    def __len__(self) -> int:
+        return self._embeddings.shape[0]
+
+    def _update_centroids(self):
+        self.classes_, y_idx = np.unique(self._labels, return_inverse=True)
+
+        if not self.use_centroids or len(self) == 0:
+            self._centroids = np.empty((0, self._embeddings.shape[1]), dtype=np.float32)
+            return
+
+        sums = np.zeros((len(self.classes_), self._embeddings.shape[1]), dtype=np.float32)
+        np.add.at(sums, y_idx, self._embeddings)
+        self._centroids = _l2_normalize(sums)
+
+    def fit(self, X: np.array, y: Iterable[str]) -> "EmbeddingGallery":
+        """
+        Method that replaces the gallery with the embeddings `X` of identities `y`
+
+        Parameters
+        ----------
+        X : np.array
+            Face embeddings, of shape (N, 512)
+        y : Iterable[str]
+            Identity of each embedding
+
+        Returns
+        -------
+        EmbeddingGallery
+            The gallery itself
+        """
+        self._embeddings = np.empty((0, np.shape(X)[1]), dtype=np.float32)
+        self._labels = np.empty((0,), dtype=str)
+
+        return self.add(X=X, y=y)
+
+    def add(self, X: np.array, y: Iterable[str]) -> "EmbeddingGallery":
+        """
+        Method that enrolls new embeddings, of new or known identities
+
+        Parameters
+        ----------
+        X : np.array
+            Face embeddings, of shape (N, 512)
+        y : Iterable[str]
+            Identity of each embedding
+
+        Returns
+        -------
+        EmbeddingGallery
+            The gallery itself
+        """
+        X = _l2_normalize(X)
+        y = np.asarray(list(y), dtype=str)
+        assert X.shape[0] == y.shape[0], f"Got {X.shape[0]} embeddings but {y.shape[0]} labels."
+
+        if len(self) == 0:
+            self._embeddings = X
+        else:
+            self._embeddings = np.ascontiguousarray(np.concatenate([self._embeddings, X]))
+        self._labels = np.concatenate([self._labels, y])
+        self._update_centroids()
+
+        return self
+
+    def remove(self, labels: Iterable[str]) -> "EmbeddingGallery":
+        """
+        Method that removes every embedding of identities `labels`
+
+        Parameters
+        ----------
+        labels : Iterable[str]
+            Identities to remove from the gallery
+
+        Returns
+        -------
+        EmbeddingGallery
+            The gallery itself
+        """
+        keep = ~np.isin(self._labels, list(labels))
+
+        self._embeddings = np.ascontiguousarray(self._embeddings[keep])
+        self._labels = self._labels[keep]
+        self._update_centroids()
+
+        return self
+
+    def kneighbors(self, X: np.array) -> Tuple[np.array, np.array]:
+        """
+        Method that returns the nearest identity of each query, and its distance
+
+        Parameters
+        ----------
+        X : np.array
+            Face embeddings, of shape (N, 512)
+
+        Returns
+        -------
+        Tuple[np.array, np.array]
+            Nearest identity of each embedding and euclidean distance to it, between normalized embeddings
+        """
+        assert len(self) > 0, "The gallery is empty."
+
+        if self.use_centroids:
+            references, labels = self._centroids, self.classes_
+        else:
+            references, labels = self._embeddings, self._labels
+
+        similarities = _l2_normalize(X) @ references.T
+        nearest = np.argmax(similarities, axis=1)
+
+        # For unit vectors, ||a - b||² = 2 - 2 a·b
+        cosine = similarities[np.arange(similarities.shape[0]), nearest]
+        distances = np.sqrt(np.maximum(2 - 2 * cosine, 0))
+
+        return labels[nearest], distances
+
+    def predict(self, X: np.array) -> np.array:
+        """
+        Method that returns the identity of each face embedding
+
+        Parameters
+        ----------
+        X : np.array
+            Face embeddings, of shape (N, 512)
+
+        Returns
+        -------
+        np.array
+            Identity of each embedding, or `unknown_label` if it is further than `threshold` from the gallery
+        """
+        labels, distances = self.kneighbors(X)
+
+        if self.threshold is not None:
+            labels = np.where(distances > self.threshold, self.unknown_label, labels)
+
+        return labels
+
+    def score(self, X: np.array, y: Iterable[str]) -> float:
+        """Method that returns the accuracy of the predictions on `X`"""
+        return float(np.mean(self.predict(X) == np.asarray(list(y), dtype=str)))
+
+    def identities(self) -> List[str]:
+        """Method that returns the identities in the gallery"""
+        return list(self.classes_)
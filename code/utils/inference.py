@@ -0,0 +1,206 @@
+import copy
+import logging
+import platform
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = [None, "dynamic", "static"]
+
+# Context manager under which models run: `torch.inference_mode` skips the autograd bookkeeping that `torch.no_grad`
+# still does, but it was only added in torch 1.9
+inference_mode = getattr(torch, "inference_mode", torch.no_grad)
+
+# Layers of InceptionResnetV1 after the convolutional trunk, which are kept in float32 by static quantization
+_RESNET_FLOAT_MODULES = ["last_linear", "last_bn", "logits"]
+
+
+def supports_static_quantization() -> bool:
+    """
+    Function returning whether the installed torch has the FX graph mode quantization used by `quantize_static`
+
+    It was added in torch 1.13: the torch 1.6 wheel of the Pipfile, for the Raspberry Pi, only supports dynamic
+    quantization.
+    """
+    try:
+        import torch.ao.quantization.quantize_fx  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+def check_quantization(quantization: str = None):
+    """
+    Function that raises an error if the quantization mode `quantization` cannot run with the installed torch, so that
+    it fails before any model or calibration image is loaded
+
+    Raises
+    ------
+    RuntimeError
+        If `quantization` is "static" and the installed torch does not support it, see `supports_static_quantization`
+    """
+    assert quantization in QUANTIZATION_MODES, f"`quantization` must be in {QUANTIZATION_MODES} but got {quantization}."
+
+    if (quantization == "static") and not supports_static_quantization():
+        raise RuntimeError(
+            f"Static quantization requires torch >= 1.13, but torch {torch.__version__} is installed. "
+            "Use dynamic quantization instead."
+        )
+
+
+def _quantization_engine() -> str:
+    """Function returning the quantized kernels to use: QNNPACK on ARM (Raspberry Pi), FBGEMM on x86"""
+    engines = torch.backends.quantized.supported_engines
+    engine = "qnnpack" if platform.machine().lower().startswith(("arm", "aarch")) else "fbgemm"
+
+    return engine if engine in engines else engines[-1]
+
+
+def set_n_threads(n_threads: int = None):
+    """
+    Function that sets the number of threads used by each operation, for example a convolution
+
+    Parameters
+    ----------
+    n_threads : int, optional
+        Number of intra-op threads. If None, torch's default (one per physical core) is kept, by default None
+    """
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+        logger.info(f"Using {torch.get_num_threads()} intra-op threads.")
+
+
+def model_device(model: torch.nn.Module) -> torch.device:
+    """Function returning the device of `model`. Quantized models have no float parameters and always run on CPU."""
+    parameter = next(model.parameters(), None)
+
+    return parameter.device if parameter is not None else torch.device("cpu")
+
+
+def quantize_dynamic(model: torch.nn.Module) -> torch.nn.Module:
+    """Function returning a copy of `model` whose linear layers use int8 weights, and int8 kernels at runtime"""
+    return torch.quantization.quantize_dynamic(copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model: torch.nn.Module, calibration: torch.Tensor, batch_size: int = 16) -> torch.nn.Module:
+    """
+    Function returning a copy of the InceptionResnetV1 `model` whose convolutional trunk is quantized to int8
+
+    The scale of the activations of each layer is calibrated by running `calibration` through the model. Dynamic
+    quantization only applies to linear layers, while most of the time of InceptionResnetV1 is spent in convolutions.
+
+    Requires torch >= 1.13, see `supports_static_quantization`.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        InceptionResnetV1, in evaluation mode
+    calibration : torch.Tensor
+        Pre-processed faces, representative of the ones to recognize, of shape (N, 3, 160, 160)
+    batch_size : int, optional
+        Batch size used for running `calibration` through the model, by default 16
+
+    Returns
+    -------
+    torch.nn.Module
+        Quantized model, which runs on CPU
+    """
+    check_quantization(quantization="static")
+
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = _quantization_engine()
+    torch.backends.quantized.engine = engine
+
+    qconfig_mapping = get_default_qconfig_mapping(engine)
+    for name in _RESNET_FLOAT_MODULES:
+        qconfig_mapping = qconfig_mapping.set_module_name(name, None)
+
+    model = copy.deepcopy(model).cpu().eval()
+    calibration = calibration.cpu()
+    prepared = prepare_fx(model, qconfig_mapping, example_inputs=(calibration[:1],))
+
+    with inference_mode():
+        for i in range(0, calibration.shape[0], batch_size):
+            prepared(calibration[i : i + batch_size])
+
+    return convert_fx(prepared)
+
+
+def optimize_resnet(
+    model: torch.nn.Module,
+    quantization: str = None,
+    channels_last: bool = False,
+    calibration: torch.Tensor = None,
+) -> torch.nn.Module:
+    """
+    Function returning the InceptionResnetV1 `model` optimized for CPU inference
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        InceptionResnetV1, in evaluation mode
+    quantization : str, optional
+        Either None (float32), "dynamic" (int8 linear layers) or "static" (int8 convolutions, calibrated on
+        `calibration`, torch >= 1.13 only), by default None
+    channels_last : bool, optional
+        Whether to store the weights in the channels-last memory format, which is faster for convolutions on CPU, by
+        default False
+    calibration : torch.Tensor, optional
+        Pre-processed faces used for calibrating static quantization, by default None
+
+    Returns
+    -------
+    torch.nn.Module
+        Optimized model. `model` itself if nothing is to optimize.
+    """
+    assert quantization in QUANTIZATION_MODES, f"`quantization` must be in {QUANTIZATION_MODES} but got {quantization}."
+
+    if quantization == "static":
+        assert calibration is not None, "Static quantization requires `calibration` images."
+        model = quantize_static(model, calibration=calibration)
+    elif quantization == "dynamic":
+        model = quantize_dynamic(model)
+
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+
+    return model
+
+
+def optimize_mtcnn(mtcnn: torch.nn.Module, quantization: str = None, channels_last: bool = False) -> torch.nn.Module:
+    """
+    Function returning the facenet_pytorch `MTCNN` optimized for CPU inference
+
+    Only the linear layers of its refinement (R-Net) and output (O-Net) networks are quantized: `"static"` falls back to
+    dynamic quantization, since MTCNN's networks are small and mostly made of PReLU activations, which have no int8
+    kernels.
+
+    Parameters
+    ----------
+    mtcnn : torch.nn.Module
+        facenet_pytorch `MTCNN`
+    quantization : str, optional
+        Either None (float32), "dynamic" or "static", by default None
+    channels_last : bool, optional
+        Whether to store the weights of the convolutions in the channels-last memory format, by default False
+
+    Returns
+    -------
+    torch.nn.Module
+        Optimized `MTCNN`
+    """
+    assert quantization in QUANTIZATION_MODES, f"`quantization` must be in {QUANTIZATION_MODES} but got {quantization}."
+
+    if quantization is not None:
+        mtcnn.rnet = quantize_dynamic(mtcnn.rnet)
+        mtcnn.onet = quantize_dynamic(mtcnn.onet)
+
+    if channels_last:
+        for net in [mtcnn.pnet, mtcnn.rnet, mtcnn.onet]:
+            net.to(memory_format=torch.channels_last)
+
+    return mtcnn
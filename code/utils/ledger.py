@@ -0,0 +1,144 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    path TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    n_frames INTEGER,
+    n_sampled INTEGER,
+    n_faces INTEGER,
+    error TEXT,
+    n_attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+)
+"""
+
+# Ledgers created before `n_attempts` was recorded: each of their videos was attempted once
+_MIGRATION = "ALTER TABLE videos ADD COLUMN n_attempts INTEGER NOT NULL DEFAULT 1"
+
+PROCESSING = "processing"
+PROCESSED = "processed"
+FAILED = "failed"
+DELETED = "deleted"
+
+
+def _key(path: str) -> str:
+    """Function returning the key of a video in the ledger: its absolute path"""
+    return str(Path(path).resolve())
+
+
+class VideoLedger:
+    def __init__(self, path: str):
+        """
+        Persistent record, in SQLite, of the videos from which faces were extracted
+
+        Each video is recorded with its status (`processing`, `processed`, `failed` or `deleted`), the number of
+        times its extraction was attempted and the number of frames read, frames sampled and faces saved. This lets new
+        videos, and failed ones to retry, be found, and processed videos be deleted, without scanning the directory of
+        extracted faces.
+
+        Parameters
+        ----------
+        path : str
+            Filepath to the SQLite database. It is created if it does not exist.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute(_SCHEMA)
+        if "n_attempts" not in {row[1] for row in self._conn.execute("PRAGMA table_info(videos)")}:
+            self._conn.execute(_MIGRATION)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self) -> "VideoLedger":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _set(self, path: str, status: str, stats: Dict[str, int] = None, error: str = None):
+        stats = stats or dict()
+
+        # Each attempt starts by marking the video as `processing`: the number of attempts is kept across statuses
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO videos "
+                "(path, status, n_frames, n_sampled, n_faces, error, n_attempts, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, COALESCE((SELECT n_attempts FROM videos WHERE path = ?), 0) + ?, ?)",
+                (
+                    _key(path),
+                    status,
+                    stats.get("n_frames"),
+                    stats.get("n_sampled"),
+                    stats.get("n_faces"),
+                    error,
+                    _key(path),
+                    int(status == PROCESSING),
+                    time.time(),
+                ),
+            )
+
+    def mark_processing(self, path: str):
+        self._set(path=path, status=PROCESSING)
+
+    def mark_processed(self, path: str, stats: Dict[str, int]):
+        self._set(path=path, status=PROCESSED, stats=stats)
+
+    def mark_failed(self, path: str, error: str):
+        self._set(path=path, status=FAILED, error=error)
+
+    def mark_deleted(self, path: str):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE videos SET status = ?, updated_at = ? WHERE path = ?", (DELETED, time.time(), _key(path))
+            )
+
+    def new_videos(self, paths: Iterable[Path], max_retries: int = 0) -> List[Path]:
+        """
+        Method that returns the videos that were never ingested. Videos left `processing` by an interrupted run are
+        considered new, and so are failed videos that were not retried `max_retries` times yet.
+
+        Parameters
+        ----------
+        paths : Iterable[Path]
+            Filepaths to the videos
+        max_retries : int, optional
+            Number of times the extraction of a failed video is retried, by default 0
+
+        Returns
+        -------
+        List[Path]
+            Filepaths of the videos that are not in the ledger or are to retry, in the same order as `paths`
+        """
+        assert max_retries >= 0, f"`max_retries` must be non-negative, got {max_retries}."
+
+        known = {
+            row[0]
+            for row in self._conn.execute(
+                "SELECT path FROM videos WHERE status != ? AND NOT (status = ? AND n_attempts <= ?)",
+                (PROCESSING, FAILED, max_retries),
+            )
+        }
+
+        return [p for p in paths if _key(p) not in known]
+
+    def processed_videos(self) -> List[Path]:
+        """Method that returns the videos whose faces were extracted and that are not deleted yet"""
+        rows = self._conn.execute("SELECT path FROM videos WHERE status = ? ORDER BY path", (PROCESSED,))
+
+        return [Path(row[0]) for row in rows]
+
+    def summary(self) -> Dict[str, dict]:
+        """Method that returns, for each status, the number of videos, frames and faces"""
+        rows = self._conn.execute(
+            "SELECT status, COUNT(*), SUM(n_frames), SUM(n_faces) FROM videos GROUP BY status ORDER BY status"
+        )
+
+        return {row[0]: dict(n_videos=row[1], n_frames=row[2] or 0, n_faces=row[3] or 0) for row in rows}
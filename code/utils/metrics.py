@@ -0,0 +1,275 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in milliseconds, of the buckets of the latency histograms. The last bucket has no upper bound.
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class Histogram:
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS_MS):
+        """
+        Thread-safe histogram of latencies, with fixed buckets so that its memory does not grow with the number of
+        observations
+
+        Parameters
+        ----------
+        buckets : List[float], optional
+            Upper bounds of the buckets, in milliseconds, by default `LATENCY_BUCKETS_MS`
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Method that returns the upper bound of the bucket in which the quantile `q` falls, or the max if above all"""
+        with self._lock:
+            counts, count, maximum = list(self.counts), self.count, self.max
+
+        if count == 0:
+            return None
+
+        rank, cumulative = q * count, 0
+        for bound, n in zip(self.buckets + [maximum], counts):
+            cumulative += n
+            if cumulative >= rank:
+                return min(bound, maximum)
+
+        return maximum
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, count, total, maximum = list(self.counts), self.count, self.total, self.max
+
+        return dict(
+            count=count,
+            mean_ms=round(total / count, 2) if count else None,
+            max_ms=round(maximum, 2),
+            p50_ms=self.quantile(0.5),
+            p90_ms=self.quantile(0.9),
+            p99_ms=self.quantile(0.99),
+            buckets={str(bound): n for bound, n in zip(self.buckets + ["inf"], counts)},
+        )
+
+
+@contextmanager
+def _noop() -> Iterator[None]:
+    yield
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Latency histograms and counters of the live loop, exposed on a local HTTP endpoint and as JSON snapshots
+
+        Metrics are disabled until `enable` is called: until then, `measure` returns a no-op context manager and
+        `increment` and `observe` return immediately. Use the module-level `metrics` so that every module records into
+        the same place.
+        """
+        self.enabled = False
+        self.histograms = dict()
+        self.counters = dict()
+        self.collectors = dict()
+
+        self._start = time.time()
+        self._lock = threading.Lock()
+        self._server = None
+        self._stop = threading.Event()
+
+    def enable(self) -> "Metrics":
+        self.enabled = True
+
+        return self
+
+    def observe(self, name: str, ms: float):
+        """Method that records a latency of `ms` milliseconds in the histogram `name`"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            histogram = self.histograms[name]
+
+        histogram.observe(ms)
+
+    def increment(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def measure(self, name: str):
+        """Method that returns a context manager recording the latency of its block in the histogram `name`"""
+        if not self.enabled:
+            return _noop()
+
+        return self._measure(name)
+
+    @contextmanager
+    def _measure(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name=name, ms=(time.perf_counter() - start) * 1000)
+
+    def add_collector(self, name: str, collector: Callable[[], dict]):
+        """Method that adds the result of `collector`, called at each snapshot, to the snapshots under `name`"""
+        with self._lock:
+            self.collectors[name] = collector
+
+    def snapshot(self) -> dict:
+        """Method that returns every histogram, counter and collected statistic"""
+        with self._lock:
+            histograms, counters, collectors = dict(self.histograms), dict(self.counters), dict(self.collectors)
+
+        return dict(
+            timestamp=time.time(),
+            uptime_seconds=round(time.time() - self._start, 1),
+            latency={name: h.snapshot() for name, h in sorted(histograms.items())},
+            counters=dict(sorted(counters.items())),
+            **{name: collector() for name, collector in collectors.items()},
+        )
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> "Metrics":
+        """
+        Method that serves `snapshot`, as JSON, on `http://<host>:<port>/metrics` from a background thread
+
+        Parameters
+        ----------
+        port : int
+            Port of the endpoint
+        host : str, optional
+            Interface of the endpoint. By default, only reachable from the device itself, by default "127.0.0.1"
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{self._server.server_port}/metrics")
+
+        return self
+
+    def write_snapshots(self, path: str, interval: float = 60.0) -> "Metrics":
+        """
+        Method that writes `snapshot` to `path` every `interval` seconds, from a background thread
+
+        The file is replaced atomically, so that it always holds a complete snapshot.
+
+        Parameters
+        ----------
+        path : str
+            Filepath to the JSON snapshot
+        interval : float, optional
+            Number of seconds between two snapshots, by default 60.0
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+
+        def _run():
+            while not self._stop.wait(timeout=interval):
+                with open(tmp_path, "w") as f:
+                    json.dump(self.snapshot(), f, indent=2)
+                os.replace(tmp_path, path)
+
+        threading.Thread(target=_run, name="metrics-snapshots", daemon=True).start()
+
+        return self
+
+    def shutdown(self):
+        self._stop.set()
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+metrics = Metrics()
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    """Function adding the arguments of `setup_metrics` to the command line `parser` of an entry point"""
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve latencies and counters of the live loop, as JSON, on http://127.0.0.1:<port>/metrics",
+    )
+    parser.add_argument(
+        "--metrics-snapshot-path",
+        type=str,
+        default=None,
+        help="Filepath of a JSON file where to periodically write latencies and counters of the live loop",
+    )
+    parser.add_argument(
+        "--metrics-interval", type=float, default=60.0, help="Number of seconds between two metrics snapshots"
+    )
+
+
+def setup_metrics(args: argparse.Namespace) -> Metrics:
+    """
+    Function that enables `metrics`, and serves them or writes snapshots of them, if requested by the arguments added
+    by `add_metrics_arguments`. Otherwise, metrics stay disabled and cost nothing
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed command line arguments
+
+    Returns
+    -------
+    Metrics
+        The `metrics` singleton
+    """
+    if (args.metrics_port is None) and (args.metrics_snapshot_path is None):
+        return metrics
+
+    metrics.enable()
+
+    if args.metrics_port is not None:
+        metrics.serve(port=args.metrics_port)
+    if args.metrics_snapshot_path is not None:
+        metrics.write_snapshots(path=args.metrics_snapshot_path, interval=args.metrics_interval)
+
+    return metrics
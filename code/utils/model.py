@@ -1,23 +1,55 @@
-import pickle
+import json
+import os
 import random
-import sys
 from pathlib import Path
+from typing import Any, Iterator, List, Tuple
 
 import joblib
 import numpy as np
 import pandas as pd
 import sklearn.pipeline
-import torch
 
 _BYTES_TO_MB = 1024 ** 2
+_HEADER_SUFFIX = ".meta.json"
+_FORMAT_VERSION = 2
+
+
+def _header_path(path: str) -> Path:
+    """Function returning the filepath to the metadata header of the model saved at `path`"""
+    path = Path(path)
+
+    return path.with_name(f"{path.name}{_HEADER_SUFFIX}")
+
+
+def _memory_mappable(model: Any) -> bool:
+    """
+    Function returning whether the arrays of `model` can be memory-mapped read-only when it is loaded
+
+    Only models declaring a `memory_mappable` attribute are, like `EmbeddingGallery` whose arrays are only read by
+    NumPy. Compiled estimators, for example the `NuSVC` whose support vectors are passed to libsvm, need writable
+    arrays.
+    """
+    return bool(getattr(model, "memory_mappable", False))
 
 
 def serialize_model(
-    model: sklearn.pipeline, parameters: dict, performance: dict, dataset_path: str, output_path: str
+    model: sklearn.pipeline,
+    parameters: dict,
+    performance: dict,
+    dataset_path: str,
+    output_path: str,
+    search_results: List[dict] = None,
+    compress: bool = False,
+    extra_metadata: dict = None,
 ) -> dict:
     """
     Function returning a dictionary to be saved to disk with the model and its corresponding metadata
 
+    The dictionary is saved with `joblib` at `output_path`. Its metadata is also saved, with the size of the model, in
+    a small JSON header next to it (`<output_path>.meta.json`), so that it can be read with `read_metadata` without
+    loading the model. Unless `compress`, the arrays of the model are saved uncompressed so that `load_model` can
+    memory-map them instead of reading them, if the model supports it (see `_memory_mappable`).
+
     Parameters
     ----------
     model : sklearn.pipeline
@@ -25,11 +57,19 @@ def serialize_model(
     parameters : dict
         Dictionary of parameters used for training `model`.
     performance : dict
-        Dictionary of `model` performance on train/test dataset
+        Dictionary of `model` performance on train/test dataset. None if it is unknown, for example once identities
+        were enrolled in a gallery without being evaluated
     dataset_path : str
         Path to dataset used to trained the model
     output_path: str
         Path where to save the model
+    search_results: List[dict], optional
+        Results of every configuration tried by `utils.search.search_hyperparameters`, by default None
+    compress: bool, optional
+        Whether to gzip the model, as done before the header was introduced. Compressed models are smaller but cannot
+        be memory-mapped, by default False
+    extra_metadata: dict, optional
+        Additional metadata, for example when identities were last enrolled, by default None
 
     Returns
     -------
@@ -40,24 +80,144 @@ def serialize_model(
     d = dict()
     metadata = dict()
 
-    model_size_mb = format(sys.getsizeof(pickle.dumps(model)) / _BYTES_TO_MB, ".4f")
-    metadata["model_size_mb"] = model_size_mb
     metadata["parameters"] = parameters
     metadata["performance"] = performance
-    metadata["dataset_path"] = dataset_path
+    metadata["dataset_path"] = str(dataset_path)
+    metadata["classes"] = [str(c) for c in getattr(model, "classes_", [])]
+    if search_results is not None:
+        metadata["search_results"] = search_results
+    metadata.update(extra_metadata or dict())
 
     d["model"] = model
     d["metadata"] = metadata
 
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(d, str(output_path), compress=("gzip", 3))
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first: the previous model may be memory-mapped by a running process
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    joblib.dump(d, str(tmp_path), compress=("gzip", 3) if compress else 0)
+    model_size_mb = tmp_path.stat().st_size / _BYTES_TO_MB
+
+    header = dict(
+        metadata,
+        model_size_mb=format(model_size_mb, ".4f"),
+        compressed=compress,
+        memory_mappable=(not compress) and _memory_mappable(model),
+    )
+    header["format_version"] = _FORMAT_VERSION
+
+    tmp_header_path = tmp_path.with_name(f"{tmp_path.name}{_HEADER_SUFFIX}")
+    with open(tmp_header_path, "w") as f:
+        json.dump(header, f, indent=2, default=str)
+
+    os.replace(tmp_path, output_path)
+    os.replace(tmp_header_path, _header_path(output_path))
 
     return output_path
 
 
-def compute_distance(X: np.array, y: np.array, k: int = 15):
+def read_metadata(path: str) -> dict:
+    """
+    Function returning the metadata of the model saved at `path` by `serialize_model`
+
+    Parameters
+    ----------
+    path : str
+        Filepath to the model
+
+    Returns
+    -------
+    dict
+        Metadata of the model. It is read from the header, without loading the model, unless the model was saved
+        without one.
+    """
+    header_path = _header_path(path)
+
+    if header_path.is_file():
+        with open(header_path) as f:
+            return json.load(f)
+
+    return joblib.load(path).get("metadata")
+
+
+def load_model(path: str, mmap: bool = True) -> Any:
     """
-    Function that prints distance between extracted faces
+    Function returning the model saved at `path` by `serialize_model`
+
+    Parameters
+    ----------
+    path : str
+        Filepath to the model
+    mmap : bool, optional
+        Whether to memory-map, read-only, the arrays of the models that support it instead of reading them. Other
+        models, including the `NuSVC` pipeline, compressed models and models saved without a header, are always read,
+        by default True
+
+    Returns
+    -------
+    Any
+        Face recognition model, for example a `sklearn.pipeline.Pipeline`
+    """
+    header_path = _header_path(path)
+    memory_mappable = False
+
+    if header_path.is_file():
+        with open(header_path) as f:
+            memory_mappable = json.load(f).get("memory_mappable", False)
+
+    mmap_mode = "r" if (mmap and memory_mappable) else None
+
+    return joblib.load(str(path), mmap_mode=mmap_mode).get("model")
+
+
+def iter_distance_blocks(X: np.array, chunk_size: int = 1024) -> Iterator[Tuple[int, np.array]]:
+    """
+    Function that iterates over the pairwise euclidean distances of `X`, one block of rows at a time
+
+    Distances are computed with `||a - b||² = ||a||² + ||b||² - 2 a·b`, so each block is a single matrix product.
+    Only a `chunk_size` x N block is in memory at once, instead of the whole N x N matrix.
+
+    Parameters
+    ----------
+    X : np.array
+        Embeddings, of shape (N, D)
+    chunk_size : int, optional
+        Number of rows per block, by default 1024
+
+    Yields
+    -------
+    Tuple[int, np.array]
+        Index of the first row of the block and the distances between these rows and all of `X`, of shape
+        (chunk_size, N)
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    sq_norms = np.einsum("ij,ij->i", X, X)
+
+    for start in range(0, X.shape[0], chunk_size):
+        block = X[start : start + chunk_size]
+
+        sq_dists = sq_norms[start : start + chunk_size, None] + sq_norms[None, :] - 2 * (block @ X.T)
+        # Rounding errors can make the squared distance of an embedding to itself slightly negative
+        np.maximum(sq_dists, 0, out=sq_dists)
+
+        yield start, np.sqrt(sq_dists, out=sq_dists)
+
+
+def compute_distance(
+    X: np.array,
+    y: np.array,
+    k: int = 15,
+    n_neighbors: int = 5,
+    duplicate_threshold: float = 0.1,
+    chunk_size: int = 1024,
+    verbose: bool = True,
+) -> dict:
+    """
+    Function that analyses the distance between extracted faces
+
+    The N x N distance matrix is never materialized: distances are computed by blocks of `chunk_size` rows (see
+    `iter_distance_blocks`) and reduced to per-class statistics, nearest-neighbour lists and near-duplicate pairs.
 
     Parameters
     ----------
@@ -67,11 +227,103 @@ def compute_distance(X: np.array, y: np.array, k: int = 15):
         Labels corresponding to X, for example: `np.array(["alice", "bob", "alice"])`.
     k : int, optional
         Print distance between `k` randomly selected images from `X`, by default 15
+    n_neighbors : int, optional
+        Number of nearest neighbours kept for each image, by default 5
+    duplicate_threshold : float, optional
+        Pairs of images closer than `duplicate_threshold` are reported as near-duplicates, by default 0.1
+    chunk_size : int, optional
+        Number of rows of the distance matrix computed at once, by default 1024
+    verbose : bool, optional
+        Whether to print the sample of distances and a summary of the analysis, by default True
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys:
+        - `mean` and `std`: `pd.DataFrame` of the mean and standard deviation of the distances between the images of
+          each pair of classes. Intra-class statistics are on the diagonal.
+        - `neighbors` and `neighbors_distance`: indices of, and distances to, the `n_neighbors` nearest images of each
+          image, sorted by distance
+        - `neighbors_accuracy`: share of nearest neighbours with the same label as the image
+        - `duplicates`: `pd.DataFrame` of the near-duplicate pairs, with columns `i`, `j`, `label_i`, `label_j` and
+          `distance`
     """
-    T = torch.Tensor(X)
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y)
+    n = X.shape[0]
+    n_neighbors = min(n_neighbors, n - 1)
+
+    classes, y_idx = np.unique(y, return_inverse=True)
+    one_hot = np.eye(len(classes), dtype=np.float64)[y_idx]
+    class_sizes = one_hot.sum(axis=0)
+
+    sums = np.zeros((len(classes), len(classes)))
+    sq_sums = np.zeros((len(classes), len(classes)))
+    neighbors = np.empty((n, n_neighbors), dtype=np.int64)
+    neighbors_distance = np.empty((n, n_neighbors), dtype=np.float32)
+    duplicates = []
+
+    for start, D in iter_distance_blocks(X, chunk_size=chunk_size):
+        rows = np.arange(start, start + D.shape[0])
+
+        # Sum the distances by pair of classes: (rows by class of the row) @ (distances) @ (columns by class)
+        sums += one_hot[rows].T @ (D @ one_hot)
+        sq_sums += one_hot[rows].T @ ((D * D) @ one_hot)
+
+        # Ignore the distance of each image to itself
+        D[np.arange(D.shape[0]), rows] = np.inf
+
+        i, j = np.nonzero(D < duplicate_threshold)
+        keep = (start + i) < j
+        duplicates.extend(zip(start + i[keep], j[keep], D[i[keep], j[keep]]))
+
+        if n_neighbors > 0:
+            nn = np.argpartition(D, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            nn_dist = np.take_along_axis(D, nn, axis=1)
+            order = np.argsort(nn_dist, axis=1)
+
+            neighbors[rows] = np.take_along_axis(nn, order, axis=1)
+            neighbors_distance[rows] = np.take_along_axis(nn_dist, order, axis=1)
+
+    # Number of pairs of distinct images for each pair of classes
+    counts = np.outer(class_sizes, class_sizes) - np.diag(class_sizes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sums / counts
+        std = np.sqrt(np.maximum(sq_sums / counts - mean ** 2, 0))
+
+    i, j, dist = zip(*duplicates) if duplicates else ([], [], [])
+    duplicates = pd.DataFrame(
+        dict(i=i, j=j, label_i=y[list(i)], label_j=y[list(j)], distance=dist),
+        columns=["i", "j", "label_i", "label_j", "distance"],
+    ).sort_values("distance", ignore_index=True)
+
+    results = dict(
+        mean=pd.DataFrame(mean, index=classes, columns=classes),
+        std=pd.DataFrame(std, index=classes, columns=classes),
+        neighbors=neighbors,
+        neighbors_distance=neighbors_distance,
+        neighbors_accuracy=float((y_idx[neighbors] == y_idx[:, None]).mean()) if n_neighbors > 0 else float("nan"),
+        duplicates=duplicates,
+    )
+
+    if verbose:
+        idx_lst = sorted(random.sample(range(n), k=min(k, n)))
+        sample = np.concatenate([D for _, D in iter_distance_blocks(X[idx_lst], chunk_size=chunk_size)])
+        np.fill_diagonal(sample, 0)
+        print(pd.DataFrame(sample, columns=y[idx_lst], index=y[idx_lst]), "\n")
 
-    dists = [[(e1 - e2).norm().item() for e2 in T] for e1 in T]
-    df = pd.DataFrame(dists, columns=y, index=y)
+        summary = pd.DataFrame(
+            dict(
+                n_images=class_sizes.astype(int),
+                intra_mean=np.diag(mean),
+                intra_std=np.diag(std),
+                # Mean distance to the closest other class
+                inter_mean=np.where(np.eye(len(classes), dtype=bool), np.inf, mean).min(axis=1),
+            ),
+            index=classes,
+        )
+        print(summary, "\n")
+        print(f"Nearest neighbours with the same label: {results['neighbors_accuracy']:.2%}")
+        print(f"Near-duplicate pairs (distance < {duplicate_threshold}): {len(duplicates)}")
 
-    idx_lst = random.sample(range(X.shape[0]), k=15)
-    print(df.iloc[idx_lst, idx_lst], "\n")
+    return results
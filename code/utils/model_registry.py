@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Hashable
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from utils import inference
+from utils.startup import profiler
+
+logger = logging.getLogger(__name__)
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+mtcnn_params = dict(
+    image_size=160,
+    margin=0,
+    min_face_size=30,
+    thresholds=[0.6, 0.7, 0.7],
+    factor=0.709,
+    post_process=False,
+    selection_method="probability",
+    select_largest=True,
+    keep_all=False,
+    device=device,
+)
+
+_EMBEDDING_SIZE = 512
+_WARMUP_IMAGE_SIZE = (320, 240)
+
+
+# `facenet_pytorch` and the dependencies of the face recognition model (pandas, scikit-learn) are only imported when
+# their model is first loaded, so that entry points that do not use them start faster
+def _load_resnet(pretrained: str, **cpu_inference) -> "InceptionResnetV1":
+    from facenet_pytorch import InceptionResnetV1
+
+    return inference.optimize_resnet(InceptionResnetV1(pretrained=pretrained).eval().to(device), **cpu_inference)
+
+
+def _load_mtcnn(**cpu_inference) -> "MTCNN":
+    from facenet_pytorch import MTCNN
+
+    return inference.optimize_mtcnn(MTCNN(**mtcnn_params), **cpu_inference)
+
+
+def _load_classifier(model_path: str) -> Any:
+    from utils.model import load_model
+
+    return load_model(model_path)
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of the models used for face extraction and face recognition.
+
+    Each model is deserialized once, on first use, and the same instance is then shared by every caller. This avoids
+    paying the cost of loading the weights from disk every time a face has to be recognized.
+    """
+
+    _models = dict()
+    _lock = threading.RLock()
+    _cpu_inference = dict(quantization=None, channels_last=False)
+    _calibration = None
+
+    @classmethod
+    def configure_cpu_inference(
+        cls,
+        quantization: str = None,
+        channels_last: bool = False,
+        n_threads: int = None,
+        calibration: torch.Tensor = None,
+    ):
+        """
+        Method that sets how the ResNet and the MTCNN run on CPU. They are reloaded on next use if already loaded.
+
+        Use `benchmarks/cpu_inference.py` to check the accuracy and the latency of a configuration before using it.
+
+        Parameters
+        ----------
+        quantization : str, optional
+            Either None (float32), "dynamic" (int8 linear layers) or "static" (int8 convolutions of the ResNet,
+            calibrated on `calibration`, torch >= 1.13 only). See `utils.inference`, by default None
+        channels_last : bool, optional
+            Whether to store the weights in the channels-last memory format, by default False
+        n_threads : int, optional
+            Number of intra-op threads. If None, torch's default is kept, by default None
+        calibration : torch.Tensor, optional
+            Pre-processed faces, of shape (N, 3, 160, 160), used for calibrating static quantization, by default None
+        """
+        inference.check_quantization(quantization=quantization)
+        assert (quantization is None) or (device.type == "cpu"), "Quantized models only run on CPU."
+        assert (quantization != "static") or (calibration is not None), "Static quantization requires `calibration`."
+
+        inference.set_n_threads(n_threads=n_threads)
+
+        with cls._lock:
+            cls._cpu_inference = dict(quantization=quantization, channels_last=channels_last)
+            cls._calibration = calibration
+
+            for key in [k for k in cls._models if k == "mtcnn" or (isinstance(k, tuple) and k[0] == "resnet")]:
+                del cls._models[key]
+
+    @classmethod
+    def cpu_inference(cls) -> dict:
+        """Method that returns the quantization mode and memory format set by `configure_cpu_inference`"""
+        return dict(cls._cpu_inference)
+
+    @classmethod
+    def _get_or_load(cls, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Method that returns the model registered under `key`, loading it with `loader` if it is not loaded yet
+
+        Parameters
+        ----------
+        key : Hashable
+            Key under which the model is registered
+        loader : Callable[[], Any]
+            Function returning the loaded model
+
+        Returns
+        -------
+        Any
+            The loaded model
+        """
+        with cls._lock:
+            if key not in cls._models:
+                start = time.perf_counter()
+                cls._models[key] = loader()
+                seconds = time.perf_counter() - start
+
+                logger.info(f"Loaded {key} in {seconds:.2f}s.")
+                profiler.record(name=f"load {key if isinstance(key, str) else key[0]}", seconds=seconds)
+
+            return cls._models[key]
+
+    @classmethod
+    def get_resnet(cls, pretrained: str = "vggface2") -> "InceptionResnetV1":
+        """
+        Method that returns the InceptionResnetV1 used for computing face embeddings
+
+        Parameters
+        ----------
+        pretrained : str, optional
+            Dataset on which the weights were trained. If None, the weights are randomly initialized, which is only
+            useful for benchmarking without downloading the pretrained ones, by default "vggface2"
+
+        Returns
+        -------
+        InceptionResnetV1
+            Model in evaluation mode, on `device`
+        """
+        return cls._get_or_load(
+            key=("resnet", pretrained),
+            loader=lambda: _load_resnet(pretrained=pretrained, calibration=cls._calibration, **cls._cpu_inference),
+        )
+
+    @classmethod
+    def get_mtcnn(cls) -> "MTCNN":
+        """Method that returns the MTCNN used for extracting faces, as configured by `mtcnn_params`"""
+        return cls._get_or_load(key="mtcnn", loader=lambda: _load_mtcnn(**cls._cpu_inference))
+
+    @classmethod
+    def get_face_cascade(cls, model_path: str) -> cv2.CascadeClassifier:
+        """
+        Method that returns the haar cascade used for detecting faces
+
+        Parameters
+        ----------
+        model_path : str
+            Filepath to the haar cascade `.xml`
+
+        Returns
+        -------
+        cv2.CascadeClassifier
+            Haar cascade
+        """
+        model_path = str(model_path)
+
+        return cls._get_or_load(key=("face_cascade", model_path), loader=lambda: cv2.CascadeClassifier(model_path))
+
+    @classmethod
+    def get_classifier(cls, model_path: str) -> Any:
+        """
+        Method that returns the face recognition model serialized by `utils.model.serialize_model`
+
+        Parameters
+        ----------
+        model_path : str
+            Filepath to the model to use for face recognition
+
+        Returns
+        -------
+        Any
+            Face recognition model, for example a `sklearn.pipeline.Pipeline`
+        """
+        model_path = Path(model_path).resolve()
+
+        return cls._get_or_load(
+            key=("classifier", str(model_path)), loader=lambda: _load_classifier(model_path=model_path)
+        )
+
+    @classmethod
+    def warmup(cls, model_path: str = None):
+        """
+        Method that loads every model and runs a dummy forward pass through each of them, so that the first real
+        recognition is not slowed down by lazy initialization
+
+        Parameters
+        ----------
+        model_path : str, optional
+            Filepath to the face recognition model to warm up. If None, only the MTCNN and the ResNet are warmed up, by
+            default None
+        """
+        start = time.perf_counter()
+
+        mtcnn = cls.get_mtcnn()
+        mtcnn.detect(Image.new("RGB", _WARMUP_IMAGE_SIZE))
+
+        resnet = cls.get_resnet()
+        with inference.inference_mode():
+            x = torch.zeros((1, 3, 160, 160), device=inference.model_device(resnet))
+            if cls._cpu_inference["channels_last"]:
+                x = x.contiguous(memory_format=torch.channels_last)
+
+            embeddings = resnet(x).cpu().numpy()
+
+        if model_path is not None:
+            classifier = cls.get_classifier(model_path=model_path)
+            classifier.predict(embeddings.reshape(1, _EMBEDDING_SIZE).astype(np.float32))
+
+        logger.info(f"Warmed up models in {time.perf_counter() - start:.2f}s.")
@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MotionGate:
+    def __init__(
+        self,
+        width: int = 80,
+        pixel_threshold: int = 25,
+        min_changed_fraction: float = 0.01,
+        max_interval: float = 1.0,
+        backoff: float = 1.5,
+        min_step: float = 0.05,
+    ):
+        """
+        Cheap motion detector deciding whether a frame is worth running face detection on, and how long to wait before
+        the next frame
+
+        Each frame is downscaled to `width` pixels wide, converted to grayscale and compared to the previous one. When
+        less than `min_changed_fraction` of the pixels changed by more than `pixel_threshold`, the scene is static: the
+        face detector can be skipped and the waiting time before the next frame grows by `backoff`, up to
+        `max_interval`. As soon as something moves, the waiting time drops back to 0.
+
+        While idle, the CPU time used by the process and the waiting time at each wake-up are recorded, so that the
+        trade-off between idle CPU and wake-up latency can be tuned, see `snapshot`.
+
+        Parameters
+        ----------
+        width : int, optional
+            Width, in pixels, to which frames are downscaled before being compared, by default 80
+        pixel_threshold : int, optional
+            Minimum change of the grayscale value of a pixel, out of 255, to count it as changed, by default 25
+        min_changed_fraction : float, optional
+            Minimum fraction of changed pixels for a frame to count as motion, by default 0.01
+        max_interval : float, optional
+            Maximum number of seconds to wait between two frames of a static scene, by default 1.0
+        backoff : float, optional
+            Factor by which the waiting time grows after each static frame, by default 1.5
+        min_step : float, optional
+            Waiting time, in seconds, after the first static frame, by default 0.05
+        """
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.min_step = min_step
+
+        self.interval = 0.0
+        self.n_frames = 0
+        self.n_skipped = 0
+        self.idle_since = None
+        self.idle_seconds = 0.0
+        self.idle_cpu_seconds = 0.0
+        self.wakeups_ms = deque(maxlen=100)
+
+        self._previous = None
+        self._last_check = None
+        self._lock = threading.Lock()
+
+    def _downscale(self, frame: np.array) -> np.array:
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def changed_fraction(self, frame: np.array) -> float:
+        """Method that returns the fraction of pixels that changed since the previous frame, 1.0 for the first frame"""
+        small = self._downscale(frame)
+        previous, self._previous = self._previous, small
+
+        if (previous is None) or (previous.shape != small.shape):
+            return 1.0
+
+        return float(np.count_nonzero(cv2.absdiff(small, previous) > self.pixel_threshold)) / small.size
+
+    def check(self, frame: np.array, force: bool = False) -> bool:
+        """
+        Method that returns whether `frame` should go through face detection and updates the waiting time accordingly
+
+        Parameters
+        ----------
+        frame : np.array
+            Frame read from the camera, in BGR or grayscale
+        force : bool, optional
+            Whether to treat the frame as motion regardless of its content, for example because faces are being tracked
+            and a person standing still creates no motion, by default False
+
+        Returns
+        -------
+        bool
+            Whether something moved, or `force`
+        """
+        moving = (self.changed_fraction(frame) >= self.min_changed_fraction) or force
+        now, cpu = time.perf_counter(), time.process_time()
+
+        with self._lock:
+            self.n_frames += 1
+
+            if (self.idle_since is not None) and (self._last_check is not None):
+                self.idle_seconds += now - self._last_check[0]
+                self.idle_cpu_seconds += cpu - self._last_check[1]
+
+            if moving:
+                if self.idle_since is not None:
+                    self._wake_up(now=now)
+
+                self.interval = 0.0
+            else:
+                self.n_skipped += 1
+                self.idle_since = self.idle_since or now
+                self.interval = min(self.max_interval, max(self.min_step, self.interval * self.backoff))
+
+            self._last_check = (now, cpu)
+
+        if not moving:
+            metrics.increment("frames_gated")
+
+        return moving
+
+    def _wake_up(self, now: float):
+        """Method recording the end of an idle period. The motion happened at most one waiting time ago"""
+        wakeup_ms = 1000 * (now - self._last_check[0])
+        self.wakeups_ms.append(wakeup_ms)
+        metrics.observe(name="motion_wakeup", ms=wakeup_ms)
+
+        logger.info(
+            f"Motion after {now - self.idle_since:.1f}s idle: woke up within {wakeup_ms:.0f}ms, idle CPU "
+            f"{self._idle_cpu_percent()}%."
+        )
+        self.idle_since = None
+
+    def _idle_cpu_percent(self) -> float:
+        """Method returning the CPU used by the process while the scene was static, in percent of one core"""
+        return round(100 * self.idle_cpu_seconds / self.idle_seconds, 1) if self.idle_seconds > 0 else None
+
+    def wait(self):
+        """Method that sleeps for the current waiting time"""
+        if self.interval > 0:
+            time.sleep(self.interval)
+
+    def snapshot(self) -> dict:
+        """
+        Method that returns the statistics of the gate since it was created
+
+        Returns
+        -------
+        dict
+            Number of frames checked and skipped, current waiting time, CPU used by the process while the scene was
+            static (percentage of one core) and waiting time at each wake-up, which bounds the wake-up latency
+        """
+        with self._lock:
+            wakeups_ms = list(self.wakeups_ms)
+
+            return dict(
+                n_frames=self.n_frames,
+                n_skipped=self.n_skipped,
+                skipped_fraction=round(self.n_skipped / self.n_frames, 3) if self.n_frames else None,
+                interval_s=round(self.interval, 3),
+                idle_seconds=round(self.idle_seconds, 1),
+                idle_cpu_percent=self._idle_cpu_percent(),
+                wakeup_ms=dict(
+                    median=round(float(np.median(wakeups_ms)), 1) if wakeups_ms else None,
+                    max=round(max(wakeups_ms), 1) if wakeups_ms else None,
+                ),
+            )
@@ -0,0 +1,321 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+import cv2
+import numpy as np
+from utils.motion import MotionGate
+from utils.tracker import FaceTracker
+
+logger = logging.getLogger(__name__)
+
+
+class DropOldestQueue:
+    def __init__(self, maxsize: int = 1):
+        """
+        Bounded, thread-safe queue that drops its oldest item instead of blocking when it is full
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximum number of items in the queue, by default 1
+        """
+        self._items = deque(maxlen=maxsize)
+        self._not_empty = threading.Condition()
+        self.n_dropped = 0
+
+    def __len__(self) -> int:
+        with self._not_empty:
+            return len(self._items)
+
+    def put(self, item: Any):
+        with self._not_empty:
+            if len(self._items) == self._items.maxlen:
+                self.n_dropped += 1
+
+            self._items.append(item)
+            self._not_empty.notify()
+
+    def get(self, timeout: float = None) -> Any:
+        """
+        Method that removes and returns the oldest item of the queue
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum number of seconds to wait for an item. If None, wait forever, by default None
+
+        Returns
+        -------
+        Any
+            The oldest item of the queue
+
+        Raises
+        ------
+        queue.Empty
+            If no item was available within `timeout` seconds
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: len(self._items) > 0, timeout=timeout):
+                raise queue.Empty
+
+            return self._items.popleft()
+
+    def clear(self):
+        with self._not_empty:
+            self._items.clear()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        """
+        Thread-safe throughput and latency counters of a pipeline stage
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage
+        """
+        self.name = name
+        self.n_items = 0
+        self.busy_seconds = 0.0
+
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self) -> Iterator[None]:
+        """Context manager counting one item processed by the stage and the time it took"""
+        start = time.perf_counter()
+        yield
+
+        with self._lock:
+            self.n_items += 1
+            self.busy_seconds += time.perf_counter() - start
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Method that returns the statistics of the stage since it was created
+
+        Returns
+        -------
+        Dict[str, float]
+            Number of items processed, throughput (items per second), mean latency (ms) and utilization (fraction of the
+            time spent processing items)
+        """
+        with self._lock:
+            elapsed = time.perf_counter() - self._start
+            n_items, busy_seconds = self.n_items, self.busy_seconds
+
+        return dict(
+            n_items=n_items,
+            items_per_second=round(n_items / elapsed, 2),
+            mean_latency_ms=round(1000 * busy_seconds / n_items, 2) if n_items else None,
+            utilization=round(busy_seconds / elapsed, 3),
+        )
+
+
+class RecognitionPipeline:
+    def __init__(
+        self,
+        capture_factory: Callable[[], cv2.VideoCapture],
+        detect: Callable[[np.array], Tuple[Any, np.array]],
+        recognize: Callable[[Any, Any], Any],
+        on_result: Callable[[Any], None],
+        n_consecutive_detection: int = 3,
+        stats_interval: float = 30.0,
+        tracker: FaceTracker = None,
+        max_attempts: int = 3,
+        motion_gate: MotionGate = None,
+    ):
+        """
+        Capture -> detect -> recognize pipeline, where each stage runs in its own thread
+
+        - The capture thread reads frames as fast as the camera delivers them and only keeps the latest one, so that the
+          camera buffer never goes stale.
+        - The detection thread runs the cheap face detector on the latest frame. Once faces were detected in
+          `n_consecutive_detection` consecutive frames, the frame is handed to the recognition thread.
+        - The recognition thread runs the expensive face recognition. When it returns something else than None, the
+          result is passed to `on_result` and the detection counter is reset.
+
+        With a `tracker`, faces are followed across frames instead: a face is handed to the recognition thread once it
+        was detected in `n_consecutive_detection` frames, and never again once it was identified.
+
+        Stages are connected by `DropOldestQueue` of size 1: a slow stage always works on the most recent input
+        and never slows down the stages before it.
+
+        Parameters
+        ----------
+        capture_factory : Callable[[], cv2.VideoCapture]
+            Function opening the video capture. It is called from the capture thread.
+        detect : Callable[[np.array], Tuple[Any, np.array]]
+            Function returning the preprocessed image and the coordinates of the faces detected in a frame
+        recognize : Callable[[Any, Any], Any]
+            Function recognizing the faces in a preprocessed image, given the coordinates of the detected faces, or the
+            `Track` of the faces to recognize when a `tracker` is given. Returns None when nothing was recognized.
+        on_result : Callable[[Any], None]
+            Function called, from the recognition thread, with each result of `recognize` that is not None
+        n_consecutive_detection : int, optional
+            Number of consecutive frames with faces before running the recognition, by default 3
+        stats_interval : float, optional
+            Number of seconds between two logs of the throughput of each stage, by default 30.0
+        tracker : FaceTracker, optional
+            Tracker of the detected faces. If given, `recognize` is called with the tracks still to recognize and must
+            record its outcome with `FaceTracker.record`, by default None
+        max_attempts : int, optional
+            [tracker] Number of recognitions of a face returning None before giving up on it, by default 3
+        motion_gate : MotionGate, optional
+            If given, face detection is skipped while the scene is static and no face is being followed, and frames are
+            read less often, by default None
+        """
+        self.capture_factory = capture_factory
+        self.detect = detect
+        self.recognize = recognize
+        self.on_result = on_result
+        self.n_consecutive_detection = n_consecutive_detection
+        self.stats_interval = stats_interval
+        self.tracker = tracker
+        self.max_attempts = max_attempts
+        self.motion_gate = motion_gate
+
+        self.frames = DropOldestQueue(maxsize=1)
+        self.candidates = DropOldestQueue(maxsize=1)
+        self.stats = {name: StageStats(name=name) for name in ["capture", "detect", "recognize"]}
+
+        self._reset = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _capture_loop(self):
+        cap = self.capture_factory()
+
+        try:
+            while not self._stop.is_set():
+                with self.stats["capture"].measure():
+                    ret, frame = cap.read()
+
+                if not ret:
+                    logger.warning("Could not read a frame from the video capture: stopping the pipeline.")
+                    self._stop.set()
+                    break
+
+                self.frames.put(frame)
+
+                if self.motion_gate is not None:
+                    self.motion_gate.wait()
+        finally:
+            cap.release()
+
+    def _detect_loop(self):
+        counter = 0
+
+        while not self._stop.is_set():
+            try:
+                frame = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if self._reset.is_set():
+                self._reset.clear()
+                self.candidates.clear()
+                counter = 0
+
+            if self.motion_gate is not None:
+                following = (counter > 0) or ((self.tracker is not None) and (len(self.tracker.tracks) > 0))
+                if not self.motion_gate.check(frame=frame, force=following):
+                    continue
+
+            with self.stats["detect"].measure():
+                im, faces_coordinates = self.detect(frame)
+
+            if self.tracker is not None:
+                tracks = self.tracker.update(faces_coordinates=faces_coordinates)
+                pending = self.tracker.pending(
+                    tracks=tracks, min_hits=self.n_consecutive_detection, max_attempts=self.max_attempts
+                )
+
+                if pending:
+                    self.candidates.put((im, pending))
+
+                continue
+
+            counter = counter + 1 if len(faces_coordinates) >= 1 else 0
+
+            if counter >= self.n_consecutive_detection:
+                self.candidates.put((im, faces_coordinates))
+
+    def _recognize_loop(self):
+        while not self._stop.is_set():
+            try:
+                im, faces = self.candidates.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            # Tracks may have been queued again while they were being recognized
+            if self.tracker is not None:
+                faces = [track for track in faces if track.label is None]
+                if not faces:
+                    continue
+
+            with self.stats["recognize"].measure():
+                result = self.recognize(im, faces)
+
+            if result is not None:
+                self._reset.set()
+                self.on_result(result)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Method that returns the statistics of each stage, as well as the number of items dropped between stages
+
+        Returns
+        -------
+        Dict[str, dict]
+            Statistics of each stage, by name
+        """
+        stats = {name: s.snapshot() for name, s in self.stats.items()}
+        stats["detect"]["n_dropped"] = self.frames.n_dropped
+        stats["recognize"]["n_dropped"] = self.candidates.n_dropped
+
+        if self.motion_gate is not None:
+            stats["motion"] = self.motion_gate.snapshot()
+
+        return stats
+
+    def start(self):
+        """Method that starts the threads of each stage"""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            for name, target in [
+                ("capture", self._capture_loop),
+                ("detect", self._detect_loop),
+                ("recognize", self._recognize_loop),
+            ]
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Method that stops the threads of each stage"""
+        self._stop.set()
+
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def run(self):
+        """Method that starts the pipeline and blocks, logging the statistics of each stage, until it stops"""
+        self.start()
+
+        try:
+            while not self._stop.wait(timeout=self.stats_interval):
+                logger.info(f"Pipeline stats: {self.snapshot()}")
+        except KeyboardInterrupt:
+            logger.info("Stopping the pipeline...")
+        finally:
+            self.stop()
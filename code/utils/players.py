@@ -1,16 +1,24 @@
 import logging
+import queue
 import random
+import threading
 import time
 import urllib.request
-from typing import Any, Dict, List, Union
+from collections import deque
+from typing import Any, Callable, Dict, List, Set, Union
 
 import requests
+import requests.adapters
 import spotipy
 import vlc
 from spotipy.oauth2 import SpotifyClientCredentials
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+_FADE_STEP_SECONDS = 0.05
+_HTTP_POOL_MAXSIZE = 4
+
 
 def _play_and_get_info(track: str, position: float = None) -> Dict[str, Any]:
     """Function that plays a song and return the player and metadata
@@ -48,27 +56,94 @@ def _play_and_get_info(track: str, position: float = None) -> Dict[str, Any]:
 
 
 class SpotifyPlayer:
-    @staticmethod
-    def get_credentials(secret_dict: dict, user: str) -> spotipy.client:
+    # Base URLs of the Spotify API and of its token endpoint. If None, the ones of `spotipy` are used. Set them, with
+    # `configure`, to point to a local stand-in server.
+    api_prefix = None
+    token_url = None
+
+    _session = None
+    _clients = dict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, api_prefix: str = None, token_url: str = None):
+        """
+        Method that sets the URLs of the Spotify API and drops the clients created so far
+
+        Parameters
+        ----------
+        api_prefix : str, optional
+            Base URL of the Spotify API, for example "http://127.0.0.1:8080/v1/". If None, use the one of `spotipy`, by
+            default None
+        token_url : str, optional
+            URL of the token endpoint, for example "http://127.0.0.1:8080/api/token". If None, use the one of
+            `spotipy`, by default None
+        """
+        with cls._lock:
+            cls.api_prefix = api_prefix
+            cls.token_url = token_url
+            cls._clients.clear()
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """Method that returns the HTTP session, and its pool of connections, shared by every Spotify client"""
+        with cls._lock:
+            if cls._session is None:
+                cls._session = requests.Session()
+                cls._session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=_HTTP_POOL_MAXSIZE))
+                cls._session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=_HTTP_POOL_MAXSIZE))
+
+            return cls._session
+
+    @classmethod
+    def get_credentials(cls, secret_dict: dict, user: str) -> spotipy.client:
+        """
+        Method that returns the Spotify client of `user`
+
+        Clients are created once per user and share a single HTTP session. Their access token is kept in memory and
+        only requested again when it expires.
+        """
         user_secret = secret_dict.get(user)
         client_id = user_secret.get("client_id")
         client_secret = user_secret.get("client_secret")
 
-        auth_manager = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
-        sp = spotipy.Spotify(auth_manager=auth_manager)
+        session = cls.get_session()
+
+        with cls._lock:
+            key = (user, client_id)
+
+            if key not in cls._clients:
+                auth_manager = SpotifyClientCredentials(
+                    client_id=client_id, client_secret=client_secret, requests_session=session
+                )
+                if cls.token_url is not None:
+                    auth_manager.OAUTH_TOKEN_URL = cls.token_url
+
+                sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
+                if cls.api_prefix is not None:
+                    sp.prefix = cls.api_prefix
+
+                cls._clients[key] = sp
 
-        return sp
+            return cls._clients[key]
 
     @staticmethod
-    def get_tracks(sp: spotipy.client, playlist_uri_dict: dict, user: str, n_tracks: int = 5) -> dict:
-        """Returns the information of `n_tracks` out of a particular playlist"""
-        uri = playlist_uri_dict.get(user)
-        playlist = sp.playlist(uri)
+    def get_preview_urls(sp: spotipy.client, uri: str) -> List[str]:
+        """Returns the URL of the preview of each track of a playlist. Only those fields are downloaded."""
+        playlist = sp.playlist(uri, fields="tracks.items(track(preview_url))")
 
         tracks = playlist.get("tracks").get("items")
-        tracks = [x.get("track").get("preview_url") for x in tracks]
+        tracks = [(x.get("track") or dict()).get("preview_url") for x in tracks]
         tracks = [x for x in tracks if x is not None]
 
+        return tracks
+
+    @classmethod
+    def get_tracks(cls, sp: spotipy.client, playlist_uri_dict: dict, user: str, n_tracks: int = 5) -> dict:
+        """Returns the information of `n_tracks` out of a particular playlist"""
+        uri = playlist_uri_dict.get(user)
+        tracks = cls.get_preview_urls(sp=sp, uri=uri)
+
         n_tracks = min(len(tracks), n_tracks)
         tracks = random.sample(tracks, n_tracks)
 
@@ -92,6 +167,87 @@ class SpotifyPlayer:
         cls.play(tracks=tracks)
 
 
+class PlaylistCache:
+    def __init__(self, secret_dict: dict, playlist_uri_dict: dict, ttl: float = 3600.0):
+        """
+        Cache of the preview URLs of the tracks of each user's playlist
+
+        Entries expire after `ttl` seconds. Once started, a background thread refreshes every entry before it expires,
+        so that picking the tracks of someone who was just recognized never waits for Spotify.
+
+        Parameters
+        ----------
+        secret_dict : dict
+            Spotify credentials of each user, as in the `SECRET` section of `conf/config.yml`
+        playlist_uri_dict : dict
+            Spotify playlist URI of each user, as in the `PLAYLIST` section of `conf/config.yml`
+        ttl : float, optional
+            Number of seconds after which the tracks of a playlist are fetched again, by default 3600.0
+        """
+        self.secret_dict = secret_dict or dict()
+        self.playlist_uri_dict = playlist_uri_dict or dict()
+        self.ttl = ttl
+
+        self._entries = dict()  # user -> (time of the fetch, list of preview URLs)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self, user: str) -> List[str]:
+        """Method that fetches the tracks of the playlist of `user` from Spotify and caches them"""
+        sp = SpotifyPlayer.get_credentials(secret_dict=self.secret_dict, user=user)
+        tracks = SpotifyPlayer.get_preview_urls(sp=sp, uri=self.playlist_uri_dict.get(user))
+
+        with self._lock:
+            self._entries[user] = (time.monotonic(), tracks)
+
+        logger.debug(f"Cached {len(tracks)} tracks for {user}.")
+
+        return tracks
+
+    def get(self, user: str) -> List[str]:
+        """Method that returns the tracks of the playlist of `user`, fetching them only if they expired"""
+        with self._lock:
+            fetched_at, tracks = self._entries.get(user, (None, None))
+
+        if fetched_at is None or time.monotonic() - fetched_at > self.ttl:
+            tracks = self.refresh(user=user)
+
+        return tracks
+
+    def sample(self, user: str, n_tracks: int = 5) -> List[str]:
+        """Method that returns `n_tracks` random tracks of the playlist of `user`"""
+        tracks = self.get(user=user)
+
+        return random.sample(tracks, min(len(tracks), n_tracks))
+
+    def _refresh_all(self):
+        for user in self.playlist_uri_dict:
+            try:
+                self.refresh(user=user)
+            except Exception:
+                # Keep serving the tracks fetched previously: they are better than no music at all
+                logger.exception(f"Could not refresh the playlist of {user}.")
+
+    def _run(self):
+        self._refresh_all()
+
+        while not self._stop.wait(timeout=self.ttl / 2):
+            self._refresh_all()
+
+    def start(self) -> "PlaylistCache":
+        """Method that starts fetching every playlist, then refreshing them before they expire, in the background"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="playlist-cache", daemon=True)
+            self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
 class LocalPlayer:
     @staticmethod
     def play(tracks: Union[str, List]):
@@ -122,6 +278,201 @@ class LocalPlayer:
             d.get("player").stop()
 
 
+class PlaybackService:
+    def __init__(self, volume: int = 100, fade_seconds: float = 1.0):
+        """
+        Background music player driven by a queue of commands
+
+        Commands (`enqueue`, `preempt`, `stop` and `fade`) return immediately: they are executed, in order, by a
+        dedicated thread. The next track starts when VLC reports that the current one reached its end, instead of
+        sleeping for the duration of the track.
+
+        Parameters
+        ----------
+        volume : int, optional
+            Volume at which tracks are played, between 0 and 100, by default 100
+        fade_seconds : float, optional
+            Duration of the fade out when a track is preempted or stopped, by default 1.0
+        """
+        self.volume = volume
+        self.fade_seconds = fade_seconds
+
+        self._commands = queue.Queue()
+        self._pending = deque()  # (track, owner) waiting to be played
+        self._lock = threading.Lock()
+        self._player = None
+        self._generation = 0
+        self._thread = None
+
+        self.current_owner = None
+
+    @property
+    def is_playing(self) -> bool:
+        return self.current_owner is not None
+
+    def owners(self) -> Set[str]:
+        """Method that returns the owners of the track being played and of the tracks waiting to be played"""
+        with self._lock:
+            owners = {owner for _, owner in self._pending}
+
+        if self.current_owner is not None:
+            owners.add(self.current_owner)
+
+        return owners
+
+    def start(self) -> "PlaybackService":
+        """Method that starts the thread executing the commands"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="playback", daemon=True)
+            self._thread.start()
+
+        return self
+
+    def shutdown(self, timeout: float = 5.0):
+        """Method that stops the music and the thread executing the commands"""
+        self._commands.put(("shutdown", ()))
+
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def enqueue(self, tracks: Union[List[str], Callable[[], List[str]]], owner: str = None):
+        """
+        Method that queues tracks after the ones already queued
+
+        Parameters
+        ----------
+        tracks : Union[List[str], Callable[[], List[str]]]
+            Pointers to the songs (URLs or local paths), or a function returning them. A function is called from the
+            playback thread, so that slow lookups (for example querying Spotify) do not block the caller.
+        owner : str, optional
+            Name of the person the tracks are played for, by default None
+        """
+        self._commands.put(("enqueue", (tracks, owner)))
+
+    def preempt(self, tracks: Union[List[str], Callable[[], List[str]]], owner: str = None):
+        """Method that fades out the current track, drops the queued ones and plays `tracks` instead. See `enqueue`."""
+        self._commands.put(("preempt", (tracks, owner)))
+
+    def stop(self):
+        """Method that fades out the current track and drops the queued ones"""
+        self._commands.put(("stop", ()))
+
+    def fade(self, volume: int, seconds: float):
+        """Method that gradually changes the volume of the current track to `volume` over `seconds`"""
+        self._commands.put(("fade", (volume, seconds)))
+
+    def _run(self):
+        while True:
+            command, args = self._commands.get()
+
+            if command == "shutdown":
+                self._on_stop()
+                break
+
+            try:
+                getattr(self, f"_on_{command}")(*args)
+            except Exception:
+                logger.exception(f"Playback command `{command}` failed.")
+
+    @staticmethod
+    def _resolve(tracks: Union[List[str], Callable[[], List[str]]]) -> List[str]:
+        with metrics.measure("resolve_tracks"):
+            tracks = tracks() if callable(tracks) else tracks
+
+        return [tracks] if isinstance(tracks, str) else list(tracks)
+
+    def _on_enqueue(self, tracks: Union[List[str], Callable[[], List[str]]], owner: str):
+        tracks = self._resolve(tracks)
+
+        with self._lock:
+            self._pending.extend((track, owner) for track in tracks)
+
+        if not self.is_playing:
+            self._play_next()
+
+    def _on_preempt(self, tracks: Union[List[str], Callable[[], List[str]]], owner: str):
+        tracks = self._resolve(tracks)
+
+        self._on_stop()
+
+        with self._lock:
+            self._pending.extend((track, owner) for track in tracks)
+
+        self._play_next()
+
+    def _on_stop(self):
+        with self._lock:
+            self._pending.clear()
+
+        if self._player is not None:
+            self._on_fade(volume=0, seconds=self.fade_seconds)
+            self._player.stop()
+            self._player.release()
+            self._player = None
+
+        self.current_owner = None
+
+    def _on_fade(self, volume: int, seconds: float):
+        if self._player is None:
+            return
+
+        start_volume = max(0, self._player.audio_get_volume())
+        n_steps = max(1, int(seconds / _FADE_STEP_SECONDS))
+
+        for step in range(1, n_steps + 1):
+            self._player.audio_set_volume(int(start_volume + (volume - start_volume) * step / n_steps))
+            time.sleep(_FADE_STEP_SECONDS)
+
+    def _on_end_reached(self, generation: int):
+        # Events of a track that was already stopped or preempted are ignored
+        if generation == self._generation:
+            self._play_next()
+
+    def _play_next(self):
+        if self._player is not None:
+            self._player.stop()
+            self._player.release()
+            self._player = None
+
+        with self._lock:
+            if not self._pending:
+                self.current_owner = None
+                return
+
+            track, owner = self._pending.popleft()
+
+        logger.info(f"Playing song from: {track}")
+
+        self._generation += 1
+        generation = self._generation
+
+        # VLC callbacks run in a VLC thread, which must not call VLC itself: the event is posted as a command instead
+        def _post_end_reached(event):
+            self._commands.put(("end_reached", (generation,)))
+
+        # Only the first `Playing` event measures the start latency: the next ones follow a pause
+        started = threading.Event()
+
+        def _on_playing(event):
+            if not started.is_set():
+                started.set()
+                metrics.observe(name="vlc_start", ms=(time.perf_counter() - play_start) * 1000)
+
+        self._player = vlc.MediaPlayer(track)
+        self._player.audio_set_volume(self.volume)
+
+        event_manager = self._player.event_manager()
+        event_manager.event_attach(vlc.EventType.MediaPlayerEndReached, _post_end_reached)
+        event_manager.event_attach(vlc.EventType.MediaPlayerEncounteredError, _post_end_reached)
+        if metrics.enabled:
+            event_manager.event_attach(vlc.EventType.MediaPlayerPlaying, _on_playing)
+
+        self.current_owner = owner
+        metrics.increment("tracks_played")
+        play_start = time.perf_counter()
+        self._player.play()
+
+
 if __name__ == "__main__":
     from pathlib import Path
 
@@ -0,0 +1,113 @@
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import sklearn.pipeline
+from sklearn import model_selection, svm
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import Normalizer
+
+logger = logging.getLogger(__name__)
+
+_N_LATENCY_REPEAT = 100
+
+
+def _to_str(v: Any) -> Any:
+    """Function returning `v` if it can be saved as metadata as is, its representation otherwise"""
+    return v if isinstance(v, (str, int, float, bool, type(None))) else str(v)
+
+
+def _measure_latency(model: sklearn.pipeline, X: np.array, repeat: int = _N_LATENCY_REPEAT) -> float:
+    """Function returning the median latency, in milliseconds, of `model.predict` on a single embedding"""
+    timings = []
+    for i in range(repeat):
+        x = X[i % X.shape[0]].reshape(1, -1)
+
+        start = time.perf_counter()
+        model.predict(x)
+        timings.append(time.perf_counter() - start)
+
+    return float(np.median(timings) * 1000)
+
+
+def search_hyperparameters(
+    X: np.array,
+    y: np.array,
+    param_grid: Dict[str, list],
+    base_params: dict = None,
+    n_iter: int = None,
+    cv: int = 5,
+    n_jobs: int = -1,
+    random_state: int = 0,
+) -> Tuple[sklearn.pipeline.Pipeline, List[dict]]:
+    """
+    Function that searches the hyperparameters of the `Normalizer` + `NuSVC` pipeline by cross-validation
+
+    The embeddings are computed once by the caller: only the pipeline is fitted for each configuration, in parallel.
+
+    Parameters
+    ----------
+    X : np.array
+        Face embeddings
+    y : np.array
+        Labels corresponding to X
+    param_grid : Dict[str, list]
+        Values to try for each parameter of the pipeline, for example `{"nusvc__nu": [0.1, 0.3]}`. The normalizer is
+        searched with `{"normalizer": [Normalizer(norm="l2"), "passthrough"]}`.
+    base_params : dict, optional
+        Parameters of the `NuSVC` that are not searched, by default None
+    n_iter : int, optional
+        Number of configurations sampled at random from `param_grid`. If None, every configuration is tried, by
+        default None
+    cv : int, optional
+        Number of folds of the stratified cross-validation, by default 5
+    n_jobs : int, optional
+        Number of processes, -1 for one per CPU core, by default -1
+    random_state : int, optional
+        Seed of the folds and of the random search, by default 0
+
+    Returns
+    -------
+    Tuple[sklearn.pipeline.Pipeline, List[dict]]
+        Best pipeline, refitted on all of `X`, and the results of every configuration sorted by rank: its parameters,
+        the mean and std accuracy across folds, its fit time in seconds and its predict latency in milliseconds per
+        embedding
+    """
+    pipe = make_pipeline(Normalizer(norm="l2"), svm.NuSVC(**(base_params or dict())))
+    folds = model_selection.StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+
+    # Infeasible configurations, for example a `nu` too large for the smallest class, are scored `nan`
+    kwargs = dict(cv=folds, n_jobs=n_jobs, scoring="accuracy", refit=True, error_score=np.nan)
+    if n_iter is None:
+        search = model_selection.GridSearchCV(pipe, param_grid=param_grid, **kwargs)
+    else:
+        search = model_selection.RandomizedSearchCV(
+            pipe, param_distributions=param_grid, n_iter=n_iter, random_state=random_state, **kwargs
+        )
+
+    start = time.perf_counter()
+    search.fit(X, y)
+    logger.info(f"Evaluated {len(search.cv_results_['params'])} configurations in {time.perf_counter() - start:.1f}s.")
+
+    # Each fold scores `len(X) / cv` embeddings
+    n_scored = len(X) / cv
+
+    results = pd.DataFrame(search.cv_results_)
+    results = [
+        dict(
+            params={k: _to_str(v) for k, v in row["params"].items()},
+            rank=int(row["rank_test_score"]),
+            accuracy_mean=float(format(row["mean_test_score"], ".4f")),
+            accuracy_std=float(format(row["std_test_score"], ".4f")),
+            fit_time_s=float(format(row["mean_fit_time"], ".4f")),
+            predict_latency_ms=float(format(row["mean_score_time"] / n_scored * 1000, ".4f")),
+        )
+        for _, row in results.sort_values("rank_test_score").iterrows()
+    ]
+
+    best = search.best_estimator_
+    results[0]["single_predict_latency_ms"] = float(format(_measure_latency(best, X), ".4f"))
+
+    return best, results
@@ -0,0 +1,103 @@
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+
+class StartupProfiler:
+    def __init__(self):
+        """
+        Timing breakdown of the start of an entry point: imports of third-party packages and initialization steps
+
+        The profiler is disabled until `enable` is called: until then, `measure`, `measure_imports` and `record` do
+        nothing. Use the module-level `profiler` so that every module records into the same breakdown.
+        """
+        self.enabled = False
+        self._start = time.perf_counter()
+        self._steps = []
+        self._lock = threading.Lock()
+
+    def enable(self) -> "StartupProfiler":
+        self.enabled = True
+
+        return self
+
+    def record(self, name: str, seconds: float):
+        if self.enabled:
+            with self._lock:
+                self._steps.append((name, seconds))
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        """Context manager recording the duration of its block as the step `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name=name, seconds=time.perf_counter() - start)
+
+    @contextmanager
+    def measure_imports(self) -> Iterator[None]:
+        """
+        Context manager recording the duration of the first import of each top-level package within its block
+
+        Each package is accounted for its own import time only: if `peoples_anthem` imports `torch`, importing torch is
+        one step and importing `peoples_anthem` another, excluding torch. The submodules of a package, for example
+        `torch.nn`, are accounted to the package.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        original_import = builtins.__import__
+        # Time spent importing nested packages, for each package being imported
+        nested_seconds = []
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            package = name.split(".")[0]
+            if level > 0 or package in sys.modules:
+                return original_import(name, globals, locals, fromlist, level)
+
+            nested_seconds.append(0.0)
+            start = time.perf_counter()
+            try:
+                return original_import(name, globals, locals, fromlist, level)
+            finally:
+                seconds = time.perf_counter() - start
+                own_seconds = seconds - nested_seconds.pop()
+                if nested_seconds:
+                    nested_seconds[-1] += seconds
+
+                self.record(name=f"import {package}", seconds=own_seconds)
+
+        builtins.__import__ = timed_import
+        try:
+            yield
+        finally:
+            builtins.__import__ = original_import
+
+    def steps(self) -> List[Tuple[str, float]]:
+        with self._lock:
+            return list(self._steps)
+
+    def report(self, min_seconds: float = 0.01) -> str:
+        """
+        Method that returns the breakdown of the steps, slowest first, and the time elapsed since start
+
+        Parameters
+        ----------
+        min_seconds : float, optional
+            Steps faster than `min_seconds` are left out of the breakdown, by default 0.01
+        """
+        steps = sorted([x for x in self.steps() if x[1] >= min_seconds], key=lambda x: x[1], reverse=True)
+        width = max([len(name) for name, _ in steps] + [len("total")])
+
+        lines = [f"{name:<{width}}  {seconds:8.3f}s" for name, seconds in steps]
+        lines.append(f"{'total':<{width}}  {time.perf_counter() - self._start:8.3f}s")
+
+        return "\n".join(lines)
+
+
+profiler = StartupProfiler()
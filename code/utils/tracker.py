@@ -0,0 +1,333 @@
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def iou(a: tuple, b: tuple) -> float:
+    """Function returning the intersection over union of two boxes `(x, y, w, h)`"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+
+    return inter / union if union > 0 else 0.0
+
+
+def centroid_distance(a: tuple, b: tuple) -> float:
+    """Function returning the distance between the centers of two boxes `(x, y, w, h)`, relative to the size of `a`"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+
+    distance = np.hypot((ax + aw / 2) - (bx + bw / 2), (ay + ah / 2) - (by + bh / 2))
+
+    return distance / max(aw, ah, 1)
+
+
+def match_boxes(tracks: List["Track"], boxes: np.array, max_centroid_distance: float = 0.5) -> Dict[int, int]:
+    """
+    Function greedily matching each track to the closest box, for example to find the face extracted by MTCNN that
+    corresponds to each face tracked from the haar cascade
+
+    Parameters
+    ----------
+    tracks : List[Track]
+        Tracks to match
+    boxes : np.array
+        Coordinates `(x, y, w, h)` of the boxes
+    max_centroid_distance : float, optional
+        Maximum distance between the centers of a track and a box, relative to the size of the track's box, by default
+        0.5
+
+    Returns
+    -------
+    Dict[int, int]
+        Index of the box matched to each track, by `track_id`. Tracks without a close enough box are left out
+    """
+    pairs = sorted(
+        (centroid_distance(track.box, tuple(box)), idx, track.track_id)
+        for idx, box in enumerate(boxes)
+        for track in tracks
+    )
+
+    matches = dict()
+    for distance, idx, track_id in pairs:
+        if (distance <= max_centroid_distance) and (track_id not in matches) and (idx not in matches.values()):
+            matches[track_id] = idx
+
+    return matches
+
+
+class Track:
+    def __init__(self, track_id: int, box: tuple):
+        """
+        A face followed across frames by `FaceTracker`
+
+        Parameters
+        ----------
+        track_id : int
+            Identifier of the track, unique within its tracker
+        box : tuple
+            Coordinates `(x, y, w, h)` of the face in the last frame in which it was detected
+
+        Notes
+        -----
+        `n_hits` counts the consecutive frames in which the face was detected: a frame without it resets it to 0, so
+        that a false positive flickering in and out of the haar cascade's output does not add up to `min_hits`.
+        """
+        self.track_id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.n_hits = 1
+        self.n_missed = 0
+        self.n_attempts = 0
+        self.label = None
+        self.created_at = time.time()
+
+    @property
+    def area(self) -> int:
+        return self.box[2] * self.box[3]
+
+    def __repr__(self) -> str:
+        return f"Track(track_id={self.track_id}, box={self.box}, n_hits={self.n_hits}, label={self.label})"
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold: float = 0.3, max_centroid_distance: float = 0.5, max_missed: int = 10):
+        """
+        Lightweight multi-face tracker, associating the boxes of the haar cascade from one frame to the next
+
+        Each box is matched to the track it overlaps the most (intersection over union). Boxes that overlap no track,
+        for example because the face moved quickly, are matched to the track whose center is the closest. Remaining
+        boxes start new tracks. Tracks not matched for more than `max_missed` frames are dropped: the person left. A
+        track that is not matched also loses its consecutive detections (`Track.n_hits`), while keeping its label.
+
+        Once a track is identified (see `record`), it keeps its label, so that the face recognition models run once per
+        person arrival instead of on every frame.
+
+        Parameters
+        ----------
+        iou_threshold : float, optional
+            Minimum intersection over union between a box and a track to match them, by default 0.3
+        max_centroid_distance : float, optional
+            Maximum distance between the centers of a box and a track, relative to the size of the track's box, to match
+            them when they do not overlap enough, by default 0.5
+        max_missed : int, optional
+            Number of consecutive frames without a match after which a track is dropped, by default 10
+        """
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_missed = max_missed
+
+        self.tracks: Dict[int, Track] = dict()
+
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def update(self, faces_coordinates: np.array) -> List[Track]:
+        """
+        Method that associates the faces detected in a new frame to the existing tracks
+
+        Parameters
+        ----------
+        faces_coordinates : np.array
+            Coordinates `(x, y, w, h)` of the faces detected in the frame
+
+        Returns
+        -------
+        List[Track]
+            Tracks of the faces of the frame, in the same order as `faces_coordinates`
+        """
+        boxes = [tuple(box) for box in faces_coordinates]
+
+        with self._lock:
+            tracks = list(self.tracks.values())
+            matches = self._associate(tracks=tracks, boxes=boxes)
+
+            matched = []
+            for idx, box in enumerate(boxes):
+                track = matches.get(idx)
+
+                if track is None:
+                    track = Track(track_id=next(self._ids), box=box)
+                    self.tracks[track.track_id] = track
+                else:
+                    track.box = tuple(int(v) for v in box)
+                    track.n_hits += 1
+                    track.n_missed = 0
+
+                matched.append(track)
+
+            for track in tracks:
+                if track not in matched:
+                    track.n_hits = 0
+                    track.n_missed += 1
+
+                    if track.n_missed > self.max_missed:
+                        del self.tracks[track.track_id]
+
+        return matched
+
+    def _associate(self, tracks: List[Track], boxes: List[tuple]) -> Dict[int, Track]:
+        """Method that greedily matches boxes to tracks: by intersection over union first, then by center distance"""
+        matches, used = dict(), set()
+
+        for criterion, accept in [
+            (lambda t, b: -iou(t.box, b), lambda score: -score >= self.iou_threshold),
+            (lambda t, b: centroid_distance(t.box, b), lambda score: score <= self.max_centroid_distance),
+        ]:
+            pairs = sorted(
+                (criterion(track, box), idx, track.track_id)
+                for idx, box in enumerate(boxes)
+                for track in tracks
+                if (idx not in matches) and (track.track_id not in used)
+            )
+
+            for score, idx, track_id in pairs:
+                if (idx in matches) or (track_id in used) or not accept(score):
+                    continue
+
+                matches[idx] = self.tracks[track_id]
+                used.add(track_id)
+
+        return matches
+
+    def pending(self, tracks: List[Track], min_hits: int, max_attempts: int = 3) -> List[Track]:
+        """
+        Method that returns the tracks, among `tracks`, that still need to be recognized, from the largest face
+
+        Parameters
+        ----------
+        tracks : List[Track]
+            Tracks of the current frame, as returned by `update`
+        min_hits : int
+            Number of consecutive frames in which a face must be detected before being recognized, to avoid false
+            positives
+        max_attempts : int, optional
+            Number of recognitions after which an unidentified track is given up on, by default 3
+
+        Returns
+        -------
+        List[Track]
+            Tracks to recognize. Empty if every face of the frame is already identified or not seen enough yet
+        """
+        with self._lock:
+            candidates = [
+                t for t in tracks if (t.label is None) and (t.n_hits >= min_hits) and (t.n_attempts < max_attempts)
+            ]
+
+        return sorted(candidates, key=lambda t: t.area, reverse=True)
+
+    def record(self, track: Track, label: Optional[str]):
+        """
+        Method that records the outcome of the recognition of a track
+
+        Parameters
+        ----------
+        track : Track
+            Track that was recognized
+        label : Optional[str]
+            Identity of the track. If None, nobody was recognized and the track may be retried, see `pending`
+        """
+        with self._lock:
+            track.n_attempts += 1
+
+            if label is not None:
+                track.label = label
+
+    def labels(self) -> List[str]:
+        """Method that returns the identities of the faces currently tracked"""
+        with self._lock:
+            return sorted({t.label for t in self.tracks.values() if t.label is not None})
+
+    def reset(self):
+        with self._lock:
+            self.tracks.clear()
+
+
+class IdentityCooldown:
+    def __init__(self, seconds: float, overrides: Dict[str, float] = None):
+        """
+        Thread-safe, per-identity cooldown: once triggered for someone, their anthem is not triggered again before
+        `seconds`, even if they leave and come back, or if their track is lost and found again
+
+        The cooldown only starts once the anthem actually plays: `reserve` claims an identity while its anthem is being
+        fetched, so that it is not requested twice, then either `trigger` starts its cooldown or `release` gives it up
+        if the anthem could not be played.
+
+        Parameters
+        ----------
+        seconds : float
+            Default cooldown, in seconds
+        overrides : Dict[str, float], optional
+            Cooldown of specific identities, in seconds, by default None
+        """
+        self.seconds = seconds
+        self.overrides = {k.lower(): v for k, v in (overrides or dict()).items()}
+
+        self._last_triggered = dict()
+        self._reserved = set()
+        self._lock = threading.Lock()
+
+    def last_triggered(self, identity: str) -> Optional[float]:
+        """Method that returns when `identity` was last triggered, in seconds of `time.monotonic`, or None if never"""
+        with self._lock:
+            return self._last_triggered.get(identity.lower())
+
+    def remaining(self, identity: str, now: float = None) -> float:
+        """Method that returns the number of seconds before `identity` can be triggered again"""
+        now = now if now is not None else time.monotonic()
+        last = self.last_triggered(identity=identity)
+
+        if last is None:
+            return 0.0
+
+        return max(0.0, self.overrides.get(identity.lower(), self.seconds) - (now - last))
+
+    def is_reserved(self, identity: str) -> bool:
+        """Method that returns whether the anthem of `identity` is being fetched, see `reserve`"""
+        with self._lock:
+            return identity.lower() in self._reserved
+
+    def available(self, identity: str, now: float = None) -> bool:
+        """Method that returns whether `identity` is neither cooling down nor reserved"""
+        return (not self.is_reserved(identity=identity)) and (self.remaining(identity=identity, now=now) == 0)
+
+    def reserve(self, identity: str, now: float = None) -> bool:
+        """
+        Method that reserves `identity` if it is available, until `trigger` or `release` is called
+
+        Returns
+        -------
+        bool
+            Whether `identity` was reserved. False if it is cooling down or already reserved
+        """
+        now = now if now is not None else time.monotonic()
+
+        with self._lock:
+            last = self._last_triggered.get(identity.lower())
+            if (identity.lower() in self._reserved) or (
+                (last is not None) and (now - last < self.overrides.get(identity.lower(), self.seconds))
+            ):
+                return False
+
+            self._reserved.add(identity.lower())
+
+        return True
+
+    def trigger(self, identity: str, now: float = None):
+        """Method that starts the cooldown of `identity`, whose anthem started, and releases its reservation"""
+        now = now if now is not None else time.monotonic()
+
+        with self._lock:
+            self._last_triggered[identity.lower()] = now
+            self._reserved.discard(identity.lower())
+
+    def release(self, identity: str):
+        """Method that releases the reservation of `identity` without starting its cooldown"""
+        with self._lock:
+            self._reserved.discard(identity.lower())